@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import fcntl
+import json
+import logging
+import os
+import time
+import psutil
+
+"""
+    Resources used by a job, sampled from its whole process tree while it
+    runs (see Command.run):
+        - CPU seconds (user and system) and peak memory (RSS of the tree)
+        - bytes read from and written to disk
+        - every child process (ffmpeg, demucs, etc.) as a phase, with its
+          duration, CPU seconds and peak memory
+
+    Processes that live less than the sampling interval (see
+    Command.sample_seconds) can be missed or partially counted. Every job is
+    also appended as a line to a jsonl file shared by the workers, which is
+    summarized for capacity planning (see ResourcesLog).
+"""
+
+
+class ProcessTreeSampler:
+    def __init__(self, pid):
+        self.pid = pid
+        self.start = time.time()
+        self.rss = 0
+        self.peak_rss = 0
+        self._processes = {}  # (pid, create time): stats
+
+    def _get_name(self, process):
+        cmdline = process.cmdline()
+        if not cmdline:
+            return process.name()
+
+        name = os.path.basename(cmdline[0])
+        # e.g. python -m demucs.separate
+        if name.startswith("python") and "-m" in cmdline[1:-1]:
+            name = cmdline[cmdline.index("-m") + 1]
+
+        return name
+
+    def _sample_process(self, process, now):
+        with process.oneshot():
+            key = (process.pid, process.create_time())
+            stats = self._processes.get(key)
+            if stats is None:
+                stats = {
+                    "name": self._get_name(process),
+                    "start": process.create_time(),
+                    "end": now,
+                    "cpu_seconds": 0,
+                    "peak_rss": 0,
+                    "read_bytes": 0,
+                    "write_bytes": 0,
+                }
+                self._processes[key] = stats
+
+            cpu_times = process.cpu_times()
+            rss = process.memory_info().rss
+            stats["cpu_seconds"] = cpu_times.user + cpu_times.system
+            stats["peak_rss"] = max(stats["peak_rss"], rss)
+            stats["end"] = now
+            try:
+                io_counters = process.io_counters()
+                stats["read_bytes"] = io_counters.read_bytes
+                stats["write_bytes"] = io_counters.write_bytes
+            except (psutil.AccessDenied, AttributeError):
+                pass  # Not available in all the platforms
+
+        return rss
+
+    def sample(self):
+        now = time.time()
+        try:
+            parent = psutil.Process(self.pid)
+            processes = [parent] + parent.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return
+
+        rss = 0
+        for process in processes:
+            try:
+                rss += self._sample_process(process, now)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+
+        self.rss = rss
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def get_stats(self):
+        processes = list(self._processes.values())
+        phases = []
+        for stats in processes[1:]:
+            phases.append(
+                {
+                    "name": stats["name"],
+                    "start": round(stats["start"] - self.start, 1),
+                    "seconds": round(stats["end"] - stats["start"], 1),
+                    "cpu_seconds": round(stats["cpu_seconds"], 1),
+                    "peak_rss": stats["peak_rss"],
+                }
+            )
+
+        return {
+            "seconds": round(time.time() - self.start, 1),
+            "cpu_seconds": round(sum(p["cpu_seconds"] for p in processes), 1),
+            "peak_rss": self.peak_rss,
+            "read_bytes": sum(p["read_bytes"] for p in processes),
+            "write_bytes": sum(p["write_bytes"] for p in processes),
+            "processes": len(processes),
+            "phases": phases,
+        }
+
+
+def save(filename, record):
+    with open(filename, "w") as fh:
+        json.dump(record, fh, indent=4)
+
+
+def append(filename, record):
+    """Appends the record to a jsonl file shared by the workers"""
+    with open(filename, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        fh.write(json.dumps(record) + "\n")
+
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    return values[min(int(len(values) * percentile / 100), len(values) - 1)]
+
+
+def _parse(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def read(filename, since=0):
+    """Returns the jobs appended since the given time"""
+    records = []
+    try:
+        with open(filename, "r") as fh:
+            for line in fh:
+                record = _parse(line)
+                if record is not None and record.get("time", 0) >= since:
+                    records.append(record)
+    except FileNotFoundError:
+        pass
+
+    return records
+
+
+class ResourcesLog:
+    """Keeps the jobs of the jsonl file in memory, every call only reads the
+    lines appended since the previous one. If the file is rotated or truncated
+    it is read again from the beginning"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.inode = None
+        self.offset = 0
+        self.records = []
+
+    def _read_appended(self):
+        try:
+            fh = open(self.filename, "rb")
+        except FileNotFoundError:
+            self.inode, self.offset, self.records = None, 0, []
+            return
+
+        with fh:
+            stat = os.fstat(fh.fileno())
+            if stat.st_ino != self.inode or stat.st_size < self.offset:
+                self.inode, self.offset, self.records = stat.st_ino, 0, []
+
+            fh.seek(self.offset)
+            for line in fh:
+                # Still being appended, read it next time
+                if not line.endswith(b"\n"):
+                    break
+
+                self.offset += len(line)
+                record = _parse(line)
+                if record is not None:
+                    self.records.append(record)
+
+    def read(self, since=0):
+        """Returns the jobs appended since the given time. Older jobs are
+        forgotten, since must not go back in time between calls"""
+        self._read_appended()
+        self.records = [r for r in self.records if r.get("time", 0) >= since]
+        return self.records
+
+    def log_summary(self, since=0):
+        summary = summarize_records(self.read(since))
+        if summary:
+            logging.info(f"Resources used by the jobs: {json.dumps(summary)}")
+
+
+def summarize(filename, since=0):
+    return summarize_records(read(filename, since))
+
+
+def summarize_records(records):
+    if not records:
+        return None
+    # CPU seconds for each minute of video, to size the containers
+    cpu_per_minute = [
+        r["cpu_seconds"] / (r["video_seconds"] / 60)
+        for r in records
+        if r.get("video_seconds")
+    ]
+    phases = {}
+    for record in records:
+        for phase in record["phases"]:
+            phases[phase["name"]] = phases.get(phase["name"], 0) + phase["cpu_seconds"]
+
+    summary = {
+        "jobs": len(records),
+        "cpu_seconds_p50": _percentile([r["cpu_seconds"] for r in records], 50),
+        "cpu_seconds_p95": _percentile([r["cpu_seconds"] for r in records], 95),
+        "peak_rss_p95": _percentile([r["peak_rss"] for r in records], 95),
+        "peak_rss_max": max(r["peak_rss"] for r in records),
+        "seconds_p95": _percentile([r["seconds"] for r in records], 95),
+        "read_bytes": sum(r["read_bytes"] for r in records),
+        "write_bytes": sum(r["write_bytes"] for r in records),
+        "phases_cpu_seconds": phases,
+    }
+    if cpu_per_minute:
+        summary["cpu_seconds_per_video_minute_p50"] = _percentile(cpu_per_minute, 50)
+        summary["cpu_seconds_per_video_minute_p95"] = _percentile(cpu_per_minute, 95)
+
+    return summary
@@ -20,7 +20,12 @@
 import os
 import uuid
 import fnmatch
+import json
 import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
 
 
 class BatchFile:
@@ -36,6 +41,9 @@ class BatchFile:
         revision: int,
         original_subtitles: bool,
         dubbed_subtitles: bool,
+        content_hash: str = "",
+        duration: int = 0,
+        media: dict = None,
     ):
         self.filename_dbrecord = filename_dbrecord
         self.filename = filename
@@ -47,6 +55,30 @@ class BatchFile:
         self.revision = revision
         self.original_subtitles = original_subtitles
         self.dubbed_subtitles = dubbed_subtitles
+        self.content_hash = content_hash
+        self.duration = duration  # Milliseconds, 0 if unknown
+        # Streams and codecs probed at upload, see mediaprobe.py. The workers
+        # only use the duration (above), open-dubbing decodes the video itself,
+        # it is kept in the record (also for the updates) for later uses
+        self.media = media or {}
+
+
+# The claims of a worker expire if it does not renew its lease in this time
+# (e.g. the container was killed) and other workers recover them. The service
+# uses it to count the live workers, see estimator.py
+def get_lease_seconds() -> int:
+    return int(os.environ.get("LEASE_SECONDS", 60))
+
+
+def get_full_variant(variant):
+    """Name of the variant of a BatchFile, for open-dubbing and the users"""
+    short_long_mapping = {
+        "bal": "balear",
+        "cen": "central",
+        "val": "valencia",
+        "nor": "nord",
+    }
+    return short_long_mapping.get(variant, "central")
 
 
 # This is a disk based priority queue with works as filenames
@@ -64,10 +96,15 @@ class Queue:  # works with filenames
             for basename in files:
                 if fnmatch.fnmatch(basename, pattern):
                     filename = os.path.join(root, basename)
-                    filelist.append(filename)
+                    try:
+                        mtime = os.path.getmtime(filename)
+                    except FileNotFoundError:
+                        continue  # Claimed or deleted by another process
+
+                    filelist.append((mtime, filename))
 
-        filelist.sort(key=lambda filename: os.path.getmtime(filename))
-        return filelist
+        filelist.sort()
+        return [filename for _, filename in filelist]
 
     def count(self):
         filenames = self._find(self.ENTRIES, "*.dbrecord")
@@ -86,15 +123,319 @@ class Queue:  # works with filenames
             fh.write(content)
 
     def delete(self, filename):
-        os.remove(filename)
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass  # Already moved to the processed directory
+
+
+# Index of the records in SQLite (WAL mode) to avoid scanning the entries
+# directory. The .dbrecord files are still written and are the source of
+# truth, the index can be rebuilt from them at any time.
+class SqliteIndex:
+    VERSION = 2
+    _local = threading.local()
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def _get_connection(self):
+        # One connection per thread and process (it cannot be used after a fork)
+        key = (self.filename, os.getpid())
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+
+        connection = connections.get(key)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.filename, timeout=30, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connections[key] = connection
+
+        return connection
+
+    def is_created(self):
+        connection = self._get_connection()
+        return connection.execute("PRAGMA user_version").fetchone()[0] >= self.VERSION
+
+    def rebuild(self, records, exists):
+        """records is a list of (uuid, email, enqueued, worker, line) read from
+        the files before the call, exists(uuid, worker) tells if the record file
+        is still there. The rows are merged, not replaced: the ones written
+        since the files were read are kept."""
+        connection = self._get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if not self.is_created():
+                connection.execute("DROP TABLE IF EXISTS records")
+
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS records (uuid TEXT PRIMARY KEY, "
+                "email TEXT NOT NULL, enqueued REAL NOT NULL, worker TEXT NOT NULL, "
+                "line TEXT NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS records_email ON records (email, enqueued)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS records_enqueued ON records (enqueued)"
+            )
+            # Rows of records deleted or moved while no index was kept
+            rows = connection.execute("SELECT uuid, worker FROM records").fetchall()
+            connection.executemany(
+                "DELETE FROM records WHERE uuid = ?",
+                [(_uuid,) for _uuid, worker in rows if not exists(_uuid, worker)],
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO records VALUES (?, ?, ?, ?, ?)",
+                [
+                    (_uuid, email.lower(), enqueued, worker, line)
+                    for _uuid, email, enqueued, worker, line in records
+                    if exists(_uuid, worker)
+                ],
+            )
+            connection.execute(f"PRAGMA user_version = {self.VERSION}")
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def put(self, _uuid, email, enqueued, line):
+        self._get_connection().execute(
+            "INSERT OR REPLACE INTO records VALUES (?, ?, ?, '', ?)",
+            (_uuid, email.lower(), enqueued, line),
+        )
 
+    def set_worker(self, _uuid, worker):
+        self._get_connection().execute(
+            "UPDATE records SET worker = ? WHERE uuid = ?", (worker, _uuid)
+        )
 
+    def delete(self, _uuid):
+        self._get_connection().execute("DELETE FROM records WHERE uuid = ?", (_uuid,))
+
+    def count(self):
+        cursor = self._get_connection().execute("SELECT COUNT(*) FROM records")
+        return cursor.fetchone()[0]
+
+    def count_by_email(self):
+        cursor = self._get_connection().execute(
+            "SELECT email, COUNT(*) FROM records GROUP BY email"
+        )
+        return dict(cursor.fetchall())
+
+    def select(self, email=None):
+        """Returns a list of (uuid, worker, line) in the order they were enqueued"""
+        connection = self._get_connection()
+        if email:
+            cursor = connection.execute(
+                "SELECT uuid, worker, line FROM records WHERE email = ? ORDER BY enqueued",
+                (email.lower(),),
+            )
+        else:
+            cursor = connection.execute(
+                "SELECT uuid, worker, line FROM records ORDER BY enqueued"
+            )
+
+        return cursor.fetchall()
+
+
+# Records being processed are moved to entries/processing/<worker>/. The
+# rename is atomic, so only one worker can claim each record. They are still
+# in the queue (counted and selected) until the worker deletes them.
 class BatchFilesDB(Queue):
     SEPARATOR = "\t"
+    BACKENDS = ["files", "sqlite"]
+    PROCESSING = "processing"
+
+    def __init__(self, entries="/srv/data/entries", backend=None):
+        """backend is files (scan the entries directory) or sqlite (indexed)"""
+        super().__init__(entries)
+        if backend is None:
+            backend = os.environ.get("QUEUE_BACKEND", "files")
+
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown queue backend '{backend}'")
+
+        self.backend = backend
+        self._index = None
+
+    def _get_index(self):
+        if self.backend != "sqlite":
+            return None
+
+        # Next to the entries directory, writes do not wake up its watchers
+        filename = os.path.normpath(self.ENTRIES) + ".sqlite"
+        if self._index is None or self._index.filename != filename:
+            if not os.path.exists(self.ENTRIES):
+                os.makedirs(self.ENTRIES)
+
+            index = SqliteIndex(filename)
+            if not index.is_created():
+                self._migrate(index)
+            self._index = index
+
+        return self._index
+
+    def _migrate(self, index):
+        records = []
+        for filename in super().get_all():
+            try:
+                with open(filename, "r") as fh:
+                    line = fh.readline()
+                enqueued = os.path.getmtime(filename)
+            except FileNotFoundError:
+                continue
+
+            record = self._parse_line(filename, line)
+            if record:
+                _uuid = self._get_uuid(filename)
+                worker = self._get_worker(filename)
+                records.append((_uuid, record.email, enqueued, worker, line))
+
+        index.rebuild(
+            records,
+            lambda _uuid, worker: os.path.exists(
+                self.get_record_file_from_uuid(_uuid, worker)
+            ),
+        )
+        logging.info(
+            f"BatchFilesDB. Indexed {len(records)} records in {index.filename}"
+        )
+
+    def rebuild_index(self):
+        index = self._get_index()
+        if index:
+            self._migrate(index)
+
+    def _get_uuid(self, filename_dbrecord):
+        return os.path.splitext(os.path.basename(filename_dbrecord))[0]
+
+    def _get_worker(self, filename_dbrecord):
+        directory = os.path.dirname(os.path.normpath(filename_dbrecord))
+        if os.path.dirname(directory) != self.get_processing_dir():
+            return ""
+
+        return os.path.basename(directory)
+
+    def get_processing_dir(self, worker=""):
+        return os.path.normpath(os.path.join(self.ENTRIES, self.PROCESSING, worker))
+
+    def count(self):
+        index = self._get_index()
+        if index is None:
+            return super().count()
+
+        return index.count()
+
+    def count_by_email(self):
+        """Returns {email: records}, the emails are lowercase"""
+        index = self._get_index()
+        if index is None:
+            return dict(Counter(record.email.lower() for record in self.select()))
+
+        return index.count_by_email()
+
+    def get_all(self):
+        index = self._get_index()
+        if index is None:
+            return super().get_all()
+
+        return [
+            self.get_record_file_from_uuid(_uuid, worker)
+            for _uuid, worker, _ in index.select()
+        ]
+
+    def delete(self, filename):
+        super().delete(filename)
+        index = self._get_index()
+        if index:
+            index.delete(self._get_uuid(filename))
+
+    def get_record_file_from_uuid(self, _uuid, worker=""):
+        if worker:
+            return os.path.join(self.get_processing_dir(worker), _uuid + ".dbrecord")
 
-    def get_record_file_from_uuid(self, _uuid):
         return os.path.join(self.ENTRIES, _uuid + ".dbrecord")
 
+    def is_queued(self, _uuid):
+        """True if the record is waiting or being processed by any worker"""
+        if os.path.exists(self.get_record_file_from_uuid(_uuid)):
+            return True
+
+        for worker in self.get_workers():
+            if os.path.exists(self.get_record_file_from_uuid(_uuid, worker)):
+                return True
+
+        return False
+
+    def is_claimed(self, batchfile):
+        return self._get_worker(batchfile.filename_dbrecord) != ""
+
+    def is_still_claimed(self, batchfile):
+        """True if the record is still where batchfile claimed it. Another
+        worker takes over the claims of a worker whose lease expired."""
+        return self.is_claimed(batchfile) and os.path.exists(
+            batchfile.filename_dbrecord
+        )
+
+    def claim(self, batchfile, worker):
+        """Moves the record to the processing directory of the worker. Returns
+        False if another worker claimed it first (or it was deleted)"""
+        _uuid = self._get_uuid(batchfile.filename_dbrecord)
+        target = self.get_record_file_from_uuid(_uuid, worker)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.rename(batchfile.filename_dbrecord, target)
+        except FileNotFoundError:
+            return False
+
+        index = self._get_index()
+        if index:
+            index.set_worker(_uuid, worker)
+
+        batchfile.filename_dbrecord = target
+        return True
+
+    def release(self, batchfile):
+        """Puts a claimed record back in the queue"""
+        _uuid = self._get_uuid(batchfile.filename_dbrecord)
+        target = self.get_record_file_from_uuid(_uuid)
+        try:
+            os.rename(batchfile.filename_dbrecord, target)
+        except FileNotFoundError:
+            return False
+
+        index = self._get_index()
+        if index:
+            index.set_worker(_uuid, "")
+
+        batchfile.filename_dbrecord = target
+        return True
+
+    def get_workers(self):
+        """Workers that have claimed records at some point"""
+        try:
+            names = os.listdir(self.get_processing_dir())
+        except FileNotFoundError:
+            return []
+
+        return [
+            name
+            for name in names
+            if os.path.isdir(os.path.join(self.get_processing_dir(), name))
+        ]
+
+    def get_claimed(self, worker):
+        return [
+            batchfile
+            for batchfile in self.select()
+            if self._get_worker(batchfile.filename_dbrecord) == worker
+        ]
+
     def get_new_uuid(self):
         return str(uuid.uuid4())
 
@@ -116,6 +457,9 @@ class BatchFilesDB(Queue):
         revision=1,
         original_subtitles=False,
         dubbed_subtitles=False,
+        content_hash="",
+        duration=0,
+        media=None,
     ):
         if not record_uuid:
             record_uuid = self.get_new_uuid()
@@ -124,14 +468,42 @@ class BatchFilesDB(Queue):
         line = f"v1{self.SEPARATOR}{filename}{self.SEPARATOR}{email}{self.SEPARATOR}{variant}{self.SEPARATOR}{original_filename}"
         line += f"{self.SEPARATOR}{video_lang}{self.SEPARATOR}{operation}{self.SEPARATOR}{revision}{self.SEPARATOR}"
         line += f"{self._bool_to_int(original_subtitles)}{self.SEPARATOR}{self._bool_to_int(dubbed_subtitles)}"
+        # Optional fields are appended at the end, v1 readers ignore them
+        optional = [
+            content_hash,
+            str(duration) if duration else "",
+            json.dumps(media, separators=(",", ":")) if media else "",
+        ]
+        while optional and not optional[-1]:
+            optional.pop()
+        for field in optional:
+            line += f"{self.SEPARATOR}{field}"
         self.put(filename_dbrecord, line)
+
+        index = self._get_index()
+        if index:
+            index.put(record_uuid, email, time.time(), line)
+
         return record_uuid
 
     def select(self, email=None):
+        index = self._get_index()
+        if index:
+            records = []
+            for _uuid, worker, line in index.select(email):
+                filename_dbrecord = self.get_record_file_from_uuid(_uuid, worker)
+                record = self._parse_line(filename_dbrecord, line)
+                if record:
+                    records.append(record)
+
+            return records
+
         filenames = self.get_all()
         records = []
         for filename in filenames:
             record = self._read_record(filename)
+            if not record:
+                continue
 
             if email and record.email.lower() != email.lower():
                 continue
@@ -149,22 +521,40 @@ class BatchFilesDB(Queue):
         try:
             with open(filename_dbrecord, "r") as fh:
                 line = fh.readline()
-                components = line.split(self.SEPARATOR)
-                if components[0] == "v1":
-                    return BatchFile(
-                        filename_dbrecord=filename_dbrecord,
-                        filename=components[1],
-                        email=components[2],
-                        variant=components[3],
-                        original_filename=components[4],
-                        video_lang=components[5],
-                        operation=components[6],
-                        revision=int(components[7]),
-                        original_subtitles=self._int_to_bool(components[8]),
-                        dubbed_subtitles=self._int_to_bool(components[9]),
-                    )
-                else:
-                    raise RuntimeError("dbrecord version not supported")
+        except FileNotFoundError:
+            logging.debug(f"_read_record. {filename_dbrecord} no longer exists")
+            return None
+        except Exception as exception:
+            logging.error(
+                f"_read_record. Unable to read {filename_dbrecord}. Error: {exception}"
+            )
+            return None
+
+        return self._parse_line(filename_dbrecord, line)
+
+    def _parse_line(self, filename_dbrecord, line):
+        try:
+            components = line.split(self.SEPARATOR)
+            if components[0] == "v1":
+                return BatchFile(
+                    filename_dbrecord=filename_dbrecord,
+                    filename=components[1],
+                    email=components[2],
+                    variant=components[3],
+                    original_filename=components[4],
+                    video_lang=components[5],
+                    operation=components[6],
+                    revision=int(components[7]),
+                    original_subtitles=self._int_to_bool(components[8]),
+                    dubbed_subtitles=self._int_to_bool(components[9]),
+                    content_hash=(
+                        components[10].strip() if len(components) > 10 else ""
+                    ),
+                    duration=int(components[11]) if len(components) > 11 else 0,
+                    media=json.loads(components[12]) if len(components) > 12 else {},
+                )
+            else:
+                raise RuntimeError("dbrecord version not supported")
 
         except Exception as exception:
             logging.error(
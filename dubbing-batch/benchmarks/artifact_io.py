@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Measures the bytes written when moving the artifacts of a job through its
+# lifecycle (prepare, publish and one regeneration) with plain shutil copies
+# (before) and with fastcopy (after). The dubbing itself is not run, its
+# outputs are simulated with files of similar sizes.
+#
+# Run from the dubbing-batch directory: PYTHONPATH=. python benchmarks/artifact_io.py
+
+import argparse
+import os
+import shutil
+import tempfile
+import fastcopy
+import processedfiles
+from execution import Execution
+from processedfiles import ProcessedFiles
+
+MB = 1024 * 1024
+
+# Output file and its size relative to the uploaded video
+OUTPUTS = {
+    "original_video.mp4": 0.9,
+    "original_audio.mp3": 0.1,
+    "htdemucs/original_audio/vocals.mp3": 0.1,
+    "htdemucs/original_audio/no_vocals.mp3": 0.1,
+    "dubbed_vocals.mp3": 0.1,
+    "dubbed_audio_cat.mp3": 0.1,
+    "dubbed_video_cat.mp4": 1.0,
+    "cat.srt": 0.001,
+}
+
+
+def _use_shutil():
+    fastcopy.copy_file = lambda source, target, allow_link=False: shutil.copy(
+        source, target
+    )
+    fastcopy.move_file = shutil.move
+    fastcopy.move_dir = shutil.move
+    fastcopy.copy_tree = lambda source, target, can_link=None: shutil.copytree(
+        source, target, dirs_exist_ok=True
+    )
+
+
+def _get_written_bytes():
+    with open("/proc/self/io") as f:
+        for line in f:
+            name, value = line.split(":")
+            if name == "wchar":
+                return int(value)
+
+    return 0
+
+
+def _write(filename, size):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "wb") as f:
+        f.write(os.urandom(size))
+
+
+def _simulate_dubbing(output_directory, size):
+    for name, ratio in OUTPUTS.items():
+        _write(os.path.join(output_directory, name), int(size * ratio))
+
+
+def run(size, files_dir, processed_dir):
+    _uuid = "0ea8f8f8-3f3a-4b7a-9f40-6cb2f3c9c3a1"
+    processedfiles.PROCESSED = processed_dir
+    execution = Execution(1)
+    processed = ProcessedFiles(_uuid)
+    source_file = os.path.join(files_dir, _uuid)
+    _write(source_file, size)
+
+    written = 0
+    for operation in ["dubbing", "regeneration"]:
+        start = _get_written_bytes()
+        output_directory, _ = execution.prepare_inference(source_file)
+        written += _get_written_bytes() - start
+
+        _simulate_dubbing(output_directory, size)
+
+        start = _get_written_bytes()
+        dubbed_file = os.path.join(output_directory, "dubbed_video_cat.mp4")
+        processed.move_file_bin(dubbed_file, ".dub")
+        processed.copy_file_bin(os.path.join(output_directory, "cat.srt"), ".srt")
+        processed.move_file_bin(source_file, ".mp4")
+        processed.move_output_dir(output_directory)
+
+        if operation == "dubbing":
+            # The user edits the utterances and regenerates the video
+            processed.copy_file_to(f"{_uuid}.mp4", source_file)
+            processed.copy_output_dir_to(output_directory)
+
+        written += _get_written_bytes() - start
+
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=200, help="Upload size in MB")
+    parser.add_argument(
+        "--processed", default=None, help="Processed directory (e.g. other volume)"
+    )
+    args = parser.parse_args()
+
+    size = args.size * MB
+    print(f"Bytes written for a {args.size} MB upload, dubbing and one regeneration")
+    print(f"{'mode':<10}{'written MB':>14}{'vs upload':>12}")
+    for mode in ["before", "after"]:
+        if mode == "before":
+            saved = (
+                fastcopy.copy_file,
+                fastcopy.move_file,
+                fastcopy.move_dir,
+                fastcopy.copy_tree,
+            )
+            _use_shutil()
+
+        with tempfile.TemporaryDirectory() as files_dir:
+            with tempfile.TemporaryDirectory(dir=args.processed) as processed_dir:
+                fastcopy.reset_stats()
+                written = run(size, files_dir, processed_dir)
+
+        if mode == "before":
+            (
+                fastcopy.copy_file,
+                fastcopy.move_file,
+                fastcopy.move_dir,
+                fastcopy.copy_tree,
+            ) = saved
+
+        print(f"{mode:<10}{written / MB:>14.1f}{written / size:>11.2f}x")
+
+    print(f"fastcopy: {fastcopy.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Compares answering the download requests (does the result exist, its
+# record and the file requested) checking the files as before with the
+# catalog of the published results, for requests of existing results and
+# of random uuids (as the bots do).
+#
+# Run from the dubbing-batch directory: PYTHONPATH=. python benchmarks/downloads.py
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from unittest.mock import patch
+from batchfilesdb import BatchFilesDB
+from catalog import Catalog
+from processedfiles import ProcessedFiles
+
+
+def _publish(processed, name):
+    db = BatchFilesDB(processed, backend="files")
+    db.create(name, "jmas@softcatala.org", "central", "video.mp4", record_uuid=name)
+    for extension in [".mp4", ".dub", ".srt"]:
+        with open(os.path.join(processed, f"{name}{extension}"), "w") as fh:
+            fh.write("Hello")
+
+    return [f"{name}.dbrecord", f"{name}.mp4", f"{name}.dub", f"{name}.srt"]
+
+
+def _get_file_files(processed, name):
+    exists, _ = ProcessedFiles.do_files_exists(name)
+    if not exists:
+        return False
+
+    db = BatchFilesDB(processed, backend="files")
+    record = db._read_record_from_uuid(name)
+    return record is not None and os.path.exists(os.path.join(processed, f"{name}.srt"))
+
+
+def _get_file_catalog(catalog, name):
+    published = catalog.get(name)
+    if not published or published.get_missing():
+        return False
+
+    return published.get_record() is not None and published.has(".srt")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--results", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--random", type=float, default=0.5)
+    args = parser.parse_args()
+
+    print(
+        f"{args.requests} requests to {args.results} results, {args.random:.0%} of random uuids"
+    )
+    print(f"{'method':<10}{'seconds':>12}{'found':>12}")
+    with tempfile.TemporaryDirectory() as processed:
+        with patch("processedfiles.PROCESSED", processed):
+            results = [str(uuid.uuid4()) for idx in range(args.results)]
+            names = []
+            for name in results:
+                names += _publish(processed, name)
+
+            catalog = Catalog(os.path.join(processed, "catalog.sqlite"), processed)
+            catalog.rebuild(processed, names)
+
+            random.seed(1)
+            requests = []
+            for idx in range(args.requests):
+                if random.random() < args.random:
+                    requests.append(str(uuid.uuid4()))
+                else:
+                    requests.append(random.choice(results))
+
+            for method in ["files", "catalog"]:
+                start = time.time()
+                found = 0
+                for name in requests:
+                    if method == "files":
+                        found += _get_file_files(processed, name)
+                    else:
+                        found += _get_file_catalog(catalog, name)
+
+                print(f"{method:<10}{time.time() - start:>12.3f}{found:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Time to purge the processed directory with the expiry index (it only
+# reads the entries that are due), for a directory with many results of
+# which few have expired.
+#
+# Run from the dubbing-batch directory: PYTHONPATH=. python benchmarks/purge.py
+
+import argparse
+import os
+import tempfile
+import time
+from unittest.mock import patch
+from batchfilesdb import BatchFilesDB
+from expiry import ExpiryIndex
+
+DAY = 24 * 60 * 60
+EXTENSIONS = [".dub", ".srt", ".log", ".mp4", ".resources"]
+
+
+def _publish(index, processed, name, published):
+    names = [f"{name}_output", f"{name}.dbrecord"]
+    names += [f"{name}{extension}" for extension in EXTENSIONS]
+    os.makedirs(os.path.join(processed, f"{name}_output", "htdemucs"))
+    db = BatchFilesDB(processed, backend="files")
+    db.create(name, "jmas@softcatala.org", "central", "video.mp4", record_uuid=name)
+    for filename in names[2:] + [f"{name}_output/utterance_metadata.json"]:
+        with open(os.path.join(processed, filename), "w") as fh:
+            fh.write("Hello")
+
+    # The output directory last, writing its files updates its mtime
+    for filename in names[1:] + [f"{name}_output/utterance_metadata.json", names[0]]:
+        os.utime(os.path.join(processed, filename), (published, published))
+
+    index.add(names, published)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--results", type=int, default=3000)
+    parser.add_argument("--expired", type=int, default=30)
+    args = parser.parse_args()
+
+    print(f"Purge of {args.expired} expired results out of {args.results}")
+    print(f"{'seconds':>12}{'deleted':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        processed = os.path.join(directory, "processed")
+        os.makedirs(processed)
+        with patch("processedfiles.PROCESSED", processed):
+            index = ExpiryIndex(os.path.join(processed, "expiry"))
+            # The stats of the processed directory are updated when purging
+            index.stats.rebuild(processed, [])
+            now = time.time()
+            for idx in range(args.results):
+                days = 4 if idx < args.expired else 1
+                _publish(index, processed, f"result-{idx}", now - days * DAY)
+
+            start = time.time()
+            deleted = 0
+            while index.has_due():
+                deleted += index.purge()
+
+            print(f"{time.time() - start:>12.3f}{deleted:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Several workers (processes) compete for the same queue, each one claims a
+# job, processes it (nothing) and scans the queue again. Compares the lock
+# files (check has_lock then create) with the atomic rename of the record to
+# the processing directory of the worker.
+#
+# Run from the dubbing-batch directory: PYTHONPATH=. python benchmarks/queue_claim.py
+
+import argparse
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from batchfilesdb import BatchFilesDB
+from lockfile import LockFile
+
+
+def _claim_lockfile(db, batchfile, worker):
+    if LockFile(batchfile.filename_dbrecord).has_lock():
+        return False
+
+    return LockFile(batchfile.filename_dbrecord).create()
+
+
+def _worker(mode, entries, worker, results):
+    logging.disable(logging.CRITICAL)
+    db = BatchFilesDB(entries, backend="files")
+    claimed = []
+    conflicts = 0
+    while True:
+        batchfiles = [b for b in db.select() if not db.is_claimed(b)]
+        if mode == "lockfile":
+            batchfiles = [
+                b for b in batchfiles if not LockFile(b.filename_dbrecord).has_lock()
+            ]
+
+        if not batchfiles:
+            break
+
+        for batchfile in batchfiles:
+            if mode == "lockfile":
+                success = _claim_lockfile(db, batchfile, worker)
+            else:
+                success = db.claim(batchfile, worker)
+
+            if success:
+                claimed.append(batchfile.filename)
+                break
+
+            conflicts += 1
+
+    results.put((claimed, conflicts))
+
+
+def run(mode, workers, jobs):
+    with tempfile.TemporaryDirectory() as directory:
+        entries = os.path.join(directory, "entries")
+        db = BatchFilesDB(entries, backend="files")
+        for job in range(jobs):
+            db.create(str(job), "bench@softcatala.org", "central", "video.mp4")
+
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=_worker, args=(mode, entries, f"worker{worker}", results)
+            )
+            for worker in range(workers)
+        ]
+        start = time.time()
+        for process in processes:
+            process.start()
+
+        claimed = []
+        conflicts = 0
+        for process in processes:
+            _claimed, _conflicts = results.get()
+            claimed += _claimed
+            conflicts += _conflicts
+
+        elapsed = time.time() - start
+        for process in processes:
+            process.join()
+
+        duplicated = len(claimed) - len(set(claimed))
+        return len(claimed) / elapsed, conflicts, duplicated
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"Claiming {args.jobs} jobs, one per queue scan")
+    print(
+        f"{'mode':<10}{'workers':>8}{'claims/s':>12}{'conflicts':>12}{'duplicated':>12}"
+    )
+    for mode in ["lockfile", "rename"]:
+        for workers in [1, 2, 4, 8]:
+            throughput, conflicts, duplicated = run(mode, workers, args.jobs)
+            print(
+                f"{mode:<10}{workers:>8}{throughput:>12.0f}{conflicts:>12}{duplicated:>12}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Measures the time between a record being created in the queue and the
+# batch loop noticing it (enqueue-to-start latency).
+#
+# Run from the dubbing-batch directory: PYTHONPATH=. python benchmarks/queue_latency.py
+
+import argparse
+import random
+import statistics
+import tempfile
+import threading
+import time
+from batchfilesdb import BatchFilesDB
+from queuewatcher import QueueWatcher
+
+
+class PollingWatcher(QueueWatcher):
+    def _init_inotify(self, directory):
+        raise OSError("disabled for benchmark")
+
+
+def _consumer(db, watcher, poll, created, started, expected, stop):
+    while len(started) < expected and not stop.is_set():
+        for record in db.select():
+            _uuid = record.filename
+            if _uuid not in started:
+                started[_uuid] = time.time()
+
+        watcher.wait(poll)
+
+
+def run(mode, jobs, poll, notify_port):
+    with tempfile.TemporaryDirectory() as directory:
+        db = BatchFilesDB(directory)
+        if mode == "inotify":
+            watcher = QueueWatcher(directory)
+        elif mode == "udp":
+            watcher = PollingWatcher(directory, notify_port)
+        else:
+            watcher = PollingWatcher(directory)
+
+        created = {}
+        started = {}
+        stop = threading.Event()
+        consumer = threading.Thread(
+            target=_consumer,
+            args=(db, watcher, poll, created, started, jobs, stop),
+        )
+        consumer.start()
+
+        for job in range(jobs):
+            time.sleep(random.uniform(0, 0.5))
+            _uuid = str(job)
+            created[_uuid] = time.time()
+            db.create(_uuid, "bench@softcatala.org", "cen", "video.mp4")
+            if mode == "udp":
+                QueueWatcher.notify_hosts(f"127.0.0.1:{notify_port}")
+
+        consumer.join(poll * 2 + 5)
+        stop.set()
+        watcher.notify()
+        consumer.join()
+        watcher.close()
+
+        latencies = sorted(started[_uuid] - created[_uuid] for _uuid in started)
+        return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--poll", type=float, default=2.0)
+    parser.add_argument("--port", type=int, default=8711)
+    args = parser.parse_args()
+
+    print(f"Enqueue-to-start latency for {args.jobs} jobs (polling every {args.poll}s)")
+    print(f"{'mode':<10}{'mean ms':>12}{'p95 ms':>12}{'max ms':>12}")
+    for mode in ["polling", "inotify", "udp"]:
+        latencies = run(mode, args.jobs, args.poll, args.port)
+        if len(latencies) == 0:
+            print(f"{mode:<10} no jobs detected")
+            continue
+
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(
+            f"{mode:<10}{statistics.mean(latencies) * 1000:>12.1f}"
+            f"{p95 * 1000:>12.1f}{latencies[-1] * 1000:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Compares the time of the queue queries done by an upload (count, select by
+# email and select) with the files backend (scans the entries directory) and
+# the sqlite backend (index).
+#
+# Run from the dubbing-batch directory: PYTHONPATH=. python benchmarks/queue_store.py
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from batchfilesdb import BatchFilesDB
+
+
+def _upload_queries(db, email):
+    db.count()
+    db.select(email=email)
+    db.select()
+
+
+def run(backend, entries, emails, iterations):
+    db = BatchFilesDB(entries, backend=backend)
+    if backend == "sqlite":
+        start = time.time()
+        db.rebuild_index()
+        print(f"{'':<10}migration of {db.count()} records: {time.time() - start:.2f}s")
+
+    times = []
+    for iteration in range(iterations):
+        start = time.time()
+        _upload_queries(db, f"user{iteration % emails}@softcatala.org")
+        times.append(time.time() - start)
+
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        entries = os.path.join(directory, "entries")
+        db = BatchFilesDB(entries, backend="files")
+        for idx in range(args.entries):
+            db.create(
+                f"/srv/data/files/{idx}",
+                f"user{idx % args.emails}@softcatala.org",
+                "central",
+                "video.mp4",
+            )
+
+        print(
+            f"Upload queries (count, select by email, select) with {args.entries} records"
+        )
+        print(f"{'backend':<10}{'mean ms':>12}{'max ms':>12}")
+        for backend in ["files", "sqlite"]:
+            times = run(backend, entries, args.emails, args.iterations)
+            print(
+                f"{backend:<10}{statistics.mean(times) * 1000:>12.1f}{max(times) * 1000:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Throughput of the batch worker for different splits of the CPUs between
+# jobs running at the same time (WORKERS) and threads per job (THREADS).
+# Each job is a process with THREADS threads doing CPU bound work (hashing
+# releases the GIL, like the inference libraries) and reading the thread
+# count from OMP_NUM_THREADS. The "uncontrolled" row is what happens when
+# every job uses all the CPUs of the host.
+#
+# With a single CPU all the splits take about the same time. Run it on a
+# host like the production ones before changing the default of THREADS (4)
+# to 0 (split the available CPUs).
+#
+# Run from the dubbing-batch directory: PYTHONPATH=. python benchmarks/thread_split.py
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+from execution import Command
+from resources import ResourceGovernor, THREAD_VARIABLES, get_available_cpus
+
+JOB = """
+import hashlib, os, threading
+threads = int(os.environ["OMP_NUM_THREADS"])
+data = b"x" * (1024 * 1024)
+def work(chunks):
+    for _ in range(chunks):
+        hashlib.sha256(data).digest()
+chunks = {chunks}
+workers = [threading.Thread(target=work, args=(chunks // threads,)) for _ in range(threads)]
+[w.start() for w in workers]
+[w.join() for w in workers]
+"""
+
+
+def _run_job(governor, chunks):
+    env = os.environ.copy()
+    for variable in THREAD_VARIABLES:
+        env[variable] = str(governor.threads)
+
+    cpus = governor.acquire()
+    try:
+        cmd = f"{sys.executable} -c '{JOB.format(chunks=chunks)}'"
+        return Command(cmd, env=env, cpus=cpus).run(timeout=600)
+    finally:
+        governor.release(cpus)
+
+
+def run(workers, threads, pin, jobs, chunks):
+    governor = ResourceGovernor(workers, threads, pin)
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        list(executor.map(lambda _: _run_job(governor, chunks), range(jobs)))
+
+    return jobs * 60 / (time.time() - start), governor.pin
+
+
+def _get_splits(cpus):
+    splits = []
+    workers = 1
+    while workers <= cpus:
+        splits.append((f"{workers}x{cpus // workers}", workers, cpus // workers))
+        workers *= 2
+
+    splits.append(("uncontrolled", cpus, cpus))
+    return splits
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--chunks", type=int, default=400)
+    args = parser.parse_args()
+
+    cpus = get_available_cpus()
+    print(f"{args.jobs} jobs on {cpus} CPUs, {args.chunks} MB hashed per job")
+    print(f"{'split':<14}{'pinned':>8}{'jobs/min':>12}")
+    for name, workers, threads in _get_splits(cpus):
+        for pin in [False, True]:
+            if pin and name == "uncontrolled":
+                continue
+
+            throughput, pinned = run(workers, threads, pin, args.jobs, args.chunks)
+            if pin and not pinned:
+                continue
+
+            print(f"{name:<14}{str(pinned):>8}{throughput:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
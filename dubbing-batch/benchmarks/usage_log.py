@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Measures the overhead of Usage.log per request and the latency of
+# Usage.get_stats with millions of events in the files per day. As a
+# reference, get_stats parsed every line of a single file with strptime.
+#
+# Run from the dubbing-batch directory: PYTHONPATH=. python benchmarks/usage_log.py
+
+import argparse
+import datetime
+import os
+import statistics
+import tempfile
+import time
+from usage import Usage
+
+ACTIONS = ["dubbing_file", "get_dubbed_utterance", "regenerate_video", "speak"]
+
+
+def _write_events(usage, events, days, now):
+    per_day = events // days
+    for day in range(days):
+        date = (now - datetime.timedelta(days=day)).strftime("%Y-%m-%d")
+        lines = [
+            f"{date} 12:00:00\t{ACTIONS[idx % len(ACTIONS)]}\n"
+            for idx in range(per_day)
+        ]
+        usage._append(date, "".join(lines))
+
+
+def _previous_get_stats(filename, date_requested):
+    results = {}
+    with open(filename, "r") as file_in:
+        for line in file_in:
+            date_component, action = line.strip().split("\t")
+            line_datetime = datetime.datetime.strptime(
+                date_component, "%Y-%m-%d %H:%M:%S"
+            )
+            if line_datetime.date() != date_requested.date():
+                continue
+
+            results[action] = results.get(action, 0) + 1
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=2000000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--logs", type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        usage = Usage()
+        usage._set_directory(os.path.join(directory, "usage"))
+        os.makedirs(usage.DIRECTORY)
+        now = datetime.datetime.utcnow()
+        _write_events(usage, args.events, args.days, now)
+
+        times = []
+        for idx in range(args.logs):
+            start = time.perf_counter()
+            usage.log(ACTIONS[idx % len(ACTIONS)])
+            times.append(time.perf_counter() - start)
+
+        print(f"Usage.log: mean {statistics.mean(times) * 1e6:.1f} us per request")
+
+        print(f"get_stats of {args.days} days with {args.events} events")
+        print(f"{'call':<24}{'ms':>12}")
+        first_day = now - datetime.timedelta(days=args.days - 1)
+        for call in ["first (saves counts)", "next", "next after a log"]:
+            if call == "next after a log":
+                usage.log("dubbing_file")
+
+            start = time.perf_counter()
+            usage.get_stats(first_day, now)
+            print(f"{call:<24}{(time.perf_counter() - start) * 1000:>12.1f}")
+
+        # The previous single file, for the events of a day
+        filename = os.path.join(directory, "usage.txt")
+        with open(filename, "w") as file_out:
+            for day in usage._get_days():
+                with open(usage._get_day_filename(day), "r") as file_in:
+                    file_out.write(file_in.read())
+
+        start = time.perf_counter()
+        _previous_get_stats(filename, now)
+        previous = (time.perf_counter() - start) * 1000
+        print(f"{'previous (one day)':<24}{previous:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Compares answering the requests of the editor for the audio of each
+# utterance parsing the utterances file and looking for the id on each
+# request (as before) with the cache of the parsed utterances, for a long
+# video. Also the answers of /get_utterances: serialized on each request
+# (as before), kept serialized and compressed, and when not modified (304).
+#
+# Run from the dubbing-batch directory: PYTHONPATH=. python benchmarks/utterance_lookup.py
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from utterancecache import UtteranceCache, UTTERANCES_FILE, to_json
+
+UUID = "b8d2f6a0-3c1e-4f7a-9d6b-2e5c8a1f4b3d"
+
+
+def _write(processed, utterances):
+    directory = os.path.join(processed, f"{UUID}_output")
+    os.makedirs(directory)
+    data = {
+        "utterances": [
+            {
+                "id": idx + 1,
+                "start": idx * 4.5,
+                "end": idx * 4.5 + 4,
+                "speaker_id": f"SPEAKER_0{idx % 3}",
+                "path": f"/srv/data/files/{UUID}_output/chunk_{idx}.mp3",
+                "text": "This is the text that has been said in the video " * 2,
+                "for_dubbing": True,
+                "gender": "Male",
+                "translated_text": "Aquest és el text que s'ha dit en el vídeo " * 2,
+                "assigned_voice": "ca-ES-EnricNeural",
+                "speed": 1.0,
+                "dubbed_path": f"/srv/data/files/{UUID}_output/dubbed_chunk_{idx}.mp3",
+                "hash": "a" * 64,
+            }
+            for idx in range(utterances)
+        ],
+        "PreprocessingArtifacts": {"video_file": "video.mp4"},
+        "metadata": {"source_language": "eng", "original_subtitles": False},
+    }
+    with open(os.path.join(directory, UTTERANCES_FILE), "w") as fh:
+        json.dump(data, fh, indent=4)
+
+
+def _get_parse(processed, _id):
+    filename = os.path.join(processed, f"{UUID}_output", UTTERANCES_FILE)
+    with open(filename, "r", encoding="utf-8") as fh:
+        data = json.load(fh)
+
+    for utterance in data["utterances"]:
+        if utterance["id"] == _id:
+            return utterance
+
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--utterances", type=int, default=800)
+    parser.add_argument("--requests", type=int, default=800)
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests to a video of {args.utterances} utterances")
+    print(f"{'method':<10}{'seconds':>12}{'ms/request':>12}")
+    with tempfile.TemporaryDirectory() as processed:
+        _write(processed, args.utterances)
+        random.seed(1)
+        ids = [random.randint(1, args.utterances) for idx in range(args.requests)]
+        for method in ["parse", "cache"]:
+            start = time.time()
+            for _id in ids:
+                if method == "parse":
+                    utterance = _get_parse(processed, _id)
+                else:
+                    utterance = UtteranceCache(processed).get(UUID, 1).get(_id)
+
+                assert utterance["id"] == _id
+
+            seconds = time.time() - start
+            ms = seconds * 1000 / args.requests
+            print(f"{method:<10}{seconds:>12.3f}{ms:>12.3f}")
+
+        print()
+        print(f"/get_utterances, {args.requests} requests")
+        print(f"{'method':<12}{'seconds':>10}{'bytes':>12}")
+        for method in ["serialize", "serialized", "gzip", "304"]:
+            start = time.time()
+            for idx in range(args.requests):
+                parsed = UtteranceCache(processed).get(UUID, 1)
+                if method == "serialize":
+                    body = to_json(parsed.utterances)
+                elif method == "serialized":
+                    body = parsed.get_json("utterances")
+                elif method == "gzip":
+                    body = parsed.get_compressed("utterances")
+                else:
+                    body = b"" if parsed.is_current(parsed.get_etag()) else None
+
+            print(f"{method:<12}{time.time() - start:>10.3f}{len(body):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import collections
+import json
+import logging
+import os
+import sqlite3
+import threading
+from batchfilesdb import BatchFilesDB
+from processedfiles import ProcessedFiles
+
+"""
+    Catalog of the results published in the processed directory, to answer
+    the downloads without checking the files and parsing the record on each
+    request.
+
+    For each uuid it keeps the names published (the suffixes, e.g. '.dub' or
+    '_output') and the line of its record. It is updated when the results are
+    published and purged (see expiry.py), until it has been built the files
+    are checked as before.
+
+    The lookups are cached in memory, including the uuids that do not exist
+    (bots request random ones). The cache is cleared when the catalog is
+    modified by any process, which SQLite tells with the data_version of the
+    connection without reading the database.
+"""
+
+# The files of a complete result (see ProcessedFiles.do_files_exists)
+COMPLETE = [".mp4", ".dbrecord", ".dub"]
+UUID_LENGTH = 36
+
+
+def split_name(name):
+    """Returns (uuid, suffix) of a published name or None if it is not a result"""
+    _uuid = name[:UUID_LENGTH]
+    if "/" in name or not ProcessedFiles.is_valid_uuid(_uuid):
+        return None
+
+    return _uuid, name[UUID_LENGTH:]
+
+
+class Result:
+    def __init__(self, processed, _uuid, suffixes=None, line=None):
+        """If suffixes is None it is not cataloged, the files are checked"""
+        self.processed = processed
+        self.uuid = _uuid
+        self.suffixes = suffixes
+        self.line = line
+        self._record = None
+
+    def has(self, suffix):
+        if self.suffixes is None:
+            return os.path.exists(os.path.join(self.processed, self.uuid + suffix))
+
+        return suffix in self.suffixes
+
+    def get_missing(self):
+        """Returns the first file missing of a complete result or None"""
+        for suffix in COMPLETE:
+            if not self.has(suffix):
+                return suffix
+
+        return None
+
+    def get_record(self):
+        if self._record is None:
+            db = BatchFilesDB(self.processed, backend="files")
+            filename = os.path.join(self.processed, f"{self.uuid}.dbrecord")
+            if self.suffixes is None:
+                self._record = db._read_record(filename)
+            elif self.line is not None:
+                self._record = db._parse_line(filename, self.line)
+
+        return self._record
+
+
+class Catalog:
+    VERSION = 1
+    CACHE_SIZE = 10000
+    _local = threading.local()
+
+    def __init__(self, filename=None, processed=None):
+        self.processed = processed or ProcessedFiles.get_processed_directory()
+        if filename is None:
+            # Next to the processed directory, it is not a published file
+            filename = os.path.normpath(self.processed) + ".catalog.sqlite"
+
+        self.filename = filename
+
+    def _get_state(self):
+        # One connection and cache per thread and process (a connection
+        # cannot be used after a fork)
+        key = (self.filename, os.getpid())
+        states = getattr(self._local, "states", None)
+        if states is None:
+            states = self._local.states = {}
+
+        state = states.get(key)
+        if state is None:
+            connection = sqlite3.connect(
+                self.filename, timeout=30, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            state = states[key] = {
+                "connection": connection,
+                "cache": collections.OrderedDict(),
+                "data_version": None,
+                "created": False,
+            }
+
+        return state
+
+    def _get_connection(self):
+        return self._get_state()["connection"]
+
+    def is_created(self):
+        # Once created it is only rebuilt, it is not checked again
+        state = self._get_state()
+        if not state["created"]:
+            version = state["connection"].execute("PRAGMA user_version").fetchone()[0]
+            state["created"] = version >= self.VERSION
+
+        return state["created"]
+
+    def _read(self, processed, _uuid, suffixes):
+        """Returns the row of the suffixes that exist"""
+        existing = []
+        for suffix in suffixes:
+            if os.path.exists(os.path.join(processed, _uuid + suffix)):
+                existing.append(suffix)
+
+        line = None
+        if ".dbrecord" in existing:
+            try:
+                with open(os.path.join(processed, f"{_uuid}.dbrecord"), "r") as fh:
+                    line = fh.readline()
+            except FileNotFoundError:
+                existing.remove(".dbrecord")
+
+        return existing, line
+
+    def _group(self, names):
+        uuids = {}
+        for name in names:
+            split = split_name(name)
+            if split:
+                _uuid, suffix = split
+                uuids.setdefault(_uuid, []).append(suffix)
+
+        return uuids
+
+    def _is_writable(self):
+        """The table exists, the results published are cataloged while it is built"""
+        connection = self._get_connection()
+        row = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'results'"
+        ).fetchone()
+        return row is not None
+
+    def rebuild(self, processed, names):
+        """Reads the names (relative to the processed directory) once
+
+        The table is created first, the results published while the names
+        are read are cataloged by put and merged with them"""
+        connection = self._get_connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (uuid TEXT PRIMARY KEY, "
+            "suffixes TEXT NOT NULL, line TEXT)"
+        )
+        rows = {}
+        for _uuid, suffixes in self._group(names).items():
+            existing, line = self._read(processed, _uuid, suffixes)
+            if existing:
+                rows[_uuid] = (existing, line)
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for _uuid, (existing, line) in rows.items():
+                row = connection.execute(
+                    "SELECT suffixes, line FROM results WHERE uuid = ?", (_uuid,)
+                ).fetchone()
+                if row:
+                    # Published again since it was read
+                    stored = set(json.loads(row[0]))
+                    existing = stored | set(existing)
+                    line = row[1] if ".dbrecord" in stored else line
+
+                connection.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                    (_uuid, json.dumps(sorted(existing)), line),
+                )
+            connection.execute(f"PRAGMA user_version = {self.VERSION}")
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        self._clear_cache()
+        logging.info(f"Catalog. Cataloged {len(rows)} results in {processed}")
+
+    def put(self, processed, names):
+        """Reads the names published (again), before it is built they are not cataloged"""
+        if not self._is_writable():
+            return
+
+        self._update(self._group(names), processed)
+
+    def delete(self, names):
+        if self._is_writable():
+            self._update(self._group(names), None)
+
+    def _update(self, uuids, processed):
+        """The names are read if processed is given, otherwise removed"""
+        rows = {}
+        for _uuid, suffixes in uuids.items():
+            if processed:
+                rows[_uuid] = self._read(processed, _uuid, suffixes)
+
+        connection = self._get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for _uuid, suffixes in uuids.items():
+                row = connection.execute(
+                    "SELECT suffixes, line FROM results WHERE uuid = ?", (_uuid,)
+                ).fetchone()
+                stored, line = (
+                    (set(json.loads(row[0])), row[1]) if row else (set(), None)
+                )
+                stored -= set(suffixes)
+                if _uuid in rows:
+                    existing, read = rows[_uuid]
+                    stored |= set(existing)
+                    line = read if ".dbrecord" in existing else line
+
+                if ".dbrecord" not in stored:
+                    line = None
+
+                if stored:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                        (_uuid, json.dumps(sorted(stored)), line),
+                    )
+                else:
+                    connection.execute("DELETE FROM results WHERE uuid = ?", (_uuid,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        # The data_version only changes for the other connections
+        self._clear_cache()
+
+    def _clear_cache(self):
+        self._get_state()["cache"].clear()
+
+    def _get_cache(self):
+        state = self._get_state()
+        data_version = state["connection"].execute("PRAGMA data_version").fetchone()[0]
+        if data_version != state["data_version"]:
+            state["cache"].clear()
+            state["data_version"] = data_version
+
+        return state["cache"]
+
+    def _lookup(self, _uuid):
+        try:
+            if not self.is_created():
+                return Result(self.processed, _uuid)
+
+            cache = self._get_cache()
+            if _uuid in cache:
+                cache.move_to_end(_uuid)
+                return cache[_uuid]
+
+            row = (
+                self._get_connection()
+                .execute("SELECT suffixes, line FROM results WHERE uuid = ?", (_uuid,))
+                .fetchone()
+            )
+        except sqlite3.Error as e:
+            logging.error(f"Catalog.get. Checking the files. Error: {e}")
+            return Result(self.processed, _uuid)
+
+        result = None
+        if row:
+            suffixes, line = row
+            result = Result(self.processed, _uuid, set(json.loads(suffixes)), line)
+
+        cache[_uuid] = result
+        if len(cache) > self.CACHE_SIZE:
+            cache.popitem(last=False)
+
+        return result
+
+    def get(self, _uuid):
+        """Returns the Result published with the uuid or None"""
+        result = self._lookup(_uuid)
+        if result is None or result.suffixes is not None:
+            return result
+
+        # Not cataloged yet
+        if not any(result.has(suffix) for suffix in COMPLETE + ["_output"]):
+            return None
+
+        return result
+
+    def do_files_exists(self, _uuid):
+        """Returns (exists, message) as ProcessedFiles.do_files_exists"""
+        result = self.get(_uuid)
+        missing = result.get_missing() if result else COMPLETE[0]
+        if missing:
+            return False, f"file {missing[1:]} does not exist"
+
+        return True, ""
+
+    def get_record(self, _uuid):
+        result = self.get(_uuid)
+        return result.get_record() if result else None
+
+    def has(self, _uuid, suffix):
+        result = self.get(_uuid)
+        return result is not None and result.has(suffix)
@@ -0,0 +1,165 @@
+# -*- encoding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+import hashlib
+import logging
+import os
+from batchfilesdb import BatchFilesDB
+from processedfiles import ProcessedFiles
+
+"""
+    Maps the content of an uploaded video plus the options that change the
+    result (variant, video language and subtitles) to the uuid of a result
+    already in the processed directory. Each entry is a small file named
+    after the key that contains the uuid, the entries are purged together
+    with the processed files.
+"""
+
+CHUNK_SIZE = 1024 * 1024
+# The content hash is the sha256 of the sha256 of each part of this size, so
+# the parts of a resumable upload can be hashed as they arrive, in any order
+HASH_PART_SIZE = 8 * 1024 * 1024
+
+
+def combine_hashes(digests):
+    """Returns the content hash from the hex sha256 of each part, in order"""
+    sha256 = hashlib.sha256()
+    for digest in digests:
+        sha256.update(bytes.fromhex(digest))
+
+    return sha256.hexdigest()
+
+
+def hash_stream(stream, target, on_chunk=None):
+    """Writes the stream to target and returns the hash of its content
+
+    If on_chunk returns False for a chunk it stops reading and returns None"""
+    digests = []
+    part = hashlib.sha256()
+    part_size = 0
+    with open(target, "wb") as fh:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+
+            if on_chunk and not on_chunk(chunk):
+                return None
+
+            fh.write(chunk)
+            while chunk:
+                used = min(len(chunk), HASH_PART_SIZE - part_size)
+                part.update(chunk[:used])
+                part_size += used
+                chunk = chunk[used:]
+                if part_size == HASH_PART_SIZE:
+                    digests.append(part.hexdigest())
+                    part = hashlib.sha256()
+                    part_size = 0
+
+    if part_size or not digests:
+        digests.append(part.hexdigest())
+
+    return combine_hashes(digests)
+
+
+class ContentIndex:
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.path.join(
+                ProcessedFiles.get_processed_directory(), "content"
+            )
+
+        self.directory = directory
+
+    def _get_key(
+        self, content_hash, variant, video_lang, original_subtitles, dubbed_subtitles
+    ):
+        key = f"{content_hash}\t{variant}\t{video_lang}\t{int(original_subtitles)}\t{int(dubbed_subtitles)}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _get_filename(self, batchfile):
+        key = self._get_key(
+            batchfile.content_hash,
+            batchfile.variant,
+            batchfile.video_lang,
+            batchfile.original_subtitles,
+            batchfile.dubbed_subtitles,
+        )
+        return os.path.join(self.directory, key)
+
+    def put(self, batchfile, _uuid):
+        """Returns the filename of the entry or None"""
+        if not batchfile.content_hash:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        filename = self._get_filename(batchfile)
+        with open(filename + ".tmp", "w") as fh:
+            fh.write(_uuid)
+
+        os.replace(filename + ".tmp", filename)
+        return filename
+
+    def get(self, batchfile):
+        """Returns the uuid of an equivalent result or None"""
+        if not batchfile.content_hash:
+            return None
+
+        filename = self._get_filename(batchfile)
+        try:
+            with open(filename, "r") as fh:
+                return fh.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def find_result(self, batchfile):
+        """Returns the uuid of a result that can still be served or None"""
+        _uuid = self.get(batchfile)
+        if not _uuid:
+            return None
+
+        processed_dir = ProcessedFiles.get_processed_directory()
+        db = BatchFilesDB(processed_dir, backend="files")
+        record = None
+        if os.path.exists(db.get_record_file_from_uuid(_uuid)):
+            record = db._read_record_from_uuid(_uuid)
+
+        # Results edited by the user (revision > 1) are not the same dubbing
+        valid = (
+            record is not None
+            and record.revision == 1
+            and ProcessedFiles.do_files_exists(_uuid)[0]
+            and ProcessedFiles.output_dir_exists(_uuid)
+        )
+        if not valid:
+            logging.debug(f"ContentIndex.find_result. Discarding stale entry {_uuid}")
+            self.delete(batchfile)
+            return None
+
+        return _uuid
+
+    def delete(self, batchfile):
+        try:
+            os.remove(self._get_filename(batchfile))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"ContentIndex.delete. Error: {e}")
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import datetime
+import functools
+import json
+import logging
+import multiprocessing
+import multiprocessing.forkserver
+import os
+import signal
+import sys
+from execution import Command
+from stagecache import StageCache, OpenDubbingHooks
+from incremental import IncrementalHooks
+
+"""
+    Warm dubbing engine. Instead of starting the open-dubbing command for
+    every job (which imports torch and loads Whisper, pyannote and the
+    gender classifier each time) the models are loaded once in this process.
+
+    The models are loaded in multiprocessing's fork server, a single threaded
+    process started by load(). The worker has threads (lease, pipeline
+    stages), forking it could leave locks held in the child. Each job runs
+    open-dubbing's main() in a child forked from the server, which shares the
+    already loaded models (copy on write). Running every job in its own
+    process keeps the timeout and kill semantics of Command.
+
+    With a stage cache, the preprocessing and transcription outputs are
+    looked up in the cache before running them (see stagecache.py).
+
+    Updates of edited utterances only remix the changed windows, and the
+    dubbed audio is muxed copying the video stream (see incremental.py). The
+    hooks are installed in the child of the update jobs only.
+
+    Models on a GPU cannot be shared across a fork, with DEVICE=cuda only the
+    Python modules are preloaded.
+"""
+
+
+# Settings of the engine to load in the fork server, see Engine.load
+PRELOAD_VARIABLE = "ENGINE_PRELOAD"
+_loaded = False
+
+
+def _cached(factory):
+    instances = {}
+    name = getattr(factory, "__qualname__", repr(factory))
+
+    @functools.wraps(factory)
+    def get(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        if key not in instances:
+            # open-dubbing uses other arguments than the preloaded ones, the
+            # model is loaded again in every job
+            if instances:
+                logging.warning(
+                    f"Engine. Cache miss, loading {name} with {args} {kwargs}"
+                )
+            else:
+                logging.info(f"Engine. Loading {name} with {args} {kwargs}")
+            instances[key] = factory(*args, **kwargs)
+        return instances[key]
+
+    return get
+
+
+class _CachedPipeline:
+    def __init__(self, pipeline):
+        self.from_pretrained = _cached(pipeline.from_pretrained)
+
+
+class Engine:
+    PYANNOTE_MODEL = "pyannote/speaker-diarization-3.1"
+
+    def __init__(
+        self, device="cpu", whisper_model="medium", threads=0, stage_cache=None
+    ):
+        self.device = device
+        self.whisper_model = whisper_model
+        self.threads = threads
+        self.stage_cache = stage_cache
+        self.loaded = False
+        self._context = multiprocessing.get_context("forkserver")
+
+    def _get_settings(self):
+        settings = {
+            "device": self.device,
+            "whisper_model": self.whisper_model,
+            "threads": self.threads,
+        }
+        if self.stage_cache:
+            settings["stage_cache"] = [
+                self.stage_cache.directory,
+                self.stage_cache.max_size,
+            ]
+
+        return settings
+
+    @staticmethod
+    def from_settings(settings):
+        stage_cache = settings.pop("stage_cache", None)
+        if stage_cache:
+            settings["stage_cache"] = StageCache(*stage_cache)
+
+        return Engine(**settings)
+
+    def load(self):
+        """Starts the fork server, which loads the models"""
+        start_time = datetime.datetime.now()
+        os.environ[PRELOAD_VARIABLE] = json.dumps(self._get_settings())
+        try:
+            # The worker's main module is imported once, not in every job
+            self._context.set_forkserver_preload(["__main__", "engine"])
+            multiprocessing.forkserver.ensure_running()
+        finally:
+            del os.environ[PRELOAD_VARIABLE]
+
+        process = self._context.Process(target=_exit_loaded)
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError("The models cannot be loaded in the fork server")
+
+        self.loaded = True
+        logging.info(
+            f"Engine.load. Models loaded in {datetime.datetime.now() - start_time}"
+        )
+
+    def _load_models(self):
+        # Runs in the fork server
+        import open_dubbing.main  # noqa: F401, imports torch, transformers, etc
+        from open_dubbing import dubbing, speech_to_text
+        from open_dubbing import speech_to_text_faster_whisper
+
+        whisper = speech_to_text_faster_whisper
+        whisper.WhisperModel = _cached(whisper.WhisperModel)
+        dubbing.Pipeline = _CachedPipeline(dubbing.Pipeline)
+        speech_to_text.VoiceGenderClassifier = _cached(
+            speech_to_text.VoiceGenderClassifier
+        )
+
+        if self.stage_cache:
+            hooks = OpenDubbingHooks(
+                self.stage_cache, self.whisper_model, self.PYANNOTE_MODEL
+            )
+            hooks.install()
+
+        if self.device == "cpu":
+            # Same arguments that open-dubbing uses, otherwise the cache misses
+            whisper.WhisperModel(
+                model_size_or_path=self.whisper_model,
+                device=self.device,
+                cpu_threads=self.threads,
+                compute_type="int8",
+            )
+            speech_to_text.VoiceGenderClassifier(self.device)
+
+        # Pyannote always runs on CPU (see --device_pyannote)
+        dubbing.Pipeline.from_pretrained(self.PYANNOTE_MODEL, use_auth_token="NONE")
+
+    def _main(self):
+        from open_dubbing.main import main
+
+        main()
+
+    def _set_threads(self, cpus):
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+
+        # torch was imported by load(), it does not read the environment again
+        torch = sys.modules.get("torch")
+        threads = int(os.environ.get("OMP_NUM_THREADS", 0))
+        if torch and threads:
+            torch.set_num_threads(threads)
+
+    def _redirect_output(self, log_filename):
+        fd = os.open(log_filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        for stream in [sys.stdout, sys.stderr]:
+            stream.flush()
+            os.dup2(fd, stream.fileno())
+
+        os.close(fd)
+
+    def _run_job(self, args, cwd, env, cpus=None, log_filename=None):
+        # Runs in the child forked from the fork server
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        os.chdir(cwd)
+        if env:
+            os.environ.update(env)
+
+        if log_filename:
+            self._redirect_output(log_filename)
+
+        self._set_threads(cpus)
+        # Only in the process of the job, other jobs keep open-dubbing's mux
+        if "--update" in args:
+            IncrementalHooks().install()
+
+        sys.argv = ["open-dubbing"] + args
+        self._main()
+
+    def start(self, args, cwd, env=None, cpus=None, log_filename=None):
+        process = self._context.Process(
+            target=self._run_job,
+            args=(args, cwd, env, cpus, log_filename),
+            daemon=False,
+        )
+        process.start()
+        return process
+
+    def get_command(self, args, env=None, cwd=None, memory_limit=0, **kwargs):
+        """kwargs are cpus, log_filename, progress and sample_seconds (see Command)"""
+        return EngineCommand(
+            self, args, env=env, cwd=cwd, memory_limit=memory_limit, **kwargs
+        )
+
+
+class EngineCommand(Command):
+    def __init__(self, engine, args, env=None, cwd=None, memory_limit=0, **kwargs):
+        super().__init__(
+            " ".join(args), env=env, cwd=cwd, memory_limit=memory_limit, **kwargs
+        )
+        self.engine = engine
+        self.args = args
+
+    def _start(self):
+        self.process = self.engine.start(
+            self.args, self.cwd, self.env, self.cpus, self.log_filename
+        )
+
+    def _wait(self, timeout):
+        self.process.join(timeout)
+        return self.process.exitcode is not None
+
+    def _get_returncode(self):
+        exitcode = self.process.exitcode
+        # Killed by a signal, report it like the shell does
+        if exitcode < 0:
+            return 128 - exitcode
+
+        return exitcode
+
+    def _kill(self):
+        self._kill_child_processes(self.process.pid)
+        self.process.terminate()
+        self.process.join(self.POLL_SECONDS)
+
+
+def _exit_loaded():
+    # Runs in a child of the fork server, reports if the models were loaded
+    sys.exit(0 if _loaded else 1)
+
+
+def _preload():
+    """Loads the models when the fork server imports this module"""
+    global _loaded
+
+    settings = os.environ.pop(PRELOAD_VARIABLE, None)
+    if not settings:
+        return
+
+    try:
+        Engine.from_settings(json.loads(settings))._load_models()
+        _loaded = True
+    except Exception as e:
+        logging.error(f"Engine._preload. Error: {e}")
+
+
+_preload()
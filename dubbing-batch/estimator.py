@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import datetime
+import fcntl
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from batchfilesdb import get_lease_seconds
+from progress import get_progress_filename, read_progress
+from scheduler import Scheduler
+
+"""
+    Estimates when the queued jobs will start and finish.
+
+    The processing time of a job is learned from the finished jobs as a
+    linear function of the duration of the video, for each operation,
+    language and variant. Only the sums needed by the least squares fit are
+    stored (a small json file shared by the workers and dubbing-service), so
+    estimating is cheap. While there are few samples for a combination, the
+    estimate is blended with the one of the more general level (operation
+    only, then a fixed prior).
+
+    The queue is then simulated: the running jobs finish after their
+    remaining time, and the waiting ones are taken in the order of the
+    scheduler (configured as in the workers) by the first worker that
+    becomes free.
+"""
+
+# Seconds to process a video of x seconds before learning anything
+PRIOR = {"create": (120, 1.5), "update": (60, 0.2)}
+# Samples needed to trust a level as much as its parent
+BLEND_SAMPLES = 5
+# The simulation of the queue is reused by the answers in this time, every
+# status request would select the whole queue and read the progress files
+CACHE_SECONDS = 10
+
+
+def get_model_filename():
+    return os.path.join(os.environ.get("LOGDIR", ""), "durations.json")
+
+
+class DurationModel:
+    def __init__(self, filename=None):
+        self.filename = filename or get_model_filename()
+        self._stats = None
+
+    def _get_keys(self, operation, video_lang, variant):
+        """From the most general to the most specific"""
+        return [operation, f"{operation}|{video_lang}|{variant}"]
+
+    def _load(self):
+        if self._stats is None:
+            try:
+                with open(self.filename, "r") as fh:
+                    self._stats = json.load(fh)
+            except (FileNotFoundError, ValueError):
+                self._stats = {}
+
+        return self._stats
+
+    def is_empty(self):
+        return len(self._load()) == 0
+
+    def _add(self, stats, key, x, y):
+        n, sx, sy, sxx, sxy = stats.get(key, [0, 0, 0, 0, 0])
+        stats[key] = [n + 1, sx + x, sy + y, sxx + x * x, sxy + x * y]
+
+    def add(self, samples):
+        """samples is a list of (operation, video_lang, variant, video_seconds, seconds)"""
+        with open(self.filename, "a+") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            fh.seek(0)
+            try:
+                stats = json.load(fh)
+            except ValueError:
+                stats = {}
+
+            for operation, video_lang, variant, video_seconds, seconds in samples:
+                for key in self._get_keys(operation, video_lang, variant):
+                    self._add(stats, key, video_seconds, seconds)
+
+            fh.seek(0)
+            fh.truncate()
+            json.dump(stats, fh)
+
+        self._stats = stats
+
+    def _fit(self, key):
+        """Returns (samples, intercept, slope) of the key"""
+        n, sx, sy, sxx, sxy = self._load().get(key, [0, 0, 0, 0, 0])
+        if n == 0:
+            return 0, 0, 0
+
+        denominator = n * sxx - sx * sx
+        if n < 2 or denominator <= 0 or sx == 0:
+            # Not enough different durations for a line, time per second
+            return n, 0, sy / sx if sx else 0
+
+        slope = (n * sxy - sx * sy) / denominator
+        intercept = (sy - slope * sx) / n
+        if slope < 0 or intercept < 0:
+            return n, 0, sy / sx
+
+        return n, intercept, slope
+
+    def estimate(self, operation, video_lang, variant, video_seconds):
+        intercept, slope = PRIOR.get(operation, PRIOR["create"])
+        estimate = intercept + slope * video_seconds
+        for key in self._get_keys(operation, video_lang, variant):
+            n, intercept, slope = self._fit(key)
+            if n == 0:
+                break
+
+            fitted = intercept + slope * video_seconds
+            estimate = (n * fitted + BLEND_SAMPLES * estimate) / (n + BLEND_SAMPLES)
+
+        return estimate
+
+    def estimate_batchfile(self, batchfile):
+        if batchfile.duration:
+            video_seconds = batchfile.duration / 1000
+        else:
+            video_seconds = Scheduler.DEFAULT_DURATION
+
+        return self.estimate(
+            batchfile.operation, batchfile.video_lang, batchfile.variant, video_seconds
+        )
+
+
+def get_active_workers(db, lease_seconds=None):
+    """Workers with a live lease (see process-batch), BATCH_WORKERS overrides it"""
+    if lease_seconds is None:
+        lease_seconds = get_lease_seconds()
+
+    workers = int(os.environ.get("BATCH_WORKERS", 0))
+    if workers:
+        return workers
+
+    now = time.time()
+    for worker in db.get_workers():
+        try:
+            lease = os.path.getmtime(db.get_processing_dir(worker) + ".lock")
+        except FileNotFoundError:
+            continue
+
+        if now - lease < lease_seconds:
+            workers += 1
+
+    return max(workers, 1)
+
+
+def _get_remaining(model, batchfile, now):
+    estimate = model.estimate_batchfile(batchfile)
+    output_directory = f"{batchfile.filename}_output"
+    progress = read_progress(get_progress_filename(output_directory))
+    if progress:
+        estimate -= now - progress["started"]
+
+    # Taking longer than expected, it should finish soon
+    return max(estimate, 60)
+
+
+def estimate_queue(db, model, workers, scheduler, now=None):
+    """Returns {uuid: (start, completion)} as timestamps for the jobs in the queue"""
+    if now is None:
+        now = time.time()
+
+    free = []
+    waiting = []
+    estimates = {}
+    for batchfile in db.select():
+        if not db.is_claimed(batchfile):
+            waiting.append(batchfile)
+            continue
+
+        end = now + _get_remaining(model, batchfile, now)
+        estimates[os.path.basename(batchfile.filename)] = (now, end)
+        free.append(end)
+
+    # Idle workers are free now
+    free += [now] * (workers - len(free))
+    heapq.heapify(free)
+    for batchfile in scheduler.order(waiting, now):
+        start = heapq.heappop(free)
+        end = start + model.estimate_batchfile(batchfile)
+        estimates[os.path.basename(batchfile.filename)] = (start, end)
+        heapq.heappush(free, end)
+
+    return estimates
+
+
+_cache_lock = threading.Lock()
+_cache = {}  # (entries, model filename): (time, estimates)
+
+
+def _get_estimates(db, model, _uuid):
+    """Simulates the queue again if the cached one is old or does not have the
+    uuid (e.g. it has just been queued)"""
+    key = (os.path.normpath(db.ENTRIES), model.filename)
+    now = time.time()
+    with _cache_lock:
+        cached = _cache.get(key)
+
+    if cached and now - cached[0] < CACHE_SECONDS and _uuid in cached[1]:
+        return cached[1]
+
+    workers = get_active_workers(db)
+    estimates = estimate_queue(db, model, workers, Scheduler.from_environment(), now)
+    with _cache_lock:
+        _cache[key] = (now, estimates)
+
+    return estimates
+
+
+def get_estimate(db, _uuid, model=None):
+    """Returns the estimated start and completion of the uuid to add to an answer"""
+    try:
+        model = model or DurationModel()
+        estimates = _get_estimates(db, model, _uuid)
+    except Exception as e:
+        logging.error(f"estimator.get_estimate. Error: {e}")
+        return {}
+
+    if _uuid not in estimates:
+        return {}
+
+    start, end = estimates[_uuid]
+    return {
+        "estimated_start": _format_time(start),
+        "estimated_completion": _format_time(end),
+    }
+
+
+def _format_time(timestamp):
+    _datetime = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    return _datetime.replace(microsecond=0).isoformat()
@@ -22,10 +22,21 @@ import datetime
 import logging
 import os
 import subprocess
-import threading
 import signal
 import psutil
-import shutil
+import shlex
+import sys
+import fastcopy
+import time
+from resources import THREAD_VARIABLES
+from batchfilesdb import get_full_variant
+from accounting import ProcessTreeSampler
+from progress import LOG_FILE, ProgressTracker, get_progress_filename
+
+# Runs open-dubbing with the hooks of the updates, see incremental.py
+INCREMENTAL_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "incremental.py"
+)
 
 OUTPUT_DIR = "output"
 
@@ -33,10 +44,32 @@ OUTPUT_DIR = "output"
 class Command(object):
     TIMEOUT_ERROR = -1
     NO_ERROR = 0
+    MEMORY_ERROR = -2
+    POLL_SECONDS = 5
+    SAMPLE_SECONDS = 1
 
-    def __init__(self, cmd):
+    def __init__(
+        self,
+        cmd,
+        env=None,
+        cwd=None,
+        memory_limit=0,
+        cpus=None,
+        log_filename=None,
+        progress=None,
+        sample_seconds=SAMPLE_SECONDS,
+    ):
         self.cmd = cmd
+        self.env = env
+        self.cwd = cwd
+        self.memory_limit = memory_limit  # bytes, 0 means no limit
+        self.cpus = cpus  # cores to pin the process to, None means all
+        self.log_filename = log_filename  # stdout and stderr, None inherits them
+        self.progress = progress  # updated while it runs, see progress.py
+        # Resources and memory limit checks, short processes can be missed
+        self.sample_seconds = sample_seconds
         self.process = None
+        self.resources = None  # See accounting.py, after run
 
     # Make sure that you kill also the process started in the Shell
     def _kill_child_processes(self, parent_pid, sig=signal.SIGTERM):
@@ -50,52 +83,116 @@ class Command(object):
         for process in children:
             process.send_signal(sig)
 
-    def run(self, timeout):
-        def target():
-            self.process = subprocess.Popen(self.cmd, shell=True)
-            self.process.communicate()
+    def _is_over_memory_limit(self, sampler):
+        if not self.memory_limit:
+            return False
 
-        thread = threading.Thread(target=target)
-        thread.start()
+        used = sampler.rss
+        if used <= self.memory_limit:
+            return False
 
-        thread.join(timeout)
-        if thread.is_alive():
-            self._kill_child_processes(self.process.pid)
-            return self.TIMEOUT_ERROR
+        logging.error(
+            f"Command.run. Process {self.process.pid} uses {used} bytes, limit is {self.memory_limit}"
+        )
+        return True
 
-        return self.process.returncode
+    def _get_args(self):
+        if not self.cpus:
+            return self.cmd
 
-    def run_log(self, timeout):
-        def target():
-            #            self.process = subprocess.Popen(self.cmd, shell=True)
+        # taskset pins the shell before it runs the command (its children
+        # inherit it). preexec_fn is not safe in a process with threads.
+        cpus = ",".join(str(cpu) for cpu in sorted(self.cpus))
+        return ["taskset", "-c", cpus, "/bin/sh", "-c", self.cmd]
+
+    def _start(self):
+        log = open(self.log_filename, "ab") if self.log_filename else None
+        try:
             self.process = subprocess.Popen(
-                self.cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                self._get_args(),
+                shell=not self.cpus,
+                env=self.env,
+                cwd=self.cwd,
+                stdout=log,
+                stderr=subprocess.STDOUT if log else None,
             )
+        finally:
+            if log:
+                log.close()
+
+    # Returns True when the process has finished
+    def _wait(self, timeout):
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            pass
+
+        return self.process.returncode is not None
 
-        thread = threading.Thread(target=target)
-        thread.start()
+    def _get_returncode(self):
+        return self.process.returncode
 
-        thread.join(timeout)
-        if thread.is_alive():
-            self._kill_child_processes(self.process.pid)
-            return self.TIMEOUT_ERROR
+    def _kill(self):
+        self._kill_child_processes(self.process.pid)
 
-        stdout, stderr = self.process.communicate()
+    def run(self, timeout):
+        self._start()
+        sampler = ProcessTreeSampler(self.process.pid)
+        try:
+            return self._run(timeout, sampler)
+        finally:
+            self.resources = sampler.get_stats()
 
-        # Print the output and error (if any)
-        logging.info("Output:")
-        logging.info(stdout.decode())  # Decode byte string to normal string
+    def _run(self, timeout, sampler):
+        start = time.time()
+        while True:
+            sampler.sample()
+            if self.progress:
+                self.progress.update()
 
-        if stderr:
-            logging.error("Error:")
-            logging.error(stderr.decode())
+            elapsed = time.time() - start
+            if elapsed >= timeout:
+                self._kill()
+                return self.TIMEOUT_ERROR
 
-        return self.process.returncode
+            if self._wait(min(self.sample_seconds, timeout - elapsed)):
+                if self.progress:
+                    self.progress.update()
+                break
+
+            if self._is_over_memory_limit(sampler):
+                self._kill()
+                return self.MEMORY_ERROR
+
+        return self._get_returncode()
 
 
 class Execution(object):
-    def __init__(self, threads):
-        self.threads = threads
+    APERTIUM_SERVER = "http://dubbing-translator-proxy:8700/"
+    TTS_URL = "http://matcha-service:8100/"
+    WHISPER_MODEL = "medium"
+
+    def __init__(
+        self,
+        threads,
+        memory_limit=0,
+        engine=None,
+        governor=None,
+        sample_seconds=Command.SAMPLE_SECONDS,
+    ):
+        self.threads = int(threads)
+        self.memory_limit = memory_limit
+        self.engine = engine
+        self.governor = governor
+        self.sample_seconds = sample_seconds
+
+    def _get_environment(self):
+        env = os.environ.copy()
+        threads = str(self.threads)
+        for variable in THREAD_VARIABLES:
+            env[variable] = threads
+
+        return env
 
     def _ffmpeg_errors(self, ffmpeg_errfile):
         return_code = Command.NO_ERROR
@@ -128,75 +225,176 @@ class Execution(object):
         return extension
 
     def get_full_variant(self, variant):
-        short_long_mapping = {
-            "bal": "balear",
-            "cen": "central",
-            "val": "valencia",
-            "nor": "nord",
-        }
-        return short_long_mapping.get(variant, "central")
+        return get_full_variant(variant)
 
-    def run_inference(
+    def _get_program(self, update_operation):
+        """The updates run open-dubbing with the incremental hooks installed"""
+        if update_operation:
+            return [sys.executable, INCREMENTAL_SCRIPT]
+
+        return ["open-dubbing"]
+
+    def _get_open_dubbing_args(
         self,
-        filename: str,  # e.g. fa05aee-79b9-4d0e-8683-e11b85dfe1a2
-        timeout: int,
-        variant: str,
-        video_lang: str,
-        operation: str,
-        original_subtitles: bool,
-        dubbed_subtitles: bool,
+        input_file,
+        output_directory,
+        full_variant,
+        source_language,
+        update_operation,
+        original_subtitles,
     ):
-        logging.info(f"run_inference: {filename}")
-        output_directory = OUTPUT_DIR
+        device = os.environ.get("DEVICE", "cpu")
+        args = [
+            "--whisper_model",
+            self.WHISPER_MODEL,
+            "--input_file",
+            input_file,
+            f"--output_directory={output_directory}",
+            f"--device={device}",
+            "--device_pyannote=cpu",
+            "--translator=apertium",
+            f"--apertium_server={self.APERTIUM_SERVER}",
+            "--target_language",
+            "cat",
+            "--hugging_face_token",
+            "NONE",
+            "--tts_api_server",
+            self.TTS_URL,
+            "--tts",
+            "api",
+            "--target_language_region",
+            full_variant,
+            "--vad",
+            "--cpu_threads",
+            str(self.threads),
+        ]
+
+        if source_language:
+            args += ["--source_language", source_language]
+
+        if update_operation:
+            args.append("--update")
+
+        if original_subtitles:
+            args.append("--original_subtitles")
+
+        # Hardcoded since we always offer the option to download them
+        args.append("--dubbed_subtitles")
+        return args
+
+    @staticmethod
+    def get_output_directory(filename):
         filename_dir = os.path.dirname(filename)
         filename_uuid = os.path.basename(filename)
-        output_dir_name = f"{filename_uuid}_output"
+        return os.path.join(filename_dir, f"{filename_uuid}_output")
+
+    @staticmethod
+    def get_output_files(output_directory):
+        """Returns the dubbed video, the subtitles and the log of open-dubbing"""
+        output_filename = os.path.abspath(
+            os.path.join(output_directory, "dubbed_video_cat.mp4")
+        )
+        cat_subtitles = os.path.abspath(os.path.join(output_directory, "cat.srt"))
+        log_filename = os.path.abspath(
+            os.path.join(output_directory, "open_dubbing.log")
+        )
+        return output_filename, cat_subtitles, log_filename
+
+    # Creates the output directory and copies the input file there. It can be
+    # called before run_inference to overlap it with other jobs.
+    def prepare_inference(self, filename):
+        output_directory = OUTPUT_DIR
 
-        update_operation = operation == "update"
         try:
-            output_directory = os.path.join(filename_dir, output_dir_name)
+            output_directory = self.get_output_directory(filename)
             if not os.path.exists(output_directory):
                 os.mkdir(output_directory)
         except Exception as exception:
             logging.error(
                 f"run_inference. Error: Could not create output dir {exception}"
             )
+
+        input_file = f"{output_directory}/original.mp4"
+        if not os.path.exists(input_file):
+            fastcopy.copy_file(filename, input_file + ".tmp", allow_link=True)
+            os.replace(input_file + ".tmp", input_file)
+
+        return output_directory, input_file
+
+    def run_inference(
+        self,
+        filename: str,  # e.g. fa05aee-79b9-4d0e-8683-e11b85dfe1a2
+        timeout: int,
+        variant: str,
+        video_lang: str,
+        operation: str,
+        original_subtitles: bool,
+        dubbed_subtitles: bool,
+    ):
+        logging.info(f"run_inference: {filename}")
+        output_directory, input_file = self.prepare_inference(filename)
+        update_operation = operation == "update"
         full_variant = self.get_full_variant(variant)
 
         if variant and len(video_lang) > 0 and video_lang != "auto":
-            source_param = f"--source_language {video_lang}"
+            source_language = video_lang
         else:
-            source_param = ""
-
-        temp_file_name = f"{output_directory}/original.mp4"
-        shutil.copyfile(filename, temp_file_name)
-        input_file = temp_file_name
+            source_language = ""
 
         start_time = datetime.datetime.now()
-        device = os.environ.get("DEVICE", "cpu")
-        APERTIUM_SERVER = "http://dubbing-translator-proxy:8700/"
-        TTS_URL = "http://matcha-service:8100/"
-        # To control CPU usage "set OMP_NUM_THREADS=8 && set MKL_NUM_THREADS=8"
-        original_subtitles = "--original_subtitles" if original_subtitles else ""
-        # Hardcoded since we always offer the option to download them
-        dubbed_subtitles = "--dubbed_subtitles"  # if dubbed_subtitles else ""
-        update = "--update" if update_operation else ""
-        cmd = f'set OMP_NUM_THREADS=8 && set MKL_NUM_THREADS=8 && open-dubbing --whisper_model medium --input_file "{input_file}" --output_directory="{output_directory}" --device={device} --device_pyannote=cpu --translator=apertium --apertium_server={APERTIUM_SERVER} --target_language cat {source_param} --hugging_face_token NONE --tts_api_server {TTS_URL} --tts api --target_language_region {full_variant} {update} {original_subtitles} {dubbed_subtitles} --vad'
-        result = Command(cmd).run(timeout=timeout)
-        end_time = datetime.datetime.now() - start_time
-        logging.debug(f"Run {cmd} in {end_time} with result {result}")
-
-        output_filename = os.path.abspath(
-            os.path.join(output_directory, "dubbed_video_cat.mp4")
+        args = self._get_open_dubbing_args(
+            input_file,
+            output_directory,
+            full_variant,
+            source_language,
+            update_operation,
+            original_subtitles,
+        )
+        cpus = self.governor.acquire() if self.governor else None
+        log_filename = os.path.join(output_directory, LOG_FILE)
+        progress = ProgressTracker(
+            log_filename, get_progress_filename(output_directory), operation
         )
+        # Each job runs in its own output directory since open-dubbing writes
+        # its log and temporary files in the current directory
+        if self.engine:
+            command = self.engine.get_command(
+                args,
+                env=self._get_environment(),
+                cwd=output_directory,
+                memory_limit=self.memory_limit,
+                cpus=cpus,
+                log_filename=log_filename,
+                progress=progress,
+                sample_seconds=self.sample_seconds,
+            )
+        else:
+            cmd = shlex.join(self._get_program(update_operation) + args)
+            command = Command(
+                cmd,
+                env=self._get_environment(),
+                cwd=output_directory,
+                memory_limit=self.memory_limit,
+                cpus=cpus,
+                log_filename=log_filename,
+                progress=progress,
+                sample_seconds=self.sample_seconds,
+            )
 
-        cat_subtitles = os.path.abspath(os.path.join(output_directory, "cat.srt"))
+        try:
+            result = command.run(timeout=timeout)
+        finally:
+            if self.governor:
+                self.governor.release(cpus)
+        end_time = datetime.datetime.now() - start_time
+        logging.debug(f"Run {command.cmd} in {end_time} with result {result}")
 
-        exec_dir = os.path.dirname(os.path.realpath(__file__))
-        log_filename = os.path.abspath(os.path.join(exec_dir, "open_dubbing.log"))
+        output_filename, cat_subtitles, log_filename = self.get_output_files(
+            output_directory
+        )
 
-        if os.path.exists(temp_file_name):
-            os.remove(temp_file_name)
+        if os.path.exists(input_file):
+            os.remove(input_file)
 
         return (
             end_time,
@@ -205,4 +403,5 @@ class Execution(object):
             output_directory,
             cat_subtitles,
             log_filename,
+            command.resources,
         )
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import fcntl
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from catalog import Catalog
+from processedfiles import ProcessedFiles
+from storagestats import StorageStats
+
+"""
+    Index of when the files in the processed directory expire, to purge them
+    without walking the whole directory.
+
+    When results are published their names (relative to the processed
+    directory) are appended to the bucket of the hour in which they expire,
+    a small text file named after it. A purge only reads the buckets that
+    are due, a few entries at a time. An entry published again (e.g. after
+    an update) is also in a later bucket, so as before an entry is only
+    deleted if it has not been modified for the retention period.
+
+    The names published and purged are also measured for the statistics of
+    the processed directory (see storagestats.py) and cataloged for the
+    downloads (see catalog.py).
+"""
+
+EXPIRE_DAYS = 3
+BUCKET_SECONDS = 60 * 60
+# Written once the files published before the index existed are added
+CREATED = "created"
+
+
+class ExpiryIndex:
+    def __init__(self, directory=None, days=EXPIRE_DAYS, stats=None, catalog=None):
+        self.processed = ProcessedFiles.get_processed_directory()
+        if directory is None:
+            directory = os.path.join(self.processed, "expiry")
+
+        self.directory = directory
+        self.max_age = days * 24 * 60 * 60
+        self.stats = stats or StorageStats()
+        self.catalog = catalog or Catalog()
+
+    def _get_bucket_filename(self, bucket):
+        return os.path.join(self.directory, str(bucket))
+
+    def _get_buckets(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def _add(self, names, expires):
+        bucket = int(expires // BUCKET_SECONDS)
+        filename = self._get_bucket_filename(bucket)
+        while True:
+            with open(filename, "a") as fh:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+                # purge removes the file of an emptied bucket while it holds
+                # the lock, the names written to it would be lost
+                try:
+                    removed = os.fstat(fh.fileno()).st_ino != os.stat(filename).st_ino
+                except FileNotFoundError:
+                    removed = True
+
+                if not removed:
+                    fh.write("".join(f"{name}\n" for name in names))
+                    return
+
+    def add(self, names, now=None):
+        """names are relative to the processed directory, files or directories"""
+        if now is None:
+            now = time.time()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._add(names, now + self.max_age)
+        try:
+            self.stats.put(self.processed, names)
+        except sqlite3.Error as e:
+            logging.error(f"ExpiryIndex.add. Cannot update the stats. Error: {e}")
+
+        try:
+            self.catalog.put(self.processed, names)
+        except sqlite3.Error as e:
+            logging.error(f"ExpiryIndex.add. Cannot update the catalog. Error: {e}")
+
+    def is_created(self):
+        return os.path.exists(os.path.join(self.directory, CREATED))
+
+    def rebuild(self):
+        """Adds the files published before the index existed (scans them once)"""
+        os.makedirs(self.directory, exist_ok=True)
+        buckets = {}
+        for name in self.scan():
+            try:
+                mtime = os.path.getmtime(os.path.join(self.processed, name))
+            except FileNotFoundError:
+                continue
+
+            buckets.setdefault(int(mtime // BUCKET_SECONDS), []).append(name)
+
+        for bucket, names in buckets.items():
+            self._add(names, bucket * BUCKET_SECONDS + self.max_age)
+
+        with open(os.path.join(self.directory, CREATED), "w") as fh:
+            fh.write("")
+
+        return sum(len(names) for names in buckets.values())
+
+    def scan(self):
+        expiry = os.path.basename(self.directory)
+        for name in os.listdir(self.processed):
+            if name == expiry:
+                continue
+
+            if name == "content":
+                # Entries of the content index, see contentindex.py
+                content = os.path.join(self.processed, name)
+                for entry in os.listdir(content):
+                    yield os.path.join(name, entry)
+            else:
+                yield name
+
+    def has_due(self, now=None):
+        if now is None:
+            now = time.time()
+
+        buckets = self._get_buckets()
+        return len(buckets) > 0 and (buckets[0] + 1) * BUCKET_SECONDS <= now
+
+    def _delete(self, name, now):
+        """Returns None if the name has been published again"""
+        filename = os.path.join(self.processed, name)
+        try:
+            if os.stat(filename).st_mtime >= now - self.max_age:
+                return None  # It is in a later bucket
+
+            if os.path.isdir(filename):
+                shutil.rmtree(filename)
+            else:
+                os.remove(filename)
+        except FileNotFoundError:
+            return False
+
+        logging.debug(f"ExpiryIndex.purge. Deleted {filename}")
+        return True
+
+    def purge(self, limit=100, now=None):
+        """Checks up to limit due entries, returns the number deleted"""
+        if now is None:
+            now = time.time()
+
+        deleted = 0
+        for bucket in self._get_buckets():
+            if (bucket + 1) * BUCKET_SECONDS > now or limit <= 0:
+                break
+
+            try:
+                fh = open(self._get_bucket_filename(bucket), "r+")
+            except FileNotFoundError:
+                continue  # Purged by another worker
+
+            with fh:
+                try:
+                    fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # Being purged by another worker
+
+                names = fh.read().splitlines()
+                removed = []
+                failed = []
+                for name in names[:limit]:
+                    try:
+                        result = self._delete(name, now)
+                    except OSError as e:
+                        logging.error(f"ExpiryIndex.purge. Error deleting {name}: {e}")
+                        failed.append(name)
+                        continue
+
+                    if result is not None:
+                        removed.append(name)
+                        deleted += result
+
+                try:
+                    self.stats.delete(removed)
+                except sqlite3.Error as e:
+                    logging.error(
+                        f"ExpiryIndex.purge. Cannot update the stats. Error: {e}"
+                    )
+
+                try:
+                    self.catalog.delete(removed)
+                except sqlite3.Error as e:
+                    logging.error(
+                        f"ExpiryIndex.purge. Cannot update the catalog. Error: {e}"
+                    )
+
+                pending = names[limit:]
+                limit -= len(names) - len(pending)
+                fh.seek(0)
+                fh.truncate()
+                if pending:
+                    fh.write("".join(f"{name}\n" for name in pending))
+                else:
+                    os.remove(fh.name)
+
+            # Retried in the bucket of this hour, not in this one that is due
+            # and purged again right away
+            if failed:
+                self._add(failed, now)
+
+        return deleted
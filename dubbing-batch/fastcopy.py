@@ -0,0 +1,150 @@
+# -*- encoding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import errno
+import fcntl
+import logging
+import os
+import shutil
+import threading
+
+"""
+    Copies and moves files avoiding to duplicate the data when the filesystem
+    allows it:
+        - hardlinks, only for files that are never modified in place
+        - reflinks (copy on write clones, e.g. btrfs or XFS)
+        - a real copy as fallback, which is counted in stats
+"""
+
+FICLONE = 0x40049409  # From linux/fs.h
+
+_lock = threading.Lock()
+stats = {"link": 0, "reflink": 0, "copy": 0, "rename": 0, "bytes_copied": 0}
+
+
+def _count(method, size=0):
+    with _lock:
+        stats[method] += 1
+        if method == "copy":
+            stats["bytes_copied"] += size
+
+
+def reset_stats():
+    with _lock:
+        for key in stats:
+            stats[key] = 0
+
+
+def _remove_if_exists(target):
+    try:
+        os.remove(target)
+    except FileNotFoundError:
+        pass
+
+
+def _clone(source, target):
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def copy_file(source, target, allow_link=False):
+    """Returns the method used: link, reflink or copy"""
+    if os.path.isdir(target):
+        target = os.path.join(target, os.path.basename(source))
+
+    _remove_if_exists(target)
+
+    if allow_link:
+        try:
+            os.link(source, target)
+            _count("link")
+            return "link"
+        except OSError:
+            pass
+
+    try:
+        _clone(source, target)
+        shutil.copystat(source, target)
+        _count("reflink")
+        return "reflink"
+    except OSError:
+        _remove_if_exists(target)
+
+    shutil.copy2(source, target)
+    size = os.path.getsize(target)
+    _count("copy", size)
+    logging.debug(f"fastcopy.copy_file. Copied {size} bytes from {source}")
+    return "copy"
+
+
+def move_file(source, target):
+    if os.path.isdir(target):
+        target = os.path.join(target, os.path.basename(source))
+
+    # Hardlinks of the same file (e.g. the video of an update), rename(2) does
+    # nothing and both names would remain
+    try:
+        if os.path.samefile(source, target):
+            os.remove(source)
+            _count("rename")
+            return
+    except FileNotFoundError:
+        pass
+
+    try:
+        os.replace(source, target)
+        _count("rename")
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    # Different filesystems
+    copy_file(source, target)
+    os.remove(source)
+
+
+def copy_tree(source, target, can_link=None):
+    """can_link(relative_path) tells if a file is never modified in place"""
+    for root, dirs, files in os.walk(source):
+        relative_root = os.path.relpath(root, source)
+        target_root = os.path.normpath(os.path.join(target, relative_root))
+        os.makedirs(target_root, exist_ok=True)
+
+        for name in files:
+            relative = os.path.normpath(os.path.join(relative_root, name))
+            allow_link = can_link(relative) if can_link else False
+            copy_file(
+                os.path.join(root, name),
+                os.path.join(target_root, name),
+                allow_link=allow_link,
+            )
+
+
+def move_dir(source, target):
+    try:
+        os.rename(source, target)
+        _count("rename")
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    copy_tree(source, target)
+    shutil.rmtree(source)
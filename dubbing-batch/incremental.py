@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import inspect
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+from mp3frames import Mp3Frames, Mp3Error
+
+"""
+    Incremental update of a dubbed video after the user edits utterances.
+
+    dubbing-service records in the output directory the time windows that
+    changed (edited, created or deleted utterances, before and after the
+    edit). open-dubbing already synthesizes again only the modified
+    utterances; with the hooks installed for the updates (in the child of the
+    warm engine, or running this module instead of open-dubbing):
+        - only the changed windows of the existing dubbed vocals are remixed.
+          The frames of the dubbed vocals in the windows are replaced by
+          frames encoded apart (see mp3frames.py), the rest of the file is
+          not decoded nor encoded again
+        - the dubbed audio is muxed copying the video stream, instead of
+          encoding the video again
+"""
+
+CHANGES_FILE = "utterance_changes.json"
+DUBBED_VOCALS_FILE = "dubbed_vocals.mp3"
+# Silent frames encoded again before and after the chunks of a window, the
+# frames around them are left as they are and have to be silent too
+MARGIN_FRAMES = 1
+# Delay of libmp3lame in ffmpeg, until the one of the encoded frames is read
+ENCODER_DELAY = 1105
+
+
+def _get_fields(utterance):
+    return {key: value for key, value in utterance.items() if not key.startswith("_")}
+
+
+def get_changes(utterance_master, utterance_updated):
+    """Returns the ids of the changed utterances and their time windows"""
+    master = {utterance["id"]: utterance for utterance in utterance_master}
+    updated_ids = set()
+    ids = []
+    windows = []
+
+    for utterance in utterance_updated:
+        _id = utterance["id"]
+        updated_ids.add(_id)
+        previous = master.get(_id)
+        if previous and _get_fields(previous) == _get_fields(utterance):
+            continue
+
+        ids.append(_id)
+        windows.append([utterance["start"], utterance["end"]])
+        if previous:
+            windows.append([previous["start"], previous["end"]])
+
+    for _id, utterance in master.items():
+        if _id not in updated_ids:
+            ids.append(_id)
+            windows.append([utterance["start"], utterance["end"]])
+
+    return ids, windows
+
+
+def merge_windows(windows):
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    return merged
+
+
+def save_changes(output_directory, windows):
+    """Adds the windows to the ones of previous edits not processed yet"""
+    filename = os.path.join(output_directory, CHANGES_FILE)
+    previous = load_changes(output_directory)
+    if previous:
+        windows = previous + windows
+
+    with open(filename, "w") as fh:
+        json.dump({"windows": merge_windows(windows)}, fh)
+
+
+def load_changes(output_directory):
+    try:
+        with open(os.path.join(output_directory, CHANGES_FILE), "r") as fh:
+            return json.load(fh)["windows"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def _get_dubbed_items(utterance_metadata):
+    return [
+        item
+        for item in utterance_metadata
+        if item.get("for_dubbing") and "dubbed_path" in item
+    ]
+
+
+def grow_window(items, start_ms, end_ms, load):
+    """Dubbed audio can be longer than the original utterance, the window
+    grows until it contains all the chunks that overlap it. load(item)
+    returns the dubbed audio of an item. Returns start_ms, end_ms and the
+    list of (position, chunk) in the window."""
+    chunks = {}
+    grown = True
+    while grown:
+        grown = False
+        for idx, item in enumerate(items):
+            position = int(item["start"] * 1000)
+            if idx in chunks or position >= end_ms or item["end"] * 1000 <= start_ms:
+                continue
+
+            chunk = load(item)
+            chunks[idx] = (position, chunk)
+            if position < start_ms or position + len(chunk) > end_ms:
+                start_ms = min(start_ms, position)
+                end_ms = max(end_ms, position + len(chunk))
+                grown = True
+
+    return start_ms, end_ms, list(chunks.values())
+
+
+def _remix_windows(vocals, utterance_metadata, windows):
+    """Remixes the windows of the decoded vocals, used if the frames of the
+    file cannot be replaced"""
+    from pydub import AudioSegment
+
+    items = _get_dubbed_items(utterance_metadata)
+    for start, end in windows:
+        start_ms, end_ms, chunks = grow_window(
+            items,
+            int(start * 1000),
+            int(end * 1000),
+            lambda item: AudioSegment.from_mp3(item["dubbed_path"]),
+        )
+        end_ms = min(end_ms, len(vocals))
+        if end_ms <= start_ms:
+            continue
+
+        window = AudioSegment.silent(
+            duration=end_ms - start_ms, frame_rate=vocals.frame_rate
+        )
+        for position, chunk in chunks:
+            window = window.overlay(chunk, position=position - start_ms)
+
+        vocals = vocals[:start_ms] + window + vocals[end_ms:]
+
+    return vocals
+
+
+def _to_samples(vocals, ms):
+    return int(ms * vocals.sample_rate // 1000)
+
+
+def _to_ms(vocals, samples):
+    return samples * 1000 // vocals.sample_rate
+
+
+def _get_span(vocals, items, start_ms, end_ms, load):
+    """Returns the frames (first, end) to encode again for the window. They
+    contain all the chunks that overlap them or the frames around them,
+    which keep the original audio."""
+    frame_ms = _to_ms(vocals, vocals.samples_per_frame) + 1
+    while True:
+        first, end = vocals.get_span(
+            _to_samples(vocals, start_ms), _to_samples(vocals, end_ms)
+        )
+        first = max(first - MARGIN_FRAMES, 0)
+        end = min(end + MARGIN_FRAMES, len(vocals.frames))
+        _, _, chunks = grow_window(
+            items,
+            _to_ms(vocals, vocals.get_start_sample(first)) - frame_ms,
+            _to_ms(vocals, vocals.get_start_sample(end)) + frame_ms,
+            load,
+        )
+        chunks_start = min([start_ms] + [position for position, _ in chunks])
+        chunks_end = max([end_ms] + [p + len(chunk) for p, chunk in chunks])
+        if chunks_start >= start_ms and chunks_end <= end_ms:
+            return first, end
+
+        start_ms, end_ms = chunks_start, chunks_end
+
+
+def _merge_spans(spans):
+    """The spans that overlap or are next to each other are encoded together,
+    the frames around each one have to keep the original audio"""
+    merged = []
+    for first, end in sorted(spans):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([first, end])
+
+    return merged
+
+
+def _render_pcm(chunks, sample_rate, channels, start_sample, samples):
+    """Mixes the chunks (positions in ms) as 16 bits PCM from start_sample"""
+    from pydub import AudioSegment
+
+    audio = AudioSegment(
+        data=bytes(samples * 2 * channels),
+        sample_width=2,
+        frame_rate=sample_rate,
+        channels=channels,
+    )
+    for position, chunk in chunks:
+        chunk = chunk.set_frame_rate(sample_rate).set_channels(channels)
+        offset = position * sample_rate / 1000 - start_sample
+        audio = audio.overlay(
+            chunk.set_sample_width(2), position=round(offset * 1000 / sample_rate)
+        )
+
+    return audio.raw_data
+
+
+def _encode_mp3(pcm, sample_rate, channels, bitrate):
+    """Constant bitrate frames without bit reservoir, they do not use bytes of
+    the previous frames. Written to a file, ffmpeg only writes the Info
+    frame (with the encoder delay) if the output is seekable."""
+    with tempfile.NamedTemporaryFile(suffix=".mp3") as output:
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-f",
+            "s16le",
+            "-ar",
+            str(sample_rate),
+            "-ac",
+            str(channels),
+            "-i",
+            "-",
+            "-c:a",
+            "libmp3lame",
+            "-b:a",
+            f"{bitrate}k",
+            "-reservoir",
+            "0",
+            output.name,
+        ]
+        subprocess.run(cmd, input=pcm, check=True, capture_output=True)
+        with open(output.name, "rb") as fh:
+            return fh.read()
+
+
+def _encode_span(vocals, first, end, chunks):
+    """Returns the frames encoded for the span, aligned with the ones they replace"""
+    spf = vocals.samples_per_frame
+    frames = end - first
+    delay = vocals.delay or ENCODER_DELAY
+    for _ in range(2):
+        # The encoded frames start after the delay, with this silence before
+        # the span it starts with a frame
+        lead = -delay % spf
+        start_sample = vocals.get_start_sample(first) - lead
+        pcm = _render_pcm(
+            chunks,
+            vocals.sample_rate,
+            vocals.channels,
+            start_sample,
+            lead + (frames + 1) * spf,
+        )
+        encoded = Mp3Frames(
+            _encode_mp3(pcm, vocals.sample_rate, vocals.channels, vocals.get_bitrate())
+        )
+        if encoded.delay == delay:
+            break
+
+        delay = encoded.delay
+    else:
+        raise Mp3Error(f"Unexpected encoder delay {encoded.delay}")
+
+    skip = (lead + delay) // spf
+    if not vocals.is_compatible(encoded) or len(encoded.frames) < skip + frames:
+        raise Mp3Error("The encoded frames do not match the ones of the file")
+
+    return encoded.get_frame_bytes(skip, skip + frames)
+
+
+def remix_frames(vocals_file, utterance_metadata, windows, load):
+    """Replaces the frames of the windows in the dubbed vocals file, the cost
+    depends on the duration of the windows. load(item) returns the dubbed
+    audio of an item. Raises Mp3Error if the file cannot be remixed this way."""
+    with open(vocals_file, "rb") as fh:
+        vocals = Mp3Frames(fh.read())
+
+    items = _get_dubbed_items(utterance_metadata)
+    spans = [
+        _get_span(vocals, items, int(start * 1000), int(end * 1000), load)
+        for start, end in windows
+    ]
+    replaced = []
+    for first, end in _merge_spans(spans):
+        start_ms = _to_ms(vocals, vocals.get_start_sample(first))
+        end_ms = _to_ms(vocals, vocals.get_start_sample(end))
+        _, _, chunks = grow_window(items, start_ms, end_ms, load)
+        replaced.append((first, end, _encode_span(vocals, first, end, chunks)))
+
+    with open(vocals_file + ".tmp", "wb") as fh:
+        fh.write(vocals.replace(replaced))
+
+    os.replace(vocals_file + ".tmp", vocals_file)
+    return replaced
+
+
+def _remix_file(vocals_file, utterance_metadata, windows):
+    from pydub import AudioSegment
+
+    loaded = {}
+
+    def _load(item):
+        path = item["dubbed_path"]
+        if path not in loaded:
+            loaded[path] = AudioSegment.from_mp3(path)
+        return loaded[path]
+
+    try:
+        replaced = remix_frames(vocals_file, utterance_metadata, windows, _load)
+        frames = sum(end - first for first, end, _ in replaced)
+        logging.info(
+            f"IncrementalHooks. Encoded {frames} frames of {len(windows)} windows"
+        )
+        return
+    except (Mp3Error, OSError, subprocess.CalledProcessError) as e:
+        logging.error(f"IncrementalHooks. Cannot replace the frames. Error: {e}")
+
+    vocals = AudioSegment.from_mp3(vocals_file)
+    vocals = _remix_windows(vocals, utterance_metadata, windows)
+    vocals.export(vocals_file, format="mp3")
+    logging.info(f"IncrementalHooks. Remixed {len(windows)} windows")
+
+
+def get_arguments(function, args, kwargs, names):
+    """Arguments by name, however they were passed to open-dubbing's function.
+    None if the function does not have them (another open-dubbing version)."""
+    try:
+        arguments = inspect.signature(function).bind(*args, **kwargs).arguments
+    except (TypeError, ValueError):
+        return None
+
+    if not set(names) <= set(arguments):
+        return None
+
+    return arguments
+
+
+class IncrementalHooks:
+    """Patches open-dubbing postprocessing, in the process where it runs. Only
+    to be installed for updates (the engine does it in the job's process)."""
+
+    def install(self):
+        from open_dubbing import audio_processing
+        from open_dubbing.video_processing import VideoProcessing
+
+        audio_processing.insert_audio_at_timestamps = self._insert_audio(
+            audio_processing.insert_audio_at_timestamps
+        )
+        VideoProcessing.combine_audio_video = staticmethod(
+            self._combine_audio_video(VideoProcessing.combine_audio_video)
+        )
+
+    def _insert_audio(self, insert):
+        def insert_audio_at_timestamps(*args, **kwargs):
+            arguments = get_arguments(
+                insert, args, kwargs, ["utterance_metadata", "output_directory"]
+            )
+            if arguments is None:
+                return insert(*args, **kwargs)
+
+            output_directory = arguments["output_directory"]
+            windows = load_changes(output_directory)
+            vocals_file = os.path.join(output_directory, DUBBED_VOCALS_FILE)
+            if windows is not None and os.path.exists(vocals_file):
+                _remix_file(vocals_file, arguments["utterance_metadata"], windows)
+            else:
+                vocals_file = insert(*args, **kwargs)
+
+            if windows is not None:
+                os.remove(os.path.join(output_directory, CHANGES_FILE))
+
+            return vocals_file
+
+        return insert_audio_at_timestamps
+
+    def _combine_audio_video(self, combine):
+        def combine_audio_video(*args, **kwargs):
+            arguments = get_arguments(
+                combine,
+                args,
+                kwargs,
+                [
+                    "video_file",
+                    "dubbed_audio_file",
+                    "output_directory",
+                    "target_language",
+                ],
+            )
+            if arguments is None:
+                return combine(*args, **kwargs)
+
+            target_language = arguments["target_language"]
+            suffix = "_" + target_language.replace("-", "_").lower()
+            dubbed_video_file = os.path.join(
+                arguments["output_directory"], f"dubbed_video{suffix}.mp4"
+            )
+            # Audio padded with silence or cut to the duration of the video
+            cmd = [
+                "ffmpeg",
+                "-y",
+                "-i",
+                arguments["video_file"],
+                "-i",
+                arguments["dubbed_audio_file"],
+                "-map",
+                "0:v:0",
+                "-map",
+                "1:a:0",
+                "-c:v",
+                "copy",
+                "-c:a",
+                "aac",
+                "-af",
+                "apad",
+                "-shortest",
+                dubbed_video_file,
+            ]
+            try:
+                subprocess.run(cmd, check=True, capture_output=True)
+                return dubbed_video_file
+            except Exception as e:
+                logging.error(f"IncrementalHooks.combine_audio_video. Error: {e}")
+
+            return combine(*args, **kwargs)
+
+        return combine_audio_video
+
+
+def main():
+    """open-dubbing with the hooks installed, for the updates that do not run
+    in the warm engine (see Execution.run_inference)"""
+    from open_dubbing.main import main as open_dubbing_main
+
+    IncrementalHooks().install()
+    sys.argv = ["open-dubbing"] + sys.argv[1:]
+    open_dubbing_main()
+
+
+if __name__ == "__main__":
+    main()
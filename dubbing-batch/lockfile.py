@@ -24,8 +24,10 @@ import time
 
 
 class LockFile:
-    def __init__(self, filename):
+    def __init__(self, filename, max_age=3 * 60 * 60):
+        """max_age in seconds, after it the lock expires unless renewed"""
         self.filename = filename + ".lock"
+        self.max_age = max_age
 
     def create(self):
         try:
@@ -49,15 +51,22 @@ class LockFile:
                     f"LockFile.delete. Error deleting file {self.filename}: {e}"
                 )
 
+    def renew(self):
+        try:
+            os.utime(self.filename)
+        except FileNotFoundError:
+            self.create()
+
     def has_lock(self):
         has_lock = False
         if not os.path.exists(self.filename):
             return has_lock
 
-        MINUTES_HOUR = 60
-        MINUTES_SEC = 60
-        time_limit = time.time() - (MINUTES_HOUR * MINUTES_SEC * 3)
-        file_time = os.stat(self.filename).st_mtime
+        time_limit = time.time() - self.max_age
+        try:
+            file_time = os.stat(self.filename).st_mtime
+        except FileNotFoundError:
+            return has_lock
         if file_time < time_limit:
             logging.debug(f"LockFile.has_lock. Lock has expired: {self.filename}")
             self.delete()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import logging
+import os
+import struct
+
+"""
+    Reads the duration, codecs and streams of an MP4 (ISO base media file
+    format) from the metadata of its container, the moov box, without
+    decoding the media.
+
+    Mp4Probe is fed with the bytes as they are received, the media data
+    (mdat) is skipped without keeping it, so when the moov box is before it
+    (fast start) the result is known from the first bytes of the upload.
+    probe_file seeks over the boxes of a file already stored.
+
+    The result is a dict like:
+        {"format": "mp4", "duration_ms": 61000, "streams": [
+            {"type": "video", "codec": "avc1", "duration_ms": 61000,
+             "width": 1280, "height": 720},
+            {"type": "audio", "codec": "mp4a", "duration_ms": 60998,
+             "channels": 2, "sample_rate": 44100, "language": "und"}]}
+"""
+
+# Boxes that only contain other boxes and lead to the ones read
+CONTAINERS = [b"moov", b"trak", b"mdia", b"minf", b"stbl", b"mvex"]
+HANDLERS = {b"vide": "video", b"soun": "audio", b"text": "text", b"sbtl": "text"}
+# A larger moov box is not a video that can be uploaded
+MAX_MOOV_SIZE = 64 * 1024 * 1024
+
+
+class ProbeError(Exception):
+    pass
+
+
+def _read_box_header(data, offset):
+    """Returns (size, type, header size) or None if there are not enough bytes"""
+    if len(data) - offset < 8:
+        return None
+
+    size, box_type = struct.unpack_from(">I4s", data, offset)
+    if size == 1:
+        if len(data) - offset < 16:
+            return None
+
+        (size,) = struct.unpack_from(">Q", data, offset + 8)
+        return size, box_type, 16
+
+    if size != 0 and size < 8:
+        raise ProbeError(f"Invalid size {size} of box {box_type}")
+
+    return size, box_type, 8
+
+
+def _iterate_boxes(data):
+    offset = 0
+    while offset < len(data):
+        header = _read_box_header(data, offset)
+        if header is None:
+            return
+
+        size, box_type, header_size = header
+        end = len(data) if size == 0 else offset + size
+        start = offset + header_size
+        yield box_type, data[start:end]
+        offset = end
+
+
+def _parse_header_times(payload):
+    """mvhd and mdhd: returns (timescale, duration, offset after them)"""
+    version = payload[0]
+    if version == 1:
+        timescale, duration = struct.unpack_from(">IQ", payload, 20)
+        return timescale, duration, 32
+
+    timescale, duration = struct.unpack_from(">II", payload, 12)
+    return timescale, duration, 20
+
+
+def _to_ms(duration, timescale):
+    if not timescale or duration in [0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF]:
+        return 0
+
+    return int(duration * 1000 / timescale)
+
+
+def _parse_language(code):
+    # Three 5 bits letters (ISO 639-2/T) offset by 0x60
+    letters = [(code >> shift) & 0x1F for shift in [10, 5, 0]]
+    if not all(letters):
+        return "und"
+
+    return "".join(chr(letter + 0x60) for letter in letters)
+
+
+def _parse_sample_entry(stream, payload):
+    # stsd: version and flags, entry count and the first entry
+    if len(payload) < 16:
+        return
+
+    stream["codec"] = payload[12:16].decode("latin-1").strip()
+    entry = payload[16:]
+    if stream["type"] == "video" and len(entry) >= 28:
+        stream["width"], stream["height"] = struct.unpack_from(">HH", entry, 24)
+    elif stream["type"] == "audio" and len(entry) >= 28:
+        (stream["channels"],) = struct.unpack_from(">H", entry, 16)
+        (sample_rate,) = struct.unpack_from(">I", entry, 24)
+        stream["sample_rate"] = sample_rate >> 16  # 16.16 fixed point
+
+
+def _parse_track(payload):
+    stream = {"type": "other", "codec": "", "duration_ms": 0}
+    stsd = None
+    pending = [payload]
+    while pending:
+        for box_type, box in _iterate_boxes(pending.pop()):
+            if box_type in CONTAINERS:
+                pending.append(box)
+            elif box_type == b"mdhd":
+                timescale, duration, offset = _parse_header_times(box)
+                stream["duration_ms"] = _to_ms(duration, timescale)
+                (language,) = struct.unpack_from(">H", box, offset)
+                stream["language"] = _parse_language(language)
+            elif box_type == b"hdlr":
+                stream["type"] = HANDLERS.get(box[8:12], "other")
+            elif box_type == b"stsd":
+                stsd = box
+
+    # The handler can be after the sample description
+    if stsd:
+        _parse_sample_entry(stream, stsd)
+
+    if stream["type"] != "audio":
+        stream.pop("language", None)
+
+    return stream
+
+
+def parse_moov(payload):
+    """Returns the result from the content of the moov box"""
+    result = {"format": "mp4", "duration_ms": 0, "streams": []}
+    movie_timescale = 0
+    try:
+        for box_type, box in _iterate_boxes(payload):
+            if box_type == b"mvhd":
+                timescale, duration, _ = _parse_header_times(box)
+                result["duration_ms"] = _to_ms(duration, timescale)
+                movie_timescale = timescale
+            elif box_type == b"trak":
+                result["streams"].append(_parse_track(box))
+            elif box_type == b"mvex":
+                # Fragmented, the duration of all the fragments
+                for mvex_type, mvex_box in _iterate_boxes(box):
+                    if mvex_type == b"mehd" and result["duration_ms"] == 0:
+                        version = mvex_box[0]
+                        fmt = ">Q" if version == 1 else ">I"
+                        (duration,) = struct.unpack_from(fmt, mvex_box, 4)
+                        result["duration_ms"] = _to_ms(duration, movie_timescale)
+    except (struct.error, IndexError) as e:
+        raise ProbeError(f"Invalid moov box: {e}")
+
+    if result["duration_ms"] == 0:
+        durations = [stream["duration_ms"] for stream in result["streams"]]
+        result["duration_ms"] = max(durations, default=0)
+
+    return result
+
+
+def has_audio(result):
+    return any(stream["type"] == "audio" for stream in result["streams"])
+
+
+class Mp4Probe:
+    def __init__(self):
+        self._buffer = bytearray()
+        self._skip = 0
+        self._boxes = 0
+        self.result = None
+        self.error = None
+
+    def is_done(self):
+        return self.result is not None or self.error is not None
+
+    def feed(self, data):
+        """Returns the result once the moov box has been received, otherwise None"""
+        if self.is_done():
+            return self.result
+
+        try:
+            self._feed(data)
+        except ProbeError as e:
+            logging.debug(f"Mp4Probe.feed. Error: {e}")
+            self.error = str(e)
+
+        return self.result
+
+    def _feed(self, data):
+        if self._skip:
+            skipped = min(self._skip, len(data))
+            self._skip -= skipped
+            data = data[skipped:]
+
+        self._buffer += data
+        while not self.is_done():
+            header = _read_box_header(self._buffer, 0)
+            if header is None:
+                return
+
+            size, box_type, header_size = header
+            if self._boxes == 0 and box_type != b"ftyp":
+                raise ProbeError("It is not an MP4 file")
+
+            self._boxes += 1
+            if box_type == b"moov":
+                if size == 0 or size > MAX_MOOV_SIZE:
+                    raise ProbeError(f"Invalid size {size} of the moov box")
+
+                if len(self._buffer) < size:
+                    self._boxes -= 1
+                    return
+
+                self.result = parse_moov(bytes(self._buffer[header_size:size]))
+                self._buffer = bytearray()
+            elif size == 0:
+                raise ProbeError(f"The last box {box_type} is not moov")
+            else:
+                # Skipped without keeping it (e.g. the media data)
+                skipped = min(size, len(self._buffer))
+                del self._buffer[:skipped]
+                self._skip = size - skipped
+
+
+def probe_file(filename, available=None):
+    """Returns the result or raises ProbeError
+
+    For a file still being received, available(start, end) tells if those
+    bytes have been written, if one of the parts needed has not it returns None"""
+    file_size = os.path.getsize(filename)
+    with open(filename, "rb") as fh:
+        offset = 0
+        first = True
+        while True:
+            end = min(offset + 16, file_size)
+            if available and not available(offset, end):
+                return None
+
+            fh.seek(offset)
+            header = _read_box_header(fh.read(end - offset), 0)
+            if header is None:
+                raise ProbeError("moov box not found")
+
+            size, box_type, header_size = header
+            if first and box_type != b"ftyp":
+                raise ProbeError("It is not an MP4 file")
+
+            first = False
+            if box_type == b"moov":
+                if size == 0 or size > MAX_MOOV_SIZE:
+                    raise ProbeError(f"Invalid size {size} of the moov box")
+
+                if available and not available(offset, offset + size):
+                    return None
+
+                fh.seek(offset + header_size)
+                payload = fh.read(size - header_size)
+                if len(payload) < size - header_size:
+                    raise ProbeError("Truncated moov box")
+
+                return parse_moov(payload)
+
+            if size == 0:
+                raise ProbeError(f"The last box {box_type} is not moov")
+
+            offset += size
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import struct
+
+"""
+    Reads the frames of an MP3 (MPEG audio layer III) file without decoding
+    them, to replace the frames of a time span with others encoded apart.
+
+    Every frame has the same number of samples, so the frames of a span are
+    known from the header of each frame. The Xing/Info frame written by the
+    encoder (LAME or ffmpeg) is kept, it has the encoder delay: the samples
+    that a decoder skips at the beginning.
+
+    The replaced spans have to start and end in silence: a frame can use bytes
+    of the previous frames (bit reservoir) and the decoded samples overlap
+    with the ones of the previous frame.
+"""
+
+# Samples added by the decoder to the encoder delay written in the tag, as
+# ffmpeg's mp3 demuxer does
+DECODER_DELAY = 528 + 1
+
+BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+VERSIONS = {0: 2.5, 2: 2, 3: 1}
+
+
+class Mp3Error(Exception):
+    pass
+
+
+class Frame:
+    def __init__(self, data, offset):
+        """Parses the header of the frame at offset, raises Mp3Error if there
+        is not a layer III frame"""
+        if len(data) - offset < 4:
+            raise Mp3Error(f"No frame header at {offset}")
+
+        (header,) = struct.unpack_from(">I", data, offset)
+        version = VERSIONS.get((header >> 19) & 3)
+        layer = (header >> 17) & 3
+        bitrate_index = (header >> 12) & 15
+        sample_rate_index = (header >> 10) & 3
+        if (
+            header >> 21 != 0x7FF
+            or version is None
+            or layer != 1
+            or bitrate_index in [0, 15]
+            or sample_rate_index == 3
+        ):
+            raise Mp3Error(f"Invalid frame header at {offset}")
+
+        self.offset = offset
+        self.version = version
+        self.sample_rate = SAMPLE_RATES[version][sample_rate_index]
+        self.bitrate = BITRATES[1 if version == 1 else 2][bitrate_index]
+        self.channels = 1 if (header >> 6) & 3 == 3 else 2
+        self.samples = 1152 if version == 1 else 576
+        self.has_crc = (header >> 16) & 1 == 0
+        padding = (header >> 9) & 1
+        self.size = self.samples // 8 * self.bitrate * 1000 // self.sample_rate
+        self.size += padding
+        if len(data) - offset < self.size:
+            raise Mp3Error(f"Truncated frame at {offset}")
+
+    def _get_side_info_offset(self):
+        return self.offset + 4 + (2 if self.has_crc else 0)
+
+    def get_encoder_delay(self, data):
+        """The delay of the Xing/Info tag if this frame has it, otherwise None"""
+        if self.version == 1:
+            side_info = 17 if self.channels == 1 else 32
+        else:
+            side_info = 9 if self.channels == 1 else 17
+
+        offset = self._get_side_info_offset() + side_info
+        end = self.offset + self.size
+        tag_end = offset + 4
+        if data[offset:tag_end] not in [b"Xing", b"Info"]:
+            return None
+
+        (flags,) = struct.unpack_from(">I", data, offset + 4)
+        offset += 8
+        for flag, size in [(1, 4), (2, 4), (4, 100), (8, 4)]:
+            if flags & flag:
+                offset += size
+
+        # The encoder version (9 bytes) and 12 other bytes of the LAME tag
+        offset += 21
+        if offset + 3 > end:
+            return 0
+
+        return (data[offset] << 4) | (data[offset + 1] >> 4)
+
+
+class Mp3Frames:
+    def __init__(self, data):
+        """data are the bytes of the whole file"""
+        self.data = data
+        self.frames = []  # Audio frames, without the Xing/Info one
+        self.delay = 0  # Samples before the first one of the audio
+        self.start = self._skip_id3(data)
+        offset = self.start
+        while offset < len(data):
+            try:
+                frame = Frame(data, offset)
+            except Mp3Error:
+                # An ID3v1 tag or garbage after the last frame
+                if not self.frames:
+                    raise
+                break
+
+            delay = None
+            if offset == self.start:
+                delay = frame.get_encoder_delay(data)
+
+            if delay is None:
+                self.frames.append(frame)
+            else:
+                self.delay = delay + DECODER_DELAY
+
+            offset += frame.size
+
+        if not self.frames:
+            raise Mp3Error("No audio frames")
+
+        self.end = offset
+        first = self.frames[0]
+        self.sample_rate = first.sample_rate
+        self.channels = first.channels
+        self.samples_per_frame = first.samples
+
+    def _skip_id3(self, data):
+        if data[:3] != b"ID3" or len(data) < 10:
+            return 0
+
+        size = 0
+        for byte in data[6:10]:
+            size = (size << 7) | (byte & 0x7F)
+
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+
+    def get_bitrate(self):
+        """The most common bitrate (kbps), the one of a constant bitrate file"""
+        bitrates = [frame.bitrate for frame in self.frames]
+        return max(set(bitrates), key=bitrates.count)
+
+    def get_span(self, start_sample, end_sample):
+        """The frames (first, end) with the samples of the time span, the
+        sample 0 is the first one after the delay"""
+        first = (start_sample + self.delay) // self.samples_per_frame
+        end = -(-(end_sample + self.delay) // self.samples_per_frame)
+        return max(first, 0), min(end, len(self.frames))
+
+    def get_start_sample(self, frame_index):
+        """The first sample of the frame, negative for the delay"""
+        return frame_index * self.samples_per_frame - self.delay
+
+    def get_frame_bytes(self, first, end):
+        if first >= end:
+            return b""
+
+        start = self.frames[first].offset
+        last = self.frames[end - 1]
+        last_end = last.offset + last.size
+        return self.data[start:last_end]
+
+    def is_compatible(self, other):
+        return (
+            self.sample_rate == other.sample_rate
+            and self.channels == other.channels
+            and self.samples_per_frame == other.samples_per_frame
+        )
+
+    def replace(self, spans):
+        """Returns the bytes of the file with the frames replaced. spans is a
+        list of (first, end, bytes of the new frames) sorted and without
+        overlaps."""
+        parts = [self.data[: self.frames[0].offset]]
+        previous = 0
+        for first, end, frames in spans:
+            parts.append(self.get_frame_bytes(previous, first))
+            parts.append(frames)
+            previous = end
+
+        parts.append(self.get_frame_bytes(previous, len(self.frames)))
+        trailing = self.end  # e.g. an ID3v1 tag
+        parts.append(self.data[trailing:])
+        return b"".join(parts)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import os
+import uuid
+
+"""
+    A multipart/mixed response streamed from files, without building it in
+    memory or on disk. The files are measured first, so the length of each
+    part and of the whole response are known before it is sent.
+"""
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class Part:
+    def __init__(self, filename, headers, size=None):
+        self.filename = filename
+        self.headers = headers
+        self.size = os.path.getsize(filename) if size is None else size
+
+
+def get_boundary():
+    return uuid.uuid4().hex
+
+
+def get_content_type(boundary):
+    return f"multipart/mixed; boundary={boundary}"
+
+
+def _get_part_header(boundary, part):
+    headers = dict(part.headers)
+    headers["Content-Length"] = str(part.size)
+    lines = [f"--{boundary}"] + [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+
+
+def _get_end(boundary):
+    return f"--{boundary}--\r\n".encode("utf-8")
+
+
+def get_length(boundary, parts):
+    length = len(_get_end(boundary))
+    for part in parts:
+        length += len(_get_part_header(boundary, part)) + part.size + len(b"\r\n")
+
+    return length
+
+
+def stream_parts(boundary, parts, chunk_size=CHUNK_SIZE):
+    """Yields the response, raises OSError if a file changed after measuring it"""
+    for part in parts:
+        yield _get_part_header(boundary, part)
+        pending = part.size
+        with open(part.filename, "rb") as fh:
+            while pending > 0:
+                chunk = fh.read(min(chunk_size, pending))
+                if not chunk:
+                    raise OSError(f"{part.filename} is shorter than {part.size} bytes")
+
+                pending -= len(chunk)
+                yield chunk
+
+        yield b"\r\n"
+
+    yield _get_end(boundary)
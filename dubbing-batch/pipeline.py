@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import collections
+import logging
+import threading
+import time
+from workerpool import WorkerPool
+
+"""
+    Runs jobs through a sequence of stages. Every stage has its own queue and
+    pool of workers, so different stages of different jobs overlap (e.g. one
+    job is being published while the next one is being dubbed).
+
+    A stage function receives the job and returns True to pass it to the next
+    stage or False when the job has finished (e.g. it failed). If it raises,
+    the error callback (see set_on_error) cleans up after the job, which
+    finishes.
+"""
+
+
+class Stage:
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.pool = WorkerPool(workers)
+        self._pending = collections.deque()
+        # Reentrant since a job can finish while it is being dispatched
+        self._lock = threading.RLock()
+        self._busy_seconds = 0.0
+        self._processed = 0
+        self._started = time.time()
+        self._on_finished = None
+        self._on_error = None
+
+    def put(self, key, job):
+        with self._lock:
+            self._pending.append((key, job))
+
+        self._dispatch()
+
+    def _dispatch(self):
+        with self._lock:
+            while self._pending and self.pool.has_capacity():
+                key, job = self._pending.popleft()
+                future = self.pool.submit(key, self._run, key, job)
+                future.add_done_callback(lambda f: self._dispatch())
+
+    def _run(self, key, job):
+        start = time.time()
+        keep_going = False
+        try:
+            keep_going = self.fn(job)
+        except Exception as e:
+            logging.error(f"Stage.run. Job {key} failed in '{self.name}'. Error: {e}")
+            if self._on_error:
+                self._on_error(self, key, job)
+        finally:
+            with self._lock:
+                self._busy_seconds += time.time() - start
+                self._processed += 1
+
+            if self._on_finished:
+                self._on_finished(self, key, job, keep_going)
+
+    def get_stats(self):
+        with self._lock:
+            elapsed = max(time.time() - self._started, 1e-6)
+            return {
+                "queue": len(self._pending),
+                "running": self.pool.running(),
+                "workers": self.pool.workers,
+                "processed": self._processed,
+                "utilization": round(
+                    self._busy_seconds / (elapsed * self.pool.workers), 3
+                ),
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self._busy_seconds = 0.0
+            self._processed = 0
+            self._started = time.time()
+
+
+class Pipeline:
+    def __init__(self, stages, capacity):
+        """capacity is the number of jobs admitted that have not reached the last stage"""
+        self.stages = stages
+        self.capacity = capacity
+        self._admitted = set()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._on_done = None
+        self._on_error = None
+
+        for stage in stages:
+            stage._on_finished = self._finished
+            stage._on_error = self._failed
+
+    def set_on_done(self, callback):
+        self._on_done = callback
+
+    def set_on_error(self, callback):
+        """callback(stage_name, key, job) when a stage raises"""
+        self._on_error = callback
+
+    def _failed(self, stage, key, job):
+        if not self._on_error:
+            return
+
+        try:
+            self._on_error(stage.name, key, job)
+        except Exception as e:
+            logging.error(f"Pipeline._failed. Job {key}. Error: {e}")
+
+    def _finished(self, stage, key, job, keep_going):
+        idx = self.stages.index(stage)
+        if keep_going and idx + 1 < len(self.stages):
+            next_stage = self.stages[idx + 1]
+            # Jobs in the last stage do not use capacity, the next job can start
+            if next_stage is self.stages[-1]:
+                with self._lock:
+                    self._admitted.discard(key)
+
+                if self._on_done:
+                    self._on_done(key)
+
+            next_stage.put(key, job)
+            return
+
+        with self._lock:
+            self._admitted.discard(key)
+            self._in_flight.discard(key)
+
+        if self._on_done:
+            self._on_done(key)
+
+    def has_capacity(self):
+        with self._lock:
+            return len(self._admitted) < self.capacity
+
+    def is_running(self, key):
+        with self._lock:
+            return key in self._in_flight
+
+    def submit(self, key, job):
+        with self._lock:
+            if key in self._in_flight:
+                raise RuntimeError(f"Job {key} is already in the pipeline")
+            self._admitted.add(key)
+            self._in_flight.add(key)
+
+        self.stages[0].put(key, job)
+
+    def get_stats(self):
+        return {stage.name: stage.get_stats() for stage in self.stages}
+
+    def log_stats(self, reset=True):
+        for stage in self.stages:
+            stats = stage.get_stats()
+            logging.info(
+                f"Pipeline stage '{stage.name}': queue {stats['queue']}, running {stats['running']}/{stats['workers']}, "
+                f"processed {stats['processed']}, utilization {stats['utilization'] * 100:.1f}%"
+            )
+            if reset:
+                stage.reset_stats()
@@ -23,12 +23,29 @@ import time
 import logging
 import logging.handlers
 import os
-from batchfilesdb import BatchFilesDB
-from processedfiles import ProcessedFiles
-from sendmail import Sendmail
+from batchfilesdb import BatchFilesDB, get_lease_seconds
+from processedfiles import ProcessedFiles, RESULT_EXTENSIONS
+from sendmail import Sendmail, send_mail_create, send_mail_update
 from execution import Execution, Command
 from lockfile import LockFile
+from engine import Engine
+from pipeline import Pipeline, Stage
+from queuewatcher import QueueWatcher
+from contentindex import ContentIndex
+from stagecache import StageCache
+from scheduler import Scheduler
+from resources import ResourceGovernor
+import accounting
+from progress import get_progress_filename
+from incremental import CHANGES_FILE
+from estimator import DurationModel
+from expiry import ExpiryIndex
 import datetime
+import functools
+import socket
+import sqlite3
+import shutil
+import threading
 
 from usage import Usage
 
@@ -64,36 +81,90 @@ def _get_extension(original_filename):
     return file_extension
 
 
-def _get_threads():
-    return os.environ.get("THREADS", 4)
+# Threads per job, 0 splits the CPUs available to the container between the
+# jobs that run at the same time (not measured yet on a multi-core host, see
+# benchmarks/thread_split.py)
+def _get_threads() -> int:
+    return int(os.environ.get("THREADS", 4))
 
 
-def _get_timeout() -> int:
-    return int(os.environ.get("TIMEOUT_CMD", 60 * 90))
+# Pins each job to its own set of cores
+def _get_pin_cores() -> bool:
+    return os.environ.get("PIN_CORES", "0") == "1"
 
 
-def _send_mail_create(batchfile, inference_time, variant, source_file_base):
+def _get_workers() -> int:
+    return int(os.environ.get("WORKERS", 1))
 
-    text = f"Ja tenim el vostre fitxer '{batchfile.original_filename}' doblat amb la variant '{variant}'.\n"
-    text += f"El podeu baixar des de https://www.softcatala.org/doblatge/resultats/?uuid={source_file_base}&revision={batchfile.revision}\n"
-    text += "No compartiu aquesta adreça amb altres persones si no voleu que tinguin accés al fitxer."
 
-    if "@softcatala" in batchfile.email:
-        text += f"\nL'execució ha trigat {inference_time}."
+# Name of the processing directory where this container claims its records,
+# it has to be stable across restarts to recover them
+def _get_worker_id():
+    return os.environ.get("WORKER_ID", "") or socket.gethostname()
 
-    Sendmail().send(text, batchfile.email)
 
+# Cache of demucs, diarization and transcription outputs. It runs inside the
+# warm engine, since open-dubbing has to be in the same process to use it.
+def _get_stage_cache():
+    directory = os.environ.get("STAGE_CACHE_DIR", "")
+    if not directory:
+        return None
 
-def _send_mail_update(batchfile, inference_time, variant, source_file_base):
+    max_size = float(os.environ.get("STAGE_CACHE_MAX_GB", 20)) * 1024**3
+    return StageCache(directory, int(max_size))
 
-    text = f"Ja tenim actualizat amb els darrers canvis el vostre fitxer '{batchfile.original_filename}' doblat amb la variant '{variant}'.\n"
-    text += f"El podeu baixar des de https://www.softcatala.org/doblatge/resultats/?uuid={source_file_base}&revision={batchfile.revision}\n"
-    text += "No compartiu aquesta adreça amb altres persones si no voleu que tinguin accés al fitxer."
 
-    if "@softcatala" in batchfile.email:
-        text += f"\nL'execució ha trigat {inference_time}."
+# With ENGINE=warm the models are loaded once and shared by all the jobs
+def _get_engine(stage_cache, threads):
+    if os.environ.get("ENGINE", "") != "warm":
+        return None
 
-    Sendmail().send(text, batchfile.email)
+    engine = Engine(
+        device=os.environ.get("DEVICE", "cpu"),
+        whisper_model=Execution.WHISPER_MODEL,
+        threads=threads,
+        stage_cache=stage_cache,
+    )
+    try:
+        engine.load()
+    except Exception as e:
+        logging.error(f"Cannot load the warm engine, running open-dubbing per job: {e}")
+        return None
+
+    return engine
+
+
+# Jobs claimed and prepared in advance while all the dubbing workers are busy
+def _get_prefetch() -> int:
+    return int(os.environ.get("PIPELINE_PREFETCH", 0))
+
+
+def _get_notify_port() -> int:
+    return int(os.environ.get("NOTIFY_PORT", 0))
+
+
+# With events we only poll as a safety net in case one is lost. The leases of
+# the other workers are checked at least twice per lease.
+def _get_poll_interval(watcher) -> int:
+    if watcher.has_events():
+        return min(60 * 5, get_lease_seconds() // 2)
+
+    return min(30, get_lease_seconds() // 2)
+
+
+def _get_memory_limit() -> int:
+    MB_IN_BYTES = 1024 * 1024
+    return int(os.environ.get("MAX_JOB_MEMORY_MB", 0)) * MB_IN_BYTES
+
+
+# Seconds between samples of the resources used by a job, also how often the
+# memory limit is checked
+def _get_sample_seconds() -> float:
+    return float(os.environ.get("RESOURCES_SAMPLE_SECONDS", Command.SAMPLE_SECONDS))
+
+
+def _get_timeout() -> int:
+    return int(os.environ.get("TIMEOUT_CMD", 60 * 90))
 
 
 def _send_mail_error(batchfile, inference_time, source_file_base, message):
@@ -115,8 +186,6 @@ def _delete_record(db, batchfile, converted_audio):
         os.remove(converted_audio)
         logging.debug(f"Deleted {converted_audio}")
 
-    LockFile(batchfile.filename_dbrecord).delete()
-
 
 def _delete_record_keep_file(db, batchfile, converted_audio, processed):
     db.delete(batchfile.filename_dbrecord)
@@ -124,131 +193,452 @@ def _delete_record_keep_file(db, batchfile, converted_audio, processed):
     source_file = batchfile.filename
     extension = _get_extension(batchfile.original_filename)
     processed.move_file_bin(source_file, extension)
+    ExpiryIndex().add([f"{processed.uuid}{extension}", f"{processed.uuid}.resources"])
     logging.info(f"Kept file with error '{processed.uuid}{extension}'")
-    LockFile(batchfile.filename_dbrecord).delete()
 
 
-def main():
-    print("Process batch files to dubbing")
-    init_logging()
-    db = BatchFilesDB()
-    ProcessedFiles.ensure_dir()
-    purge_last_time = time.time()
-    PURGE_INTERVAL_SECONDS = 60 * 60 * 6  # For times per day
-    PURGE_OLDER_THAN_DAYS = 3
-    execution = Execution(_get_threads())
-
-    while True:
-        batchfiles = db.select()
-        for idx in range(len(batchfiles) - 1, -1, -1):
-            batchfile = batchfiles[idx]
-            if LockFile(batchfile.filename_dbrecord).has_lock():
-                batchfiles.remove(batchfile)
+# A stage raised (e.g. the disk is full). The record is not left claimed and
+# the output directory of the job is removed.
+def _fail_job(db, stage, key, job):
+    batchfile = job.batchfile
+    if not db.is_still_claimed(batchfile):
+        return  # Taken over by another worker, see _publish_job
+
+    output_directory = Execution.get_output_directory(batchfile.filename)
+    if _is_publishing(batchfile):
+        # The user was already notified, try to complete it. If it fails again
+        # the claim is completed when this worker restarts (see _recover_claims)
+        logging.info(f"Completing the publication of {batchfile.filename}")
+        _move_results(batchfile, job.processed, output_directory)
+        db.delete(batchfile.filename_dbrecord)
+        return
+
+    _delete_record_keep_file(db, batchfile, "", job.processed)
+    shutil.rmtree(output_directory, ignore_errors=True)
+    _send_mail_error(
+        batchfile,
+        "",
+        job.source_file_base,
+        "S'ha produït un error intern mentre es processava.",
+    )
+    Usage().log("dubbing_internal_error")
 
-        if len(batchfiles) > 0:
-            batchfile = batchfiles[0]
-            if not LockFile(batchfile.filename_dbrecord).create():
-                time.sleep(5)
-                continue
 
-            source_file = batchfile.filename
+class Job:
+    def __init__(self, batchfile, pending):
+        self.batchfile = batchfile
+        self.pending = pending
+        self.source_file_base = os.path.basename(batchfile.filename)
+        self.processed = ProcessedFiles(self.source_file_base)
+        self.timeout = _get_timeout()
+        self.inference = None
 
-            logging.info(
-                f"Processing: {source_file} - for {batchfile.email} - pending {len(batchfiles)}"
-            )
 
-            source_file_base = os.path.basename(source_file)
-            processed = ProcessedFiles(source_file_base)
+def _prepare_job(execution, job):
+    execution.prepare_inference(job.batchfile.filename)
+    return True
 
-            timeout = _get_timeout()
 
-            source_file = batchfile.filename
+def _dub_job(execution, job):
+    batchfile = job.batchfile
+    logging.info(
+        f"Processing: {batchfile.filename} - for {batchfile.email} - pending {job.pending}"
+    )
 
-            (
+    job.inference = execution.run_inference(
+        batchfile.filename,
+        job.timeout,
+        batchfile.variant,
+        batchfile.video_lang,
+        batchfile.operation,
+        batchfile.original_subtitles,
+        batchfile.dubbed_subtitles,
+    )
+    return True
+
+
+def _get_resources_log():
+    return os.path.join(os.environ.get("LOGDIR", ""), "resources.jsonl")
+
+
+# Next to the processed outputs and in a log shared by the workers
+def _save_resources(job, result, resources):
+    if not resources:
+        return
+
+    batchfile = job.batchfile
+    record = {
+        "uuid": job.source_file_base,
+        "time": time.time(),
+        "operation": batchfile.operation,
+        "video_lang": batchfile.video_lang,
+        "variant": batchfile.variant,
+        "video_seconds": batchfile.duration / 1000,
+        "result": result,
+    }
+    record.update(resources)
+    try:
+        filename = os.path.join(
+            ProcessedFiles.get_processed_directory(),
+            f"{job.source_file_base}.resources",
+        )
+        accounting.save(filename, record)
+        accounting.append(_get_resources_log(), record)
+        _learn_durations([record])
+    except OSError as e:
+        logging.error(f"_save_resources. Error: {e}")
+
+
+# The processing times of the finished jobs are used to estimate when the
+# queued ones will be ready (see estimator.py)
+def _learn_durations(records):
+    samples = [
+        (
+            record["operation"],
+            record.get("video_lang", ""),
+            record["variant"],
+            record["video_seconds"],
+            record["seconds"],
+        )
+        for record in records
+        if record["result"] == Command.NO_ERROR and record["video_seconds"]
+    ]
+    if samples:
+        DurationModel().add(samples)
+
+
+def _publish_job(db, execution, job):
+    batchfile = job.batchfile
+    source_file_base = job.source_file_base
+    processed = job.processed
+    timeout = job.timeout
+
+    (
+        inference_time,
+        result,
+        output_filename,
+        output_directory,
+        cat_subtitles,
+        log_filename,
+        resources,
+    ) = job.inference
+
+    _save_resources(job, result, resources)
+
+    # The lease expired while it was processed (e.g. the worker stalled) and
+    # another worker took over the claim, the results are not published
+    if not db.is_still_claimed(batchfile):
+        logging.error(f"_publish_job. The claim of {batchfile.filename} was lost")
+        return False
+
+    if result == Command.TIMEOUT_ERROR:
+        _delete_record_keep_file(db, batchfile, output_filename, processed)
+        minutes = int(timeout / 60)
+        msg = f"Ha trigat massa temps en processar-se. Aturem l'operació després de {minutes} minuts de processament."
+        Usage().log("dubbing_timeout")
+        _send_mail_error(batchfile, inference_time, source_file_base, msg)
+        return False
+
+    if result == Command.MEMORY_ERROR:
+        _delete_record_keep_file(db, batchfile, output_filename, processed)
+        msg = "Ha necessitat més memòria de la que tenim disponible per a cada fitxer. Aturem l'operació."
+        Usage().log("dubbing_memory_limit")
+        _send_mail_error(batchfile, inference_time, source_file_base, msg)
+        return False
+
+    if batchfile.video_lang == "auto":
+        if result > 100 and result < 105:
+            _delete_record(db, batchfile, output_filename)
+            _send_mail_error(
+                batchfile,
                 inference_time,
-                result,
-                output_filename,
-                output_directory,
-                cat_subtitles,
-                log_filename,
-            ) = execution.run_inference(
-                source_file,
-                timeout,
-                batchfile.variant,
-                batchfile.video_lang,
-                batchfile.operation,
-                batchfile.original_subtitles,
-                batchfile.dubbed_subtitles,
+                source_file_base,
+                "Heu escollit detecció automàtica de l'idioma però l'idioma identificat no està suportat. Torneu a enviar el vídeo i indiqueu si està en anglès o castellà.",
             )
+            Usage().log("dubbing_not_supported_language")
+            return False
+
+    if result != Command.NO_ERROR:
+        _delete_record_keep_file(db, batchfile, output_filename, processed)
+        _send_mail_error(
+            batchfile,
+            inference_time,
+            source_file_base,
+            "Reviseu que sigui un vídeo vàlid.",
+        )
+        Usage().log("dubbing_returns_error")
+        return False
+
+    variant = execution.get_full_variant(batchfile.variant)
+
+    if batchfile.operation == "update":
+        send_mail_update(batchfile, inference_time, variant, source_file_base)
+    else:
+        send_mail_create(batchfile, inference_time, variant, source_file_base)
+
+    logging.info(f"File for {batchfile.email} completed in {inference_time}")
+
+    # The claimed record is deleted last, if the worker dies while moving the
+    # results another one completes it (see _recover_claims)
+    processed.copy_file_bin(batchfile.filename_dbrecord, ".dbrecord")
+    _move_results(batchfile, processed, output_directory)
+    db.delete(batchfile.filename_dbrecord)
+    return False
 
-            if result == Command.TIMEOUT_ERROR:
-                _delete_record_keep_file(db, batchfile, output_filename, processed)
-                minutes = int(timeout / 60)
-                msg = f"Ha trigat massa temps en processar-se. Aturem l'operació després de {minutes} minuts de processament."
-                Usage().log("dubbing_timeout")
-                _send_mail_error(batchfile, inference_time, source_file_base, msg)
-                continue
 
-            if batchfile.video_lang == "auto":
-                if result > 100 and result < 105:
-                    _delete_record(db, batchfile, output_filename)
-                    _send_mail_error(
-                        batchfile,
-                        inference_time,
-                        source_file_base,
-                        "Heu escollit detecció automàtica de l'idioma però l'idioma identificat no està suportat. Torneu a enviar el vídeo i indiqueu si està en anglès o castellà.",
-                    )
-                    Usage().log("dubbing_not_supported_language")
-                    continue
-
-            if result != Command.NO_ERROR:
-                _delete_record_keep_file(db, batchfile, output_filename, processed)
-                _send_mail_error(
-                    batchfile,
-                    inference_time,
-                    source_file_base,
-                    "Reviseu que sigui un vídeo vàlid.",
+# Can be called again if it was interrupted, it moves what is left
+def _move_results(batchfile, processed, output_directory):
+    source_file = batchfile.filename
+    source_file_base = os.path.basename(source_file)
+    extension = _get_extension(batchfile.original_filename)
+    output_filename, cat_subtitles, log_filename = Execution.get_output_files(
+        output_directory
+    )
+
+    if os.path.exists(output_filename):
+        processed.move_file_bin(output_filename, ".dub")
+
+    if os.path.exists(cat_subtitles):
+        processed.copy_file_bin(
+            cat_subtitles, ".srt"
+        )  # to be remove when API moves to the new endpoint
+
+    if os.path.exists(log_filename):
+        processed.move_file_bin(log_filename, ".log")
+
+    if os.path.exists(source_file):
+        processed.move_file_bin(source_file, extension)
+
+    extensions = RESULT_EXTENSIONS + [extension, ".dbrecord"]
+    names = [f"{source_file_base}{ext}" for ext in extensions]
+    moved = os.path.exists(output_directory)
+    if moved:
+        # Only meaningful while the job runs
+        progress_filename = get_progress_filename(output_directory)
+        if os.path.exists(progress_filename):
+            os.remove(progress_filename)
+
+        # Consumed by the warm engine, open-dubbing run per job ignores it
+        changes_filename = os.path.join(output_directory, CHANGES_FILE)
+        if os.path.exists(changes_filename):
+            os.remove(changes_filename)
+
+        if batchfile.operation == "create" and os.environ.get("KEEP_FILES", 0) == 0:
+            files = ProcessedFiles._find_files(output_directory, "chunk*")
+            for file in files:
+                os.remove(file)
+
+            logging.info(f"Deleted unnecessary {len(files)} files in output directory")
+
+        processed.move_output_dir(output_directory)
+
+    # Once all the results are in place (see catalog.py)
+    ExpiryIndex().add(names + [f"{source_file_base}_output"])
+
+    if moved and batchfile.operation == "create":
+        try:
+            filename = ContentIndex().put(batchfile, source_file_base)
+            if filename:
+                processed_dir = ProcessedFiles.get_processed_directory()
+                ExpiryIndex().add([os.path.relpath(filename, processed_dir)])
+        except Exception as e:
+            logging.error(f"_move_results. Cannot index {source_file_base}. Error: {e}")
+
+
+def _is_publishing(batchfile):
+    source_file_base = os.path.basename(batchfile.filename)
+    db = BatchFilesDB(ProcessedFiles.get_processed_directory(), backend="files")
+    record = db._read_record_from_uuid(source_file_base)
+    return record is not None and record.revision == batchfile.revision
+
+
+# The job is processed again from the start, the outputs of the previous run
+# could be mixed with the new ones. Updates start from the published outputs.
+def _reset_output_directory(batchfile):
+    output_directory = Execution.get_output_directory(batchfile.filename)
+    shutil.rmtree(output_directory, ignore_errors=True)
+    if batchfile.operation == "update":
+        processed = ProcessedFiles(os.path.basename(batchfile.filename))
+        try:
+            processed.copy_output_dir_to(output_directory)
+        except OSError as e:
+            logging.error(f"_reset_output_directory. Error: {e}")
+
+
+# Takes over the claims (of a dead worker or of this one before a restart).
+# If the results were being moved it completes it, otherwise the job goes
+# back to the queue to be processed again.
+def _recover_claims(db, worker_id, batchfiles):
+    for batchfile in batchfiles:
+        if not db.claim(batchfile, worker_id):
+            continue  # Recovered by another worker
+
+        if _is_publishing(batchfile):
+            logging.info(f"Completing the publication of {batchfile.filename}")
+            processed = ProcessedFiles(os.path.basename(batchfile.filename))
+            output_directory = Execution.get_output_directory(batchfile.filename)
+            _move_results(batchfile, processed, output_directory)
+            db.delete(batchfile.filename_dbrecord)
+        else:
+            logging.info(f"Releasing {batchfile.filename_dbrecord} to the queue")
+            _reset_output_directory(batchfile)
+            db.release(batchfile)
+
+
+def _get_lease(db, worker):
+    return LockFile(db.get_processing_dir(worker), get_lease_seconds())
+
+
+def _get_expired_claims(db, worker_id):
+    batchfiles = []
+    for worker in db.get_workers():
+        if worker == worker_id or _get_lease(db, worker).has_lock():
+            continue
+
+        batchfiles += db.get_claimed(worker)
+
+    return batchfiles
+
+
+# In the background, a few entries at a time, it does not delay the jobs
+def _purge_expired(index):
+    PURGE_ENTRIES = 100
+    PURGE_PAUSE_SECONDS = 1
+    PURGE_IDLE_SECONDS = 60 * 5
+    while True:
+        try:
+            if not index.is_created():
+                added = index.rebuild()
+                logging.info(
+                    f"_purge_expired. Added {added} existing files to the index"
                 )
-                Usage().log("dubbing_returns_error")
-                continue
 
-            extension = _get_extension(batchfile.original_filename)
-            variant = execution.get_full_variant(batchfile.variant)
+            if not index.stats.is_created():
+                index.stats.rebuild(index.processed, index.scan())
 
-            if batchfile.operation == "update":
-                _send_mail_update(batchfile, inference_time, variant, source_file_base)
-            else:
-                _send_mail_create(batchfile, inference_time, variant, source_file_base)
+            if not index.catalog.is_created():
+                index.catalog.rebuild(index.processed, index.scan())
 
-            logging.info(f"File for {batchfile.email} completed in {inference_time}")
+            purged = index.purge(PURGE_ENTRIES)
+            if purged:
+                logging.info(
+                    f"Purging {datetime.datetime.now()}, {purged} files deleted"
+                )
 
-            processed.move_file(batchfile.filename_dbrecord)
-            processed.move_file_bin(output_filename, ".dub")
-            processed.copy_file_bin(
-                cat_subtitles, ".srt"
-            )  # to be remove when API moves to the new endpoint
-            processed.move_file_bin(log_filename, ".log")
-            processed.move_file_bin(source_file, extension)
+            due = index.has_due()
+        except (OSError, sqlite3.Error) as e:
+            logging.error(f"_purge_expired. Error: {e}")
+            due = False
 
-            if batchfile.operation == "create" and os.environ.get("KEEP_FILES", 0) == 0:
-                files = ProcessedFiles._find_files(output_directory, "chunk*")
-                for file in files:
-                    os.remove(file)
+        time.sleep(PURGE_PAUSE_SECONDS if due else PURGE_IDLE_SECONDS)
 
-                logging.info(
-                    f"Deleted unnecessary {len(files)} files in output directory"
-                )
 
-            processed.move_output_dir(output_directory)
-            LockFile(batchfile.filename_dbrecord).delete()
+def _renew_lease(lease):
+    while True:
+        try:
+            lease.renew()
+        except OSError as e:
+            logging.error(f"_renew_lease. Error: {e}")
 
-        now = time.time()
-        if now > purge_last_time + PURGE_INTERVAL_SECONDS:
-            purge_last_time = now
-            purged = ProcessedFiles.purge_files(PURGE_OLDER_THAN_DAYS)
-            logging.info(f"Purging {datetime.datetime.now()}, {purged} files deleted")
+        time.sleep(lease.max_age / 4)
+
+
+# Audio extraction, ASR, translation, TTS and muxing run inside open-dubbing
+# as a single step. The stages that process-batch controls are the
+# preparation of the input, the dubbing itself and the publication of the
+# results, which overlap across jobs.
+def _get_pipeline(db, execution):
+    workers = _get_workers()
+    stages = [
+        Stage("prepare", functools.partial(_prepare_job, execution)),
+        Stage("dubbing", functools.partial(_dub_job, execution), workers),
+        Stage("publish", functools.partial(_publish_job, db, execution)),
+    ]
+    return Pipeline(stages, capacity=workers + _get_prefetch())
+
+
+def main():
+    print("Process batch files to dubbing")
+    init_logging()
+    db = BatchFilesDB()
+    # Records created or removed while no index was kept
+    db.rebuild_index()
+    ProcessedFiles.ensure_dir()
+    if DurationModel().is_empty():
+        _learn_durations(accounting.read(_get_resources_log()))
+
+    worker_id = _get_worker_id()
+    # Claimed by this worker before a restart, they were not finished
+    _recover_claims(db, worker_id, db.get_claimed(worker_id))
+    lease = _get_lease(db, worker_id)
+    lease.renew()
+    threading.Thread(target=_renew_lease, args=(lease,), daemon=True).start()
+    recover_last_time = 0
+    threading.Thread(target=_purge_expired, args=(ExpiryIndex(),), daemon=True).start()
+    stage_cache = _get_stage_cache()
+    governor = ResourceGovernor(_get_workers(), _get_threads(), _get_pin_cores())
+    governor.log()
+    engine = _get_engine(stage_cache, governor.threads)
+    execution = Execution(
+        governor.threads,
+        _get_memory_limit(),
+        engine,
+        governor,
+        sample_seconds=_get_sample_seconds(),
+    )
+    pipeline = _get_pipeline(db, execution)
+    watcher = QueueWatcher(db.ENTRIES, _get_notify_port())
+    pipeline.set_on_done(lambda key: watcher.notify())
+    pipeline.set_on_error(functools.partial(_fail_job, db))
+    stats_last_time = time.time()
+    STATS_INTERVAL_SECONDS = 60 * 10
+    resources_log = accounting.ResourcesLog(_get_resources_log())
+    scheduler = Scheduler.from_environment()
+    logging.info(
+        f"Worker '{worker_id}' running {_get_workers()} jobs at once with {execution.threads} threads each, scheduler '{scheduler.policy}'"
+    )
+
+    while True:
+        if time.time() > recover_last_time + lease.max_age / 2:
+            recover_last_time = time.time()
+            _recover_claims(db, worker_id, _get_expired_claims(db, worker_id))
 
-        time.sleep(30)
+        batchfiles = []
+        if pipeline.has_capacity():
+            batchfiles = db.select()
+
+        for idx in range(len(batchfiles) - 1, -1, -1):
+            batchfile = batchfiles[idx]
+            _uuid = os.path.basename(batchfile.filename)
+            if pipeline.is_running(_uuid):
+                batchfiles.remove(batchfile)
+            elif db.is_claimed(batchfile):
+                batchfiles.remove(batchfile)
+
+        batchfiles = scheduler.order(batchfiles)
+        for batchfile in batchfiles:
+            if not pipeline.has_capacity():
+                break
+
+            # Another worker claimed it, try the next one
+            if not db.claim(batchfile, worker_id):
+                continue
+
+            _uuid = os.path.basename(batchfile.filename)
+            pending = len(batchfiles)
+            pipeline.submit(_uuid, Job(batchfile, pending))
+            scheduler.started(batchfile)
+
+        now = time.time()
+        if now > stats_last_time + STATS_INTERVAL_SECONDS:
+            # Jobs of the last day, by all the workers
+            resources_log.log_summary(now - 60 * 60 * 24)
+            stats_last_time = now
+            pipeline.log_stats()
+            if stage_cache:
+                stage_cache.log_stats()
+
+        watcher.wait(_get_poll_interval(watcher))
 
 
 if __name__ == "__main__":
@@ -21,11 +21,27 @@ import os
 import logging
 import shutil
 import uuid
-import time
 import fnmatch
+import fastcopy
 
 PROCESSED = "/srv/data/processed"
 
+# Results published by process-batch next to the original video (<uuid><extension>)
+RESULT_EXTENSIONS = [".dub", ".srt", ".log", ".resources"]
+
+# Files in the output directory that open-dubbing writes once (preprocessing)
+# and never modifies in place, they can be shared using hardlinks
+READ_ONLY_OUTPUTS = [
+    "original.mp4",
+    "original_video.mp4",
+    "original_audio.mp3",
+    "htdemucs/*",
+]
+
+
+def _is_read_only_output(relative_path):
+    return any(fnmatch.fnmatch(relative_path, pattern) for pattern in READ_ONLY_OUTPUTS)
+
 
 class ProcessedFiles:
     def __init__(self, uuid):
@@ -78,12 +94,13 @@ class ProcessedFiles:
     def copy_file(self, full_filename):
         filename = os.path.basename(full_filename)
         target = os.path.join(PROCESSED, filename)
-        shutil.copy(full_filename, target)
+        fastcopy.copy_file(full_filename, target)
         logging.debug(f"Copy file {full_filename} to {target}")
 
     def copy_file_bin(self, full_filename, extension):
         target = os.path.join(PROCESSED, f"{self.uuid}{extension}")
-        shutil.copy(full_filename, target)
+        # The source is never modified in place, written again as a new file
+        fastcopy.copy_file(full_filename, target, allow_link=True)
 
         logging.debug(f"Copied file {full_filename} to {target}")
 
@@ -91,12 +108,12 @@ class ProcessedFiles:
         filename = os.path.basename(full_filename)
         ext = self._get_extension(filename)
         target = os.path.join(PROCESSED, f"{self.uuid}{ext}")
-        shutil.move(full_filename, target)
+        fastcopy.move_file(full_filename, target)
         logging.debug(f"Moved file {full_filename} to {target}")
 
     def move_file_bin(self, full_filename, extension):
         target = os.path.join(PROCESSED, f"{self.uuid}{extension}")
-        shutil.move(full_filename, target)
+        fastcopy.move_file(full_filename, target)
 
         logging.debug(f"Moved file {full_filename} to {target}")
 
@@ -106,25 +123,59 @@ class ProcessedFiles:
         if os.path.exists(target):
             shutil.rmtree(target)
 
-        shutil.move(full_dir, target)
+        fastcopy.move_dir(full_dir, target)
 
         logging.debug(f"Moved directory {full_dir} to {target}")
 
     def copy_file_to(self, source, target):
         filename = os.path.basename(source)
         source = os.path.join(PROCESSED, filename)
-        shutil.copy(source, target)
+        # The video is only read by open-dubbing and replaced when published
+        fastcopy.copy_file(source, target, allow_link=True)
         logging.info(f"Copy file {source} to {target}")
 
     def copy_output_dir_to(self, target):
         source = os.path.join(PROCESSED, f"{self.uuid}_output")
         os.makedirs(os.path.dirname(target), exist_ok=True)
-        shutil.copytree(
-            source, target, dirs_exist_ok=True
-        )  # Set `dirs_exist_ok` to True for overwriting if necessary
+        # Files that open-dubbing rewrites during an update are cloned or copied
+        fastcopy.copy_tree(source, target, can_link=_is_read_only_output)
 
         logging.info(f"Copy directory {source} to {target}")
 
+    def copy_to_uuid(self, new_uuid, video_extension):
+        """Makes the results of this uuid available as new_uuid (without the dbrecord)
+
+        video_extension is the one of the original video (as published by
+        process-batch). Returns the names of the copies in the processed directory"""
+        names = [f"{new_uuid}_output"]
+        for extension in RESULT_EXTENSIONS + [video_extension]:
+            # Published files are replaced, never modified in place
+            try:
+                fastcopy.copy_file(
+                    os.path.join(PROCESSED, f"{self.uuid}{extension}"),
+                    os.path.join(PROCESSED, f"{new_uuid}{extension}"),
+                    allow_link=True,
+                )
+            except FileNotFoundError:
+                continue  # e.g. no .resources for the results of old versions
+
+            names.append(f"{new_uuid}{extension}")
+
+        source = os.path.join(PROCESSED, f"{self.uuid}_output")
+        target = os.path.join(PROCESSED, f"{new_uuid}_output")
+        fastcopy.copy_tree(source, target, can_link=_is_read_only_output)
+
+        # The utterances metadata has absolute paths that include the uuid
+        for filename in ProcessedFiles._find_files(target, "*.json"):
+            with open(filename, "r") as fh:
+                content = fh.read()
+
+            with open(filename, "w") as fh:
+                fh.write(content.replace(self.uuid, new_uuid))
+
+        logging.info(f"Copied results of {self.uuid} to {new_uuid}")
+        return names
+
     def _find_files(directory, pattern):
         filelist = []
 
@@ -136,13 +187,6 @@ class ProcessedFiles:
 
         return filelist
 
-    def _find_dirs(directory):
-        return [
-            os.path.abspath(os.path.join(directory, name))
-            for name in os.listdir(directory)
-            if os.path.isdir(os.path.join(directory, name))
-        ]
-
     def get_num_of_files_stored(directory=PROCESSED):
         files = ProcessedFiles._find_files(directory, "*")
         return len(files)
@@ -171,33 +215,3 @@ class ProcessedFiles:
         # Available blocks * block size gives the available space in bytes
         free_space_bytes = statvfs.f_frsize * statvfs.f_bavail
         return ProcessedFiles._get_human_readable_size(free_space_bytes)
-
-    def purge_files(days, directory=PROCESSED):
-        HOURS_DAY = 24
-        MINUTES_HOUR = 60
-        MINUTES_SEC = 60
-        deleted = 0
-
-        files = ProcessedFiles._find_files(directory, "*")
-        time_limit = time.time() - (HOURS_DAY * MINUTES_HOUR * MINUTES_SEC * days)
-        for file in files:
-            try:
-                file_time = os.stat(file).st_mtime
-                if file_time < time_limit:
-                    os.remove(file)
-                    logging.debug(f"Deleted file: {file}")
-                    deleted += 1
-            except Exception as e:
-                logging.error(f"purge_files. Error deleting file {file}: {e}")
-
-        for dir in ProcessedFiles._find_dirs(directory):
-            try:
-                dir_time = os.stat(dir).st_mtime
-                if dir_time < time_limit:
-                    shutil.rmtree(dir)
-                    logging.debug(f"Deleted dir: {dir}")
-                    deleted += 1
-            except Exception as e:
-                logging.error(f"purge_files. Error deleting file {dir}: {e}")
-
-        return deleted
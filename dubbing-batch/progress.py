@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import json
+import logging
+import os
+import time
+
+"""
+    Progress of a running job. The output of open-dubbing (stdout and
+    stderr) goes to its own log in the output directory of the job, which
+    is parsed incrementally while the job runs looking for the lines that
+    open-dubbing logs when it completes a stage.
+
+    The current stage, the percentage (the weight of the completed stages)
+    and when they started are saved in progress.json, in the output
+    directory, which dubbing-service reads.
+"""
+
+LOG_FILE = "dubbing.log"
+PROGRESS_FILE = "progress.json"
+
+# Approximate share of the time of each stage
+STAGES = {
+    "create": [
+        ("preprocessing", 25),
+        ("speech_to_text", 25),
+        ("translation", 5),
+        ("text_to_speech", 30),
+        ("postprocessing", 15),
+    ],
+    "update": [
+        ("text_to_speech", 70),
+        ("postprocessing", 30),
+    ],
+}
+
+MARKERS = {
+    "Completed task 'Preprocessing completed'": "preprocessing",
+    "Completed task 'Speech to text completed'": "speech_to_text",
+    "Completed task 'Translation completed'": "translation",
+    "Completed task 'Text to speech completed'": "text_to_speech",
+    "Completed task 'Post processing completed'": "postprocessing",
+}
+
+FINISHED = "finished"
+
+
+def get_progress_filename(output_directory):
+    return os.path.join(output_directory, PROGRESS_FILE)
+
+
+def read_progress(filename):
+    try:
+        with open(filename, "r") as fh:
+            progress = json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    now = time.time()
+    progress["elapsed"] = int(now - progress["started"])
+    progress["stage_elapsed"] = int(now - progress["stage_started"])
+    return progress
+
+
+class ProgressTracker:
+    def __init__(self, log_filename, progress_filename, operation="create"):
+        self.log_filename = log_filename
+        self.progress_filename = progress_filename
+        self.stages = STAGES.get(operation, STAGES["create"])
+        self.completed = []
+        self.started = time.time()
+        self.stage_started = self.started
+        self._partial = b""
+        # An update appends to the log of the previous execution
+        try:
+            self._offset = os.path.getsize(log_filename)
+        except OSError:
+            self._offset = 0
+
+        self._save()
+
+    def get_stage(self):
+        for stage, _ in self.stages:
+            if stage not in self.completed:
+                return stage
+
+        return FINISHED
+
+    def get_percentage(self):
+        return sum(weight for stage, weight in self.stages if stage in self.completed)
+
+    def update(self):
+        try:
+            with open(self.log_filename, "rb") as fh:
+                fh.seek(self._offset)
+                data = fh.read()
+        except FileNotFoundError:
+            return
+
+        self._offset += len(data)
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+
+        stages = [stage for stage, _ in self.stages]
+        changed = False
+        for line in lines:
+            line = line.decode("utf-8", errors="replace")
+            for marker, stage in MARKERS.items():
+                if marker in line and stage in stages and stage not in self.completed:
+                    self.completed.append(stage)
+                    changed = True
+
+        if changed:
+            self.stage_started = time.time()
+            self._save()
+
+    def _save(self):
+        progress = {
+            "stage": self.get_stage(),
+            "percentage": self.get_percentage(),
+            "started": self.started,
+            "stage_started": self.stage_started,
+        }
+        tmp_filename = self.progress_filename + ".tmp"
+        try:
+            with open(tmp_filename, "w") as fh:
+                json.dump(progress, fh)
+
+            os.replace(tmp_filename, self.progress_filename)
+        except OSError as e:
+            logging.error(f"ProgressTracker._save. Error: {e}")
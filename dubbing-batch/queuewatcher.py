@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import socket
+
+"""
+    Waits until there is something new in the queue. The batch process is
+    woken up by any of these sources:
+        - inotify events on the entries directory (Linux only)
+        - a UDP datagram sent by dubbing-service after creating a record
+        - notify() called from the same process (e.g. when a job finishes)
+    If none of them is available it behaves as a plain sleep (polling).
+"""
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+NOTIFY_MESSAGE = b"queue"
+
+
+class QueueWatcher:
+    def __init__(self, directory, port=0):
+        self.directory = directory
+        self._inotify_fd = None
+        self._socket = None
+        self._pipe_read, self._pipe_write = os.pipe()
+        os.set_blocking(self._pipe_read, False)
+        os.set_blocking(self._pipe_write, False)
+
+        try:
+            self._inotify_fd = self._init_inotify(directory)
+        except Exception as e:
+            logging.info(f"QueueWatcher. inotify not available, polling: {e}")
+
+        if port:
+            try:
+                self._socket = self._init_socket(port)
+            except Exception as e:
+                logging.error(f"QueueWatcher. Cannot listen on UDP port {port}: {e}")
+
+    def _init_inotify(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO
+        if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+        return fd
+
+    def _init_socket(self, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("", port))
+        sock.setblocking(False)
+        return sock
+
+    def has_events(self):
+        return self._inotify_fd is not None or self._socket is not None
+
+    def _drain(self, fd):
+        try:
+            while os.read(fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _drain_socket(self):
+        try:
+            while True:
+                self._socket.recvfrom(64)
+        except BlockingIOError:
+            pass
+
+    def notify(self):
+        try:
+            os.write(self._pipe_write, b"x")
+        except BlockingIOError:
+            pass  # Pipe full, there is already a pending wakeup
+
+    def wait(self, timeout):
+        """Returns True if woken up by an event, False if the timeout expired"""
+        fds = [self._pipe_read]
+        if self._inotify_fd is not None:
+            fds.append(self._inotify_fd)
+        if self._socket is not None:
+            fds.append(self._socket)
+
+        ready, _, _ = select.select(fds, [], [], timeout)
+        for fd in ready:
+            if fd is self._socket:
+                self._drain_socket()
+            else:
+                self._drain(fd)
+
+        return len(ready) > 0
+
+    def close(self):
+        for fd in [self._inotify_fd, self._pipe_read, self._pipe_write]:
+            if fd is not None:
+                os.close(fd)
+
+        if self._socket is not None:
+            self._socket.close()
+
+    @staticmethod
+    def notify_hosts(hosts=None):
+        """Sends a wakeup to a comma separated list of host:port"""
+        if hosts is None:
+            hosts = os.environ.get("BATCH_NOTIFY_HOSTS", "")
+
+        if not hosts:
+            return
+
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for host in hosts.split(","):
+                try:
+                    name, port = host.strip().rsplit(":", 1)
+                    sock.sendto(NOTIFY_MESSAGE, (name, int(port)))
+                except Exception as e:
+                    logging.debug(f"QueueWatcher.notify_hosts. Error on {host}: {e}")
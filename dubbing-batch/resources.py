@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import logging
+import math
+import os
+import threading
+
+"""
+    Splits the CPUs available to the container between the jobs that run
+    at the same time, so several workers (or containers) sharing a host do
+    not oversubscribe it:
+        - the available CPUs are the affinity of the process limited by the
+          cgroup CPU quota (docker --cpus)
+        - each job gets a budget of threads, exported to the libraries that
+          read it from the environment (OpenMP, MKL, OpenBLAS) and passed to
+          CTranslate2 with --cpu_threads
+        - optionally each job is pinned to its own set of cores
+"""
+
+THREAD_VARIABLES = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+
+
+def _read_cgroup_quota(root="/sys/fs/cgroup"):
+    """Returns the CPU quota of the cgroup (e.g. 2.5) or None if unlimited"""
+    try:
+        # cgroup v2, e.g. "250000 100000" or "max 100000"
+        with open(os.path.join(root, "cpu.max"), "r") as fh:
+            quota, period = fh.read().split()[:2]
+
+        if quota == "max":
+            return None
+
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+
+    try:
+        # cgroup v1
+        with open(os.path.join(root, "cpu", "cpu.cfs_quota_us"), "r") as fh:
+            quota = int(fh.read())
+        with open(os.path.join(root, "cpu", "cpu.cfs_period_us"), "r") as fh:
+            period = int(fh.read())
+
+        if quota <= 0:
+            return None
+
+        return quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def get_affinity():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on this platform
+        return list(range(os.cpu_count() or 1))
+
+
+def get_available_cpus(cgroup_root="/sys/fs/cgroup"):
+    cpus = len(get_affinity())
+    quota = _read_cgroup_quota(cgroup_root)
+    if quota:
+        cpus = min(cpus, math.ceil(quota))
+
+    return max(cpus, 1)
+
+
+class ResourceGovernor:
+    def __init__(self, workers, threads=0, pin=False, cpus=None):
+        """threads per job, 0 splits the available CPUs between the workers"""
+        self.workers = max(workers, 1)
+        available = get_available_cpus() if cpus is None else cpus
+        self.threads = threads or max(available // self.workers, 1)
+        self.pin = pin
+        self._lock = threading.Lock()
+        self._free = self._get_core_sets() if pin else []
+
+    def _get_core_sets(self):
+        cores = get_affinity()
+        if self.threads * self.workers > len(cores):
+            logging.error(
+                f"ResourceGovernor. Cannot pin {self.workers} jobs of {self.threads} threads to {len(cores)} cores"
+            )
+            self.pin = False
+            return []
+
+        core_sets = []
+        for slot in range(self.workers):
+            start = slot * self.threads
+            end = start + self.threads
+            core_sets.append(set(cores[start:end]))
+
+        return core_sets
+
+    def acquire(self):
+        """Returns the cores for a job (None if not pinned), release them after"""
+        if not self.pin:
+            return None
+
+        with self._lock:
+            if not self._free:
+                return None  # More jobs than workers, runs unpinned
+
+            return self._free.pop(0)
+
+    def release(self, cores):
+        if not cores:
+            return
+
+        with self._lock:
+            self._free.append(cores)
+
+    def log(self):
+        quota = _read_cgroup_quota()
+        logging.info(
+            f"ResourceGovernor. {get_available_cpus()} CPUs available (affinity {len(get_affinity())}, quota {quota}), "
+            f"{self.workers} jobs of {self.threads} threads, pinned {self.pin}"
+        )
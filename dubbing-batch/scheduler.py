@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import logging
+import os
+import time
+
+"""
+    Decides the order in which the queued records are processed. Every
+    record gets a score in seconds and the lowest goes first:
+        - fifo: the oldest record first (the previous behaviour)
+        - sjf: shortest job first, using the duration of the video
+        - fair: fair share across the users (emails), the users that have
+          recently used less processing time go first. The usage decays
+          with a half-life, so it is forgotten after a while
+
+    With the fast lane, updates of an already dubbed video (which only
+    synthesize the edited utterances) are moved ahead. In all the policies
+    the score decreases with the time waited (aging), so no job starves.
+"""
+
+POLICIES = ["fifo", "sjf", "fair"]
+
+
+class Scheduler:
+    # Duration assumed for records without it (e.g. created before storing it)
+    DEFAULT_DURATION = 10 * 60
+    FAIR_SHARE_HALF_LIFE = 60 * 60
+    FAST_LANE_SECONDS = 60 * 60
+
+    def __init__(self, policy="fifo", fast_lane=False, aging=1.0, get_enqueued=None):
+        """aging is the priority (in seconds) gained for each second waited"""
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduler policy '{policy}'")
+
+        self.policy = policy
+        self.fast_lane = fast_lane
+        self.aging = aging
+        self.get_enqueued = get_enqueued or self._get_mtime
+        self._usage = {}  # user: (seconds, when)
+
+    def _get_mtime(self, batchfile):
+        try:
+            return os.path.getmtime(batchfile.filename_dbrecord)
+        except OSError:
+            return time.time()
+
+    def _get_duration(self, batchfile):
+        if batchfile.duration:
+            return batchfile.duration / 1000
+
+        return self.DEFAULT_DURATION
+
+    def _get_user(self, batchfile):
+        return batchfile.email.lower()
+
+    def _get_usage(self, user, now):
+        seconds, when = self._usage.get(user, (0, now))
+        return seconds * 0.5 ** ((now - when) / self.FAIR_SHARE_HALF_LIFE)
+
+    def started(self, batchfile, now=None):
+        """Accounts the job to the usage of its user"""
+        if now is None:
+            now = time.time()
+
+        user = self._get_user(batchfile)
+        usage = self._get_usage(user, now) + self._get_duration(batchfile)
+        self._usage[user] = (usage, now)
+
+    def get_scores(self, batchfiles, now=None):
+        if now is None:
+            now = time.time()
+
+        enqueued = {
+            id(batchfile): self.get_enqueued(batchfile) for batchfile in batchfiles
+        }
+        # The jobs of the same user queued ahead count as used
+        user_usage = {}
+
+        scores = {}
+        for batchfile in sorted(batchfiles, key=lambda b: enqueued[id(b)]):
+            waited = max(now - enqueued[id(batchfile)], 0)
+            if self.policy == "sjf":
+                score = self._get_duration(batchfile)
+            elif self.policy == "fair":
+                user = self._get_user(batchfile)
+                if user not in user_usage:
+                    user_usage[user] = self._get_usage(user, now)
+                score = user_usage[user]
+                user_usage[user] += self._get_duration(batchfile)
+            else:
+                score = 0
+
+            if self.fast_lane and batchfile.operation == "update":
+                score -= self.FAST_LANE_SECONDS
+
+            scores[id(batchfile)] = score - waited * self.aging
+
+        return scores
+
+    def order(self, batchfiles, now=None):
+        scores = self.get_scores(batchfiles, now)
+        return sorted(batchfiles, key=lambda batchfile: scores[id(batchfile)])
+
+    @staticmethod
+    def from_environment():
+        policy = os.environ.get("SCHEDULER_POLICY", "fifo")
+        fast_lane = os.environ.get("SCHEDULER_FAST_LANE", "0") == "1"
+        aging = float(os.environ.get("SCHEDULER_AGING", 1.0))
+        try:
+            return Scheduler(policy, fast_lane, aging)
+        except ValueError as e:
+            logging.error(f"Scheduler.from_environment. Using fifo. Error: {e}")
+            return Scheduler("fifo", fast_lane, aging)
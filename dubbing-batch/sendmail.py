@@ -52,3 +52,27 @@ class Sendmail:
         except Exception as e:
             msg = "Error '{0}' sending to {1}".format(e, email)
             logging.error(msg)
+
+
+# Shared by process-batch and dubbing-service (results served without
+# processing them again), variant is the full name (see get_full_variant)
+def send_mail_create(batchfile, inference_time, variant, source_file_base):
+    text = f"Ja tenim el vostre fitxer '{batchfile.original_filename}' doblat amb la variant '{variant}'.\n"
+    text += f"El podeu baixar des de https://www.softcatala.org/doblatge/resultats/?uuid={source_file_base}&revision={batchfile.revision}\n"
+    text += "No compartiu aquesta adreça amb altres persones si no voleu que tinguin accés al fitxer."
+
+    if "@softcatala" in batchfile.email and inference_time is not None:
+        text += f"\nL'execució ha trigat {inference_time}."
+
+    Sendmail().send(text, batchfile.email)
+
+
+def send_mail_update(batchfile, inference_time, variant, source_file_base):
+    text = f"Ja tenim actualizat amb els darrers canvis el vostre fitxer '{batchfile.original_filename}' doblat amb la variant '{variant}'.\n"
+    text += f"El podeu baixar des de https://www.softcatala.org/doblatge/resultats/?uuid={source_file_base}&revision={batchfile.revision}\n"
+    text += "No compartiu aquesta adreça amb altres persones si no voleu que tinguin accés al fitxer."
+
+    if "@softcatala" in batchfile.email and inference_time is not None:
+        text += f"\nL'execució ha trigat {inference_time}."
+
+    Sendmail().send(text, batchfile.email)
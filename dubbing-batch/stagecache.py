@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import datetime
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shlex
+import shutil
+import time
+import fastcopy
+from incremental import get_arguments
+
+"""
+    On-disk cache of the expensive intermediate outputs of open-dubbing:
+        - demucs: the vocals and background stems
+        - diarization: the pyannote speaker segments
+        - transcription: the Whisper text of every segment
+
+    Entries are keyed by a fingerprint of the extracted audio plus the model
+    and parameters of the stage, so a resubmission or a different target
+    variant of an already processed video reuses them. The cache is bounded
+    in size, the least recently used entries are evicted first.
+
+    Hits, misses and the compute time saved (the time that the entry took to
+    compute) are kept in stats.json, shared by all the jobs.
+"""
+
+# Options of demucs.separate without a value, the others have one
+DEMUCS_SWITCHES = ["--no-split", "--mp3", "--flac", "--int24", "--float32", "-v"]
+# They do not change the stems (only where they are written)
+DEMUCS_OUTPUT_OPTIONS = ["-o", "--out", "--filename"]
+
+
+def parse_demucs_command(command):
+    """Returns (options, audio file) of a demucs.separate command line, the
+    options by name. None if it does not have a single audio file"""
+    args = shlex.split(command)
+    # Neither the python executable nor the module change the result
+    first = args.index("-m") + 2 if "-m" in args else 1
+    args = args[first:]
+
+    options = {}
+    files = []
+    idx = 0
+    while idx < len(args):
+        arg = args[idx]
+        if not arg.startswith("-"):
+            files.append(arg)
+        elif arg in DEMUCS_SWITCHES or "=" in arg or idx + 1 == len(args):
+            name, _, value = arg.partition("=")
+            options[name] = value or None
+        else:
+            options[arg] = args[idx + 1]
+            idx += 1
+
+        idx += 1
+
+    if len(files) != 1:
+        return None
+
+    for name in DEMUCS_OUTPUT_OPTIONS:
+        options.pop(name, None)
+
+    return options, files[0]
+
+
+def get_fingerprint(filename):
+    sha256 = hashlib.sha256()
+    with open(filename, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+class StageCache:
+    METADATA = "entry.json"
+    STATS = "stats.json"
+    SIZE = "size"
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+
+    def get_key(self, stage, fingerprint, params):
+        params = json.dumps(params, sort_keys=True)
+        key = f"{stage}\t{fingerprint}\t{params}"
+        return f"{stage}-{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
+    def _get_entry_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Returns (directory, metadata) of the entry or None"""
+        entry_dir = self._get_entry_dir(key)
+        metadata_file = os.path.join(entry_dir, self.METADATA)
+        try:
+            with open(metadata_file, "r") as fh:
+                metadata = json.load(fh)
+
+            os.utime(metadata_file)  # Most recently used
+        except (FileNotFoundError, ValueError):
+            self._update_stats(key, hit=False)
+            return None
+
+        self._update_stats(key, hit=True, seconds=metadata.get("seconds", 0))
+        return entry_dir, metadata
+
+    def put(self, key, files, data, seconds):
+        """Stores the files (copied to the entry), data (saved as json) and the compute time"""
+        entry_dir = self._get_entry_dir(key)
+        tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            for name, filename in files.items():
+                fastcopy.copy_file(
+                    filename, os.path.join(tmp_dir, name), allow_link=True
+                )
+
+            size = self._get_size(tmp_dir)
+            with open(os.path.join(tmp_dir, self.METADATA), "w") as fh:
+                json.dump({"data": data, "seconds": seconds, "size": size}, fh)
+
+            os.rename(tmp_dir, entry_dir)
+        except OSError as e:
+            # Already stored by another job
+            logging.debug(f"StageCache.put. Cannot store {key}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        self._add_size(size)
+
+    def _get_size(self, entry_dir):
+        size = 0
+        for root, dirs, files in os.walk(entry_dir):
+            for name in files:
+                size += os.path.getsize(os.path.join(root, name))
+
+        return size
+
+    # The total size of the entries is kept in a file shared by the jobs, the
+    # entries are only listed when it is over the maximum
+    def _add_size(self, size):
+        with open(os.path.join(self.directory, self.SIZE), "a+") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            fh.seek(0)
+            try:
+                total_size = int(fh.read()) + size
+            except ValueError:
+                total_size = None  # First put, or written by an older version
+
+            if total_size is None or total_size > self.max_size:
+                _, total_size = self._evict()
+
+            fh.seek(0)
+            fh.truncate()
+            fh.write(str(total_size))
+
+    def _evict(self):
+        """Returns the evicted entries and the size of the remaining ones"""
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.directory):
+            entry_dir = self._get_entry_dir(name)
+            metadata_file = os.path.join(entry_dir, self.METADATA)
+            try:
+                with open(metadata_file, "r") as fh:
+                    size = json.load(fh).get("size")
+                mtime = os.path.getmtime(metadata_file)
+            except (FileNotFoundError, NotADirectoryError, ValueError):
+                continue
+
+            if size is None:
+                size = self._get_size(entry_dir)
+
+            entries.append((mtime, size, entry_dir))
+            total_size += size
+
+        entries.sort()
+        evicted = 0
+        while total_size > self.max_size and entries:
+            _, size, entry_dir = entries.pop(0)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
+            evicted += 1
+
+        if evicted:
+            logging.debug(f"StageCache.evict. Evicted {evicted} entries")
+
+        return evicted, total_size
+
+    def evict(self):
+        with open(os.path.join(self.directory, self.SIZE), "a+") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            evicted, total_size = self._evict()
+            fh.seek(0)
+            fh.truncate()
+            fh.write(str(total_size))
+
+        return evicted
+
+    def _update_stats(self, key, hit, seconds=0):
+        stage = key.split("-")[0]
+        with open(os.path.join(self.directory, self.STATS), "a+") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            fh.seek(0)
+            try:
+                stats = json.load(fh)
+            except ValueError:
+                stats = {"hits": {}, "misses": {}, "saved_seconds": 0}
+
+            counter = stats["hits"] if hit else stats["misses"]
+            counter[stage] = counter.get(stage, 0) + 1
+            stats["saved_seconds"] += seconds
+
+            fh.seek(0)
+            fh.truncate()
+            json.dump(stats, fh)
+
+    def get_stats(self):
+        try:
+            with open(os.path.join(self.directory, self.STATS), "r") as fh:
+                fcntl.flock(fh, fcntl.LOCK_SH)
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return {"hits": {}, "misses": {}, "saved_seconds": 0}
+
+    def log_stats(self):
+        stats = self.get_stats()
+        for stage in sorted(set(stats["hits"]) | set(stats["misses"])):
+            hits = stats["hits"].get(stage, 0)
+            misses = stats["misses"].get(stage, 0)
+            logging.info(
+                f"Stage cache '{stage}': hits {hits}, misses {misses}, hit rate {hits * 100 / (hits + misses):.1f}%"
+            )
+
+        logging.info(
+            f"Stage cache saved {datetime.timedelta(seconds=int(stats['saved_seconds']))} of compute"
+        )
+
+
+class OpenDubbingHooks:
+    """Makes open-dubbing use the cache, in the process where it runs"""
+
+    def __init__(self, cache, whisper_model, pyannote_model):
+        self.cache = cache
+        self.whisper_model = whisper_model
+        self.pyannote_model = pyannote_model
+        self.fingerprint = None
+        self._audio_file = None
+
+    def _get_fingerprint(self, audio_file):
+        stat = os.stat(audio_file)
+        audio_file = (audio_file, stat.st_size, stat.st_mtime)
+        if self._audio_file != audio_file:
+            self.fingerprint = get_fingerprint(audio_file[0])
+            self._audio_file = audio_file
+
+        return self.fingerprint
+
+    def install(self):
+        from open_dubbing import audio_processing
+        from open_dubbing.demucs import Demucs
+        from open_dubbing.speech_to_text import SpeechToText
+
+        Demucs.execute_demucs_command = self._demucs(Demucs.execute_demucs_command)
+        audio_processing.create_pyannote_timestamps = self._diarization(
+            audio_processing.create_pyannote_timestamps
+        )
+        SpeechToText.transcribe_audio_chunks = self._transcription(
+            SpeechToText.transcribe_audio_chunks
+        )
+
+    def _demucs(self, execute):
+        def execute_demucs_command(*args, **kwargs):
+            arguments = get_arguments(execute, args, kwargs, ["command"])
+            parsed = parse_demucs_command(arguments["command"]) if arguments else None
+            if parsed is None:
+                return execute(*args, **kwargs)
+
+            demucs = next(iter(arguments.values()))
+            command = arguments["command"]
+            params, audio_file = parsed
+            key = self.cache.get_key(
+                "demucs", self._get_fingerprint(audio_file), params
+            )
+            stems = demucs.assemble_split_audio_file_paths(command)
+
+            entry = self.cache.get(key)
+            if entry:
+                entry_dir, _ = entry
+                try:
+                    for stem in stems:
+                        name = os.path.basename(stem)
+                        os.makedirs(os.path.dirname(stem), exist_ok=True)
+                        fastcopy.copy_file(
+                            os.path.join(entry_dir, name), stem, allow_link=True
+                        )
+                    return
+                except OSError as e:
+                    logging.error(f"StageCache.demucs. Error: {e}")
+
+            start = time.time()
+            execute(*args, **kwargs)
+            files = {os.path.basename(stem): stem for stem in stems}
+            self.cache.put(key, files, None, time.time() - start)
+
+        return execute_demucs_command
+
+    def _diarization(self, create):
+        def create_pyannote_timestamps(*args, **kwargs):
+            arguments = get_arguments(create, args, kwargs, ["audio_file"])
+            if arguments is None:
+                return create(*args, **kwargs)
+
+            params = {"model": self.pyannote_model}
+            key = self.cache.get_key(
+                "diarization", self._get_fingerprint(arguments["audio_file"]), params
+            )
+            entry = self.cache.get(key)
+            if entry:
+                _, metadata = entry
+                return metadata["data"]
+
+            start = time.time()
+            utterances = create(*args, **kwargs)
+            self.cache.put(key, {}, utterances, time.time() - start)
+            return utterances
+
+        return create_pyannote_timestamps
+
+    def _transcription(self, transcribe):
+        def transcribe_audio_chunks(*args, **kwargs):
+            arguments = get_arguments(
+                transcribe,
+                args,
+                kwargs,
+                ["utterance_metadata", "source_language", "no_dubbing_phrases"],
+            )
+            # Segments come from the diarization of the audio of this job
+            if arguments is None or not self.fingerprint:
+                return transcribe(*args, **kwargs)
+
+            stt = next(iter(arguments.values()))
+            utterance_metadata = arguments["utterance_metadata"]
+            params = {
+                "engine": type(stt).__name__,
+                "model": self.whisper_model,
+                "source_language": arguments["source_language"],
+                "no_dubbing_phrases": list(arguments["no_dubbing_phrases"]),
+                "segments": [
+                    [item["start"], item["end"]] for item in utterance_metadata
+                ],
+            }
+            key = self.cache.get_key("transcription", self.fingerprint, params)
+            entry = self.cache.get(key)
+            if entry:
+                _, metadata = entry
+                # The fields set by the transcription (text, for_dubbing, etc)
+                return [
+                    dict(item, **fields)
+                    for item, fields in zip(utterance_metadata, metadata["data"])
+                ]
+
+            start = time.time()
+            updated_utterance_metadata = transcribe(*args, **kwargs)
+            if len(updated_utterance_metadata) == len(utterance_metadata):
+                fields = [
+                    {
+                        name: value
+                        for name, value in updated.items()
+                        if name not in item or item[name] != value
+                    }
+                    for item, updated in zip(
+                        utterance_metadata, updated_utterance_metadata
+                    )
+                ]
+                self.cache.put(key, {}, fields, time.time() - start)
+
+            return updated_utterance_metadata
+
+        return transcribe_audio_chunks
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import logging
+import os
+import sqlite3
+import threading
+from batchfilesdb import BatchFilesDB
+from processedfiles import ProcessedFiles
+
+"""
+    Number of files, size and results per user of the processed directory,
+    kept up to date as the results are published and purged (see expiry.py)
+    instead of walking the directory on each /stats/ request.
+
+    Each published name (a file or an output directory) is a row with its
+    files and size, the totals and the results per email are maintained by
+    triggers, so reading them does not depend on the number of files stored.
+"""
+
+
+def measure(processed, name):
+    """Returns (files, size, email) of a published name or None if it does not exist"""
+    filename = os.path.join(processed, name)
+    try:
+        if not os.path.isdir(filename):
+            email = ""
+            if name.endswith(".dbrecord"):
+                db = BatchFilesDB(processed, backend="files")
+                record = db._read_record(filename)
+                email = record.email.lower() if record else ""
+
+            return 1, os.stat(filename).st_size, email
+
+        files, size = 0, 0
+        for root, dirs, basenames in os.walk(filename):
+            for basename in basenames:
+                files += 1
+                size += os.stat(os.path.join(root, basename)).st_size
+
+        return files, size, ""
+    except FileNotFoundError:
+        return None
+
+
+class StorageStats:
+    VERSION = 1
+    _local = threading.local()
+
+    def __init__(self, filename=None):
+        if filename is None:
+            # Next to the processed directory, it is not a published file
+            processed = ProcessedFiles.get_processed_directory()
+            filename = os.path.normpath(processed) + ".sqlite"
+
+        self.filename = filename
+
+    def _get_connection(self):
+        # One connection per thread and process (it cannot be used after a fork)
+        key = (self.filename, os.getpid())
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+
+        connection = connections.get(key)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.filename, timeout=30, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connections[key] = connection
+
+        return connection
+
+    def is_created(self):
+        connection = self._get_connection()
+        return connection.execute("PRAGMA user_version").fetchone()[0] >= self.VERSION
+
+    def _is_writable(self):
+        """The tables exist, the names published are counted while it is built"""
+        connection = self._get_connection()
+        row = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stored'"
+        ).fetchone()
+        return row is not None
+
+    def _create(self):
+        connection = self._get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS stored (name TEXT PRIMARY KEY, "
+                "files INTEGER NOT NULL, size INTEGER NOT NULL, email TEXT NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS totals (files INTEGER NOT NULL, "
+                "size INTEGER NOT NULL)"
+            )
+            connection.execute(
+                "INSERT INTO totals SELECT 0, 0 WHERE NOT EXISTS (SELECT 1 FROM totals)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS emails (email TEXT PRIMARY KEY, "
+                "items INTEGER NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS stored_insert AFTER INSERT ON stored BEGIN "
+                "UPDATE totals SET files = files + NEW.files, size = size + NEW.size; "
+                "END"
+            )
+            connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS stored_delete AFTER DELETE ON stored BEGIN "
+                "UPDATE totals SET files = files - OLD.files, size = size - OLD.size; "
+                "END"
+            )
+            connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS emails_insert AFTER INSERT ON stored "
+                "WHEN NEW.email != '' BEGIN "
+                "INSERT INTO emails VALUES (NEW.email, 1) "
+                "ON CONFLICT (email) DO UPDATE SET items = items + 1; "
+                "END"
+            )
+            connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS emails_delete AFTER DELETE ON stored "
+                "WHEN OLD.email != '' BEGIN "
+                "UPDATE emails SET items = items - 1 WHERE email = OLD.email; "
+                "DELETE FROM emails WHERE email = OLD.email AND items <= 0; "
+                "END"
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def rebuild(self, processed, names):
+        """Measures the names (relative to the processed directory) once
+
+        The tables are created first, the names published while they are
+        measured are counted by put and kept (they are more recent)"""
+        self._create()
+        rows = []
+        for name in names:
+            measured = measure(processed, name)
+            if measured:
+                rows.append((name,) + measured)
+
+        connection = self._get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT OR IGNORE INTO stored VALUES (?, ?, ?, ?)", rows
+            )
+            connection.execute(f"PRAGMA user_version = {self.VERSION}")
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        logging.info(f"StorageStats. Measured {len(rows)} names in {processed}")
+
+    def put(self, processed, names):
+        """Measures the names published (again), before it is built they are not counted"""
+        if not self._is_writable():
+            return
+
+        rows = []
+        for name in names:
+            measured = measure(processed, name)
+            if measured:
+                rows.append((name,) + measured)
+
+        self._update(names, rows)
+
+    def delete(self, names):
+        if self._is_writable():
+            self._update(names, [])
+
+    def _update(self, names, rows):
+        connection = self._get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "DELETE FROM stored WHERE name = ?", [(name,) for name in names]
+            )
+            connection.executemany("INSERT INTO stored VALUES (?, ?, ?, ?)", rows)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def get(self):
+        """Returns (files, size, {email: results})"""
+        if not self.is_created():
+            return 0, 0, {}
+
+        connection = self._get_connection()
+        files, size = connection.execute("SELECT files, size FROM totals").fetchone()
+        emails = dict(connection.execute("SELECT email, items FROM emails"))
+        return files, size, emails
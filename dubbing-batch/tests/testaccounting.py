@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2023 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import accounting
+from execution import Command
+import unittest
+import json
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+
+class TestAccounting(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.JSONL = os.path.join(self.temp_dir.name, "resources.jsonl")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_command_resources(self):
+        busy = "import time; end = time.time() + 1.5\nwhile time.time() < end: pass"
+        filename = os.path.join(self.temp_dir.name, "busy.py")
+        with open(filename, "w") as fh:
+            fh.write(busy)
+
+        # The shell stays as the parent, python is a phase
+        command = Command(f"{sys.executable} {filename}; true")
+        self.assertEquals(Command.NO_ERROR, command.run(timeout=30))
+
+        resources = command.resources
+        self.assertGreater(resources["cpu_seconds"], 0.5)
+        self.assertGreater(resources["peak_rss"], 0)
+        phases = resources["phases"]
+        self.assertEquals(1, len(phases))
+        self.assertTrue(phases[0]["name"].startswith("python"))
+        self.assertGreater(phases[0]["seconds"], 0.5)
+
+    def test_command_resources_timeout(self):
+        command = Command("sleep 30")
+        self.assertEquals(Command.TIMEOUT_ERROR, command.run(timeout=0.5))
+        self.assertGreater(command.resources["processes"], 0)
+
+    def _record(self, cpu_seconds, peak_rss, video_seconds=60, since=0):
+        return {
+            "time": time.time() - since,
+            "video_seconds": video_seconds,
+            "seconds": cpu_seconds * 2,
+            "cpu_seconds": cpu_seconds,
+            "peak_rss": peak_rss,
+            "read_bytes": 10,
+            "write_bytes": 20,
+            "phases": [{"name": "ffmpeg", "cpu_seconds": 1}],
+        }
+
+    def test_summarize(self):
+        accounting.append(self.JSONL, self._record(100, 1000))
+        accounting.append(self.JSONL, self._record(200, 3000, video_seconds=120))
+        accounting.append(self.JSONL, self._record(500, 9000, since=60 * 60))
+
+        summary = accounting.summarize(self.JSONL, time.time() - 60)
+        self.assertEquals(2, summary["jobs"])
+        self.assertEquals(3000, summary["peak_rss_max"])
+        self.assertEquals(100, summary["cpu_seconds_per_video_minute_p95"])
+        self.assertEquals({"ffmpeg": 2}, summary["phases_cpu_seconds"])
+        self.assertEquals(40, summary["write_bytes"])
+
+    def test_resources_log_appended(self):
+        resources_log = accounting.ResourcesLog(self.JSONL)
+        self.assertEquals([], resources_log.read())
+
+        accounting.append(self.JSONL, self._record(100, 1000, since=60 * 60))
+        accounting.append(self.JSONL, self._record(200, 3000))
+        self.assertEquals(2, len(resources_log.read()))
+        offset = resources_log.offset
+
+        # A line still being written is read when complete
+        with open(self.JSONL, "a") as fh:
+            fh.write(json.dumps(self._record(300, 5000))[:10])
+        records = resources_log.read(time.time() - 60)
+        self.assertEquals([200], [r["cpu_seconds"] for r in records])
+        self.assertEquals(offset, resources_log.offset)
+
+        with open(self.JSONL, "a") as fh:
+            fh.write(json.dumps(self._record(300, 5000))[10:] + "\n")
+        records = resources_log.read(time.time() - 60)
+        self.assertEquals([200, 300], [r["cpu_seconds"] for r in records])
+
+    def test_resources_log_rotated(self):
+        resources_log = accounting.ResourcesLog(self.JSONL)
+        accounting.append(self.JSONL, self._record(100, 1000))
+        accounting.append(self.JSONL, self._record(200, 3000))
+        self.assertEquals(2, len(resources_log.read()))
+
+        os.rename(self.JSONL, self.JSONL + ".1")
+        accounting.append(self.JSONL, self._record(300, 5000))
+        records = resources_log.read()
+        self.assertEquals([300], [r["cpu_seconds"] for r in records])
+
+    def test_command_sample_seconds(self):
+        command = Command("sleep 0.2", sample_seconds=0.05)
+        with patch.object(command, "_wait", wraps=command._wait) as wait:
+            self.assertEquals(Command.NO_ERROR, command.run(timeout=30))
+
+        self.assertEquals(0.05, wait.call_args_list[0].args[0])
+
+    def test_summarize_no_jobs(self):
+        self.assertEquals(None, accounting.summarize(self.JSONL))
+
+    def test_save(self):
+        filename = os.path.join(self.temp_dir.name, "uuid.resources")
+        accounting.save(filename, self._record(100, 1000))
+        with open(filename, "r") as fh:
+            self.assertEquals(100, json.load(fh)["cpu_seconds"])
+
+
+if __name__ == "__main__":
+    unittest.main()
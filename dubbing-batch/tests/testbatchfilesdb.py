@@ -17,13 +17,30 @@
 # Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 # Boston, MA 02111-1307, USA.
 
-from batchfilesdb import BatchFilesDB
+from batchfilesdb import BatchFilesDB, Queue
+from unittest.mock import patch
 import unittest
+import multiprocessing
 import os
 import tempfile
 import time
 
 
+def _claim_all(entries, backend, worker, results):
+    db = BatchFilesDB(entries, backend=backend)
+    claimed = []
+    while True:
+        batchfiles = [b for b in db.select() if not db.is_claimed(b)]
+        if not batchfiles:
+            break
+
+        for batchfile in batchfiles:
+            if db.claim(batchfile, worker):
+                claimed.append(batchfile.filename)
+
+    results.put(claimed)
+
+
 class TestBatchFilesDB(unittest.TestCase):
     FILENAME = "fitxer.txt"
     EMAIL = "jmas@softcatala.org"
@@ -55,6 +72,61 @@ class TestBatchFilesDB(unittest.TestCase):
         self.assertEquals(self.EMAIL, record.email)
         self.assertEquals(self.VARIANT, record.variant)
 
+    def test_create_content_hash(self):
+        db = self._create_db_object()
+        _uuid = db.create(
+            self.FILENAME,
+            self.EMAIL,
+            self.VARIANT,
+            "original_filename.mp3",
+            content_hash="abcd",
+        )
+
+        record = db._read_record_from_uuid(_uuid)
+        self.assertEquals("abcd", record.content_hash)
+        self.assertEquals(False, record.dubbed_subtitles)
+
+    def test_create_duration(self):
+        db = self._create_db_object()
+        _uuid = db.create(
+            self.FILENAME,
+            self.EMAIL,
+            self.VARIANT,
+            "original_filename.mp3",
+            duration=120000,
+        )
+
+        record = db._read_record_from_uuid(_uuid)
+        self.assertEquals("", record.content_hash)
+        self.assertEquals(120000, record.duration)
+
+    def test_create_media(self):
+        db = self._create_db_object()
+        media = {"format": "mp4", "duration_ms": 120000, "streams": []}
+        _uuid = db.create(
+            self.FILENAME,
+            self.EMAIL,
+            self.VARIANT,
+            "original_filename.mp3",
+            duration=120000,
+            media=media,
+        )
+
+        record = db._read_record_from_uuid(_uuid)
+        self.assertEquals(120000, record.duration)
+        self.assertEquals(media, record.media)
+        self.assertEquals(media, db.select()[0].media)
+
+    def test_read_record_without_content_hash(self):
+        db = self._create_db_object()
+        _uuid = db.create(
+            self.FILENAME, self.EMAIL, self.VARIANT, "original_filename.mp3"
+        )
+
+        record = db._read_record_from_uuid(_uuid)
+        self.assertEquals("", record.content_hash)
+        self.assertEquals(0, record.duration)
+
     def test_select(self):
         db = self._create_db_object()
         db.create(self.FILENAME, self.EMAIL, self.VARIANT, "original_filename.mp3")
@@ -94,6 +166,16 @@ class TestBatchFilesDB(unittest.TestCase):
         self.assertEquals(self.EMAIL.lower(), record.email.lower())
         self.assertEquals(self.VARIANT, record.variant)
 
+    def test_count_by_email(self):
+        db = self._create_db_object()
+        db.create(self.FILENAME, self.EMAIL, self.VARIANT, "original_filename.mp3")
+        db.create(self.FILENAME, self.EMAIL2, self.VARIANT, "original_filename.mp3")
+        db.create(self.FILENAME, self.EMAIL3, self.VARIANT, "original_filename.mp3")
+
+        self.assertEquals(
+            {self.EMAIL.lower(): 2, self.EMAIL2.lower(): 1}, db.count_by_email()
+        )
+
     def test_selected_expected_order(self):
         db = self._create_db_object()
         MINUTES_SEC = 60
@@ -122,6 +204,203 @@ class TestBatchFilesDB(unittest.TestCase):
         records = len(records_org) - len(db.select())
         self.assertEquals(1, records)
 
+    def test_claim(self):
+        db = self._create_db_object()
+        _uuid = db.create(
+            self.FILENAME, self.EMAIL, self.VARIANT, "original_filename.mp3"
+        )
+        batchfile = db.select()[0]
+
+        self.assertEquals(True, db.claim(batchfile, "worker1"))
+        self.assertEquals(True, db.is_claimed(batchfile))
+        self.assertEquals(True, db.is_queued(_uuid))
+        self.assertEquals(
+            db.get_record_file_from_uuid(_uuid, "worker1"), batchfile.filename_dbrecord
+        )
+        records = db.select()
+        self.assertEquals(1, len(records))
+        self.assertEquals(True, db.is_claimed(records[0]))
+
+    def test_claim_already_claimed(self):
+        db = self._create_db_object()
+        db.create(self.FILENAME, self.EMAIL, self.VARIANT, "original_filename.mp3")
+        batchfile = db.select()[0]
+        other = db.select()[0]
+
+        self.assertEquals(True, db.claim(batchfile, "worker1"))
+        self.assertEquals(False, db.claim(other, "worker2"))
+
+    def test_release(self):
+        db = self._create_db_object()
+        _uuid = db.create(
+            self.FILENAME, self.EMAIL, self.VARIANT, "original_filename.mp3"
+        )
+        batchfile = db.select()[0]
+        db.claim(batchfile, "worker1")
+
+        claimed = db.get_claimed("worker1")
+        self.assertEquals(1, len(claimed))
+        self.assertEquals(0, len(db.get_claimed("worker2")))
+        db.release(claimed[0])
+
+        self.assertEquals(0, len(db.get_claimed("worker1")))
+        self.assertEquals(False, db.is_claimed(db.select()[0]))
+        self.assertEquals(True, os.path.exists(db.get_record_file_from_uuid(_uuid)))
+
+    def test_claim_from_other_worker(self):
+        db = self._create_db_object()
+        db.create(self.FILENAME, self.EMAIL, self.VARIANT, "original_filename.mp3")
+        db.claim(db.select()[0], "worker1")
+
+        batchfile = db.get_claimed("worker1")[0]
+        self.assertEquals(True, db.claim(batchfile, "worker2"))
+        self.assertEquals(0, len(db.get_claimed("worker1")))
+        self.assertEquals(1, len(db.get_claimed("worker2")))
+        self.assertEquals(["worker1", "worker2"], sorted(db.get_workers()))
+
+    def test_release_already_released(self):
+        db = self._create_db_object()
+        db.create(self.FILENAME, self.EMAIL, self.VARIANT, "original_filename.mp3")
+        db.claim(db.select()[0], "worker1")
+        batchfile = db.get_claimed("worker1")[0]
+        other = db.get_claimed("worker1")[0]
+
+        self.assertEquals(True, db.release(batchfile))
+        self.assertEquals(False, db.release(other))
+
+    def test_delete_claimed(self):
+        db = self._create_db_object()
+        _uuid = db.create(
+            self.FILENAME, self.EMAIL, self.VARIANT, "original_filename.mp3"
+        )
+        batchfile = db.select()[0]
+        db.claim(batchfile, "worker1")
+        db.delete(batchfile.filename_dbrecord)
+
+        self.assertEquals(0, db.count())
+        self.assertEquals(False, db.is_queued(_uuid))
+
+    def test_claim_concurrent_workers(self):
+        db = self._create_db_object()
+        RECORDS = 200
+        WORKERS = 4
+        for _id in range(0, RECORDS):
+            db.create(_id, self.EMAIL, self.VARIANT, "original_filename.mp3")
+
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=_claim_all,
+                args=(db.ENTRIES, db.backend, f"worker{worker}", results),
+            )
+            for worker in range(WORKERS)
+        ]
+        for process in processes:
+            process.start()
+
+        claimed = []
+        for process in processes:
+            claimed += results.get(timeout=60)
+        for process in processes:
+            process.join()
+
+        self.assertEquals(RECORDS, len(claimed))
+        self.assertEquals(RECORDS, len(set(claimed)))
+
+
+class TestBatchFilesDBSqlite(TestBatchFilesDB):
+    def _create_db_object(self):
+        entries = os.path.join(self.ENTRIES, "entries")
+        return BatchFilesDB(entries, backend="sqlite")
+
+    def test_selected_expected_order(self):
+        db = self._create_db_object()
+        MAX_FILES_IN_QUEUE = 20
+
+        for _id in range(0, MAX_FILES_IN_QUEUE):
+            db.create(_id, self.EMAIL, self.VARIANT, "original_filename.mp3")
+
+        records = db.select()
+        for id in range(0, MAX_FILES_IN_QUEUE):
+            self.assertEquals(str(id), records[id].filename)
+
+    def test_count(self):
+        db = self._create_db_object()
+        db.create(self.FILENAME, self.EMAIL, self.VARIANT, "original_filename.mp3")
+        _uuid = db.create(
+            self.FILENAME, self.EMAIL2, self.VARIANT, "original_filename.mp3"
+        )
+        self.assertEquals(2, db.count())
+
+        db.delete(db.get_record_file_from_uuid(_uuid))
+        db.delete(db.get_record_file_from_uuid(_uuid))
+        self.assertEquals(1, db.count())
+
+    def test_migrate_v1_records(self):
+        entries = os.path.join(self.ENTRIES, "entries")
+        files_db = BatchFilesDB(entries, backend="files")
+        MINUTES_SEC = 60
+        for _id in range(0, 5):
+            _uuid = files_db.create(
+                _id, self.EMAIL, self.VARIANT, "original_filename.mp3"
+            )
+            filename_dbrecord = files_db.get_record_file_from_uuid(_uuid)
+            past_time = time.time() - (MINUTES_SEC * (5 - _id))
+            os.utime(filename_dbrecord, (past_time, past_time))
+
+        db = self._create_db_object()
+        records = db.select(email=self.EMAIL3)
+        self.assertEquals(5, db.count())
+        for id in range(0, 5):
+            self.assertEquals(str(id), records[id].filename)
+
+    def test_rebuild_index(self):
+        db = self._create_db_object()
+        _uuid = db.create(
+            self.FILENAME, self.EMAIL, self.VARIANT, "original_filename.mp3"
+        )
+        os.remove(db.get_record_file_from_uuid(_uuid))
+        self.assertEquals(1, db.count())
+
+        db.rebuild_index()
+        self.assertEquals(0, db.count())
+
+    def test_rebuild_index_claimed(self):
+        db = self._create_db_object()
+        db.create(self.FILENAME, self.EMAIL, self.VARIANT, "original_filename.mp3")
+        db.claim(db.select()[0], "worker1")
+
+        db.rebuild_index()
+        self.assertEquals(1, len(db.get_claimed("worker1")))
+
+    def test_is_still_claimed(self):
+        db = self._create_db_object()
+        db.create(self.FILENAME, self.EMAIL, self.VARIANT, "original_filename.mp3")
+        batchfile = db.select()[0]
+        self.assertFalse(db.is_still_claimed(batchfile))
+
+        db.claim(batchfile, "worker1")
+        self.assertTrue(db.is_still_claimed(batchfile))
+
+        # The lease of worker1 expired and worker2 recovered its claims
+        db.claim(db.get_claimed("worker1")[0], "worker2")
+        self.assertFalse(db.is_still_claimed(batchfile))
+
+    def test_rebuild_index_keeps_created_while_scanning(self):
+        db = self._create_db_object()
+        db.create(self.FILENAME, self.EMAIL, self.VARIANT, "original_filename.mp3")
+        get_all = Queue.get_all
+
+        def _get_all_and_create(queue):
+            filenames = get_all(queue)
+            db.create(self.FILENAME, self.EMAIL2, self.VARIANT, "original_filename.mp3")
+            return filenames
+
+        with patch.object(Queue, "get_all", _get_all_and_create):
+            db.rebuild_index()
+
+        self.assertEquals(2, db.count())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from batchfilesdb import BatchFilesDB
+from catalog import Catalog, split_name
+import os
+import tempfile
+import threading
+import unittest
+
+UUID1 = "b8d2f6a0-3c1e-4f7a-9d6b-2e5c8a1f4b3d"
+UUID2 = "0f9e8d7c-6b5a-4c3d-8e2f-1a0b9c8d7e6f"
+
+
+class TestCatalog(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.processed = self.temp_dir.name
+        filename = os.path.join(self.processed, "catalog.sqlite")
+        self.catalog = Catalog(filename, self.processed)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, name, content="Hello"):
+        filename = os.path.join(self.processed, name)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as fh:
+            fh.write(content)
+
+    def _publish(self, _uuid, revision=1):
+        db = BatchFilesDB(self.processed, backend="files")
+        db.create(
+            _uuid,
+            "jmas@softcatala.org",
+            "central",
+            "video.mp4",
+            record_uuid=_uuid,
+            revision=revision,
+        )
+        self._write(f"{_uuid}.mp4")
+        self._write(f"{_uuid}.dub")
+        self._write(f"{_uuid}_output/dubbed.mp4")
+        return [f"{_uuid}.dbrecord", f"{_uuid}.mp4", f"{_uuid}.dub", f"{_uuid}_output"]
+
+    def _put_in_thread(self, names):
+        # Another connection, as another process would do
+        thread = threading.Thread(target=self.catalog.put, args=(self.processed, names))
+        thread.start()
+        thread.join()
+
+    def test_split_name(self):
+        self.assertEquals((UUID1, ".dub"), split_name(f"{UUID1}.dub"))
+        self.assertEquals((UUID1, "_output"), split_name(f"{UUID1}_output"))
+        self.assertEquals(None, split_name(f"content/{UUID1}.dub"))
+        self.assertEquals(None, split_name("expiry"))
+
+    def test_not_created(self):
+        names = self._publish(UUID1)
+        self.catalog.put(self.processed, names)
+
+        self.assertEquals(False, self.catalog.is_created())
+        self.assertEquals((True, ""), self.catalog.do_files_exists(UUID1))
+        self.assertEquals(1, self.catalog.get_record(UUID1).revision)
+        self.assertEquals(None, self.catalog.get(UUID2))
+
+    def test_rebuild(self):
+        names = self._publish(UUID1)
+        self._write(f"content/{UUID2}")
+        self.catalog.rebuild(
+            self.processed, names + [f"{UUID2}.dub", f"content/{UUID2}"]
+        )
+
+        result = self.catalog.get(UUID1)
+        self.assertEquals(None, result.get_missing())
+        self.assertEquals(True, result.has("_output"))
+        self.assertEquals(False, result.has(".srt"))
+        self.assertEquals("video.mp4", result.get_record().original_filename)
+        self.assertEquals(None, self.catalog.get(UUID2))
+
+    def test_put_while_rebuilding(self):
+        names = self._publish(UUID1)
+
+        def _scan():
+            yield from names
+            # Published after the scan has gone past it
+            self.catalog.put(self.processed, self._publish(UUID2))
+
+        self.catalog.rebuild(self.processed, _scan())
+        self.assertEquals((True, ""), self.catalog.do_files_exists(UUID1))
+        self.assertEquals((True, ""), self.catalog.do_files_exists(UUID2))
+
+    def test_does_not_read_the_files(self):
+        names = self._publish(UUID1)
+        self.catalog.rebuild(self.processed, names)
+        os.remove(os.path.join(self.processed, f"{UUID1}.dbrecord"))
+
+        self.assertEquals((True, ""), self.catalog.do_files_exists(UUID1))
+        self.assertEquals("video.mp4", self.catalog.get_record(UUID1).original_filename)
+
+    def test_put_delete(self):
+        self.catalog.rebuild(self.processed, [])
+        self.assertEquals(
+            (False, "file mp4 does not exist"), self.catalog.do_files_exists(UUID1)
+        )
+
+        names = self._publish(UUID1)
+        self.catalog.put(self.processed, names)
+        self.assertEquals((True, ""), self.catalog.do_files_exists(UUID1))
+
+        # Published again after an update
+        self._publish(UUID1, revision=2)
+        self._write(f"{UUID1}.srt")
+        self.catalog.put(self.processed, names[:1] + [f"{UUID1}.srt"])
+        self.assertEquals(2, self.catalog.get_record(UUID1).revision)
+        self.assertEquals(True, self.catalog.has(UUID1, ".srt"))
+        self.assertEquals(True, self.catalog.has(UUID1, ".dub"))
+
+        self.catalog.delete([f"{UUID1}.dub"])
+        self.assertEquals(
+            (False, "file dub does not exist"), self.catalog.do_files_exists(UUID1)
+        )
+
+        self.catalog.delete(names + [f"{UUID1}.srt"])
+        self.assertEquals(None, self.catalog.get(UUID1))
+
+    def test_cache_cleared_by_other_connections(self):
+        self.catalog.rebuild(self.processed, [])
+        self.assertEquals(None, self.catalog.get(UUID1))
+
+        self._put_in_thread(self._publish(UUID1))
+        self.assertEquals((True, ""), self.catalog.do_files_exists(UUID1))
+
+        self._publish(UUID1, revision=2)
+        self._put_in_thread([f"{UUID1}.dbrecord"])
+        self.assertEquals(2, self.catalog.get_record(UUID1).revision)
+
+    def test_cache_size(self):
+        self.catalog.rebuild(self.processed, [])
+        self.catalog.CACHE_SIZE = 2
+        for _uuid in [UUID1, UUID2, UUID1, UUID1]:
+            self.catalog.get(_uuid)
+
+        cache = self.catalog._get_cache()
+        self.assertEquals([UUID2, UUID1], list(cache.keys()))
+
+
+if __name__ == "__main__":
+    unittest.main()
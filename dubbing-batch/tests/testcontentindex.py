@@ -0,0 +1,153 @@
+# -*- encoding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from batchfilesdb import BatchFilesDB
+from contentindex import ContentIndex, combine_hashes, hash_stream, HASH_PART_SIZE
+import hashlib
+import io
+import unittest
+import os
+import tempfile
+from unittest.mock import patch
+
+
+class TestContentIndex(unittest.TestCase):
+    UUID = "0ea8f8f8-3f3a-4b7a-9f40-6cb2f3c9c3a1"
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.PROCESSED = self.temp_dir.name
+        self.patcher = patch("processedfiles.PROCESSED", self.PROCESSED)
+        self.patcher.start()
+        self.db = BatchFilesDB(self.PROCESSED)
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.temp_dir.cleanup()
+
+    def _create_result(self, _uuid, revision=1):
+        self.db.create(
+            f"/srv/data/files/{_uuid}",
+            "jmas@softcatala.org",
+            "central",
+            "video.mp4",
+            record_uuid=_uuid,
+            revision=revision,
+            content_hash="abcd",
+        )
+        for extension in ["mp4", "dub"]:
+            with open(os.path.join(self.PROCESSED, f"{_uuid}.{extension}"), "w") as fh:
+                fh.write("Hello")
+
+        output_dir = os.path.join(self.PROCESSED, f"{_uuid}_output")
+        os.makedirs(output_dir)
+        with open(os.path.join(output_dir, "utterance_metadata_cat.json"), "w") as fh:
+            fh.write(f'{{"path": "/srv/data/files/{_uuid}_output/chunk.mp3"}}')
+
+        return self.db._read_record_from_uuid(_uuid)
+
+    def test_hash_stream(self):
+        target = os.path.join(self.PROCESSED, "upload")
+        content = b"video" * 1000
+
+        content_hash = hash_stream(io.BytesIO(content), target)
+
+        part = hashlib.sha256(content).hexdigest()
+        self.assertEqual(combine_hashes([part]), content_hash)
+        with open(target, "rb") as fh:
+            self.assertEqual(content, fh.read())
+
+    def test_hash_stream_parts(self):
+        target = os.path.join(self.PROCESSED, "upload")
+        content = os.urandom(HASH_PART_SIZE * 2 + 1000)
+
+        content_hash = hash_stream(io.BytesIO(content), target)
+
+        middle = HASH_PART_SIZE * 2
+        parts = [content[:HASH_PART_SIZE], content[HASH_PART_SIZE:middle]]
+        parts.append(content[middle:])
+        digests = [hashlib.sha256(part).hexdigest() for part in parts]
+        self.assertEqual(combine_hashes(digests), content_hash)
+
+    def test_put_get(self):
+        record = self._create_result(self.UUID)
+        index = ContentIndex()
+
+        index.put(record, self.UUID)
+
+        self.assertEqual(self.UUID, index.get(record))
+        self.assertEqual(self.UUID, index.find_result(record))
+
+    def test_get_other_options(self):
+        record = self._create_result(self.UUID)
+        index = ContentIndex()
+        index.put(record, self.UUID)
+
+        record.variant = "valencia"
+        self.assertIsNone(index.get(record))
+
+    def test_find_result_edited(self):
+        record = self._create_result(self.UUID, revision=2)
+        index = ContentIndex()
+        index.put(record, self.UUID)
+
+        self.assertIsNone(index.find_result(record))
+        self.assertIsNone(index.get(record))
+
+    def test_find_result_purged(self):
+        record = self._create_result(self.UUID)
+        index = ContentIndex()
+        index.put(record, self.UUID)
+        os.remove(os.path.join(self.PROCESSED, f"{self.UUID}.dub"))
+
+        self.assertIsNone(index.find_result(record))
+
+    def test_copy_to_uuid(self):
+        from processedfiles import ProcessedFiles
+
+        new_uuid = "d7a2b6a4-0f3e-4bd5-8d1e-2f4a5f6f7a8b"
+        self._create_result(self.UUID)
+        # Not a published result, e.g. an upload being written
+        with open(os.path.join(self.PROCESSED, f"{self.UUID}.tmp"), "w") as fh:
+            fh.write("Hello")
+
+        names = ProcessedFiles(self.UUID).copy_to_uuid(new_uuid, ".mp4")
+
+        expected = [f"{new_uuid}_output", f"{new_uuid}.dub", f"{new_uuid}.mp4"]
+        self.assertEqual(expected, names)
+        for name in names:
+            self.assertTrue(os.path.exists(os.path.join(self.PROCESSED, name)))
+        self.assertFalse(
+            os.path.exists(os.path.join(self.PROCESSED, f"{new_uuid}.tmp"))
+        )
+        self.assertFalse(
+            os.path.exists(os.path.join(self.PROCESSED, f"{new_uuid}.dbrecord"))
+        )
+        metadata = os.path.join(
+            self.PROCESSED, f"{new_uuid}_output", "utterance_metadata_cat.json"
+        )
+        with open(metadata) as fh:
+            self.assertEqual(
+                f'{{"path": "/srv/data/files/{new_uuid}_output/chunk.mp3"}}', fh.read()
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+from engine import Engine, _cached
+from execution import Command
+import unittest
+import os
+import sys
+import tempfile
+import time
+
+
+class EngineTest(Engine):
+    # Instead of open-dubbing, the first argument is the exit code and the
+    # second the seconds to sleep
+    def _main(self):
+        with open("engine.txt", "w") as fh:
+            fh.write(os.environ.get("ENGINE_TEST", ""))
+
+        print("engine output")
+        time.sleep(float(sys.argv[2]))
+        sys.exit(int(sys.argv[1]))
+
+
+class TestEngine(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _run(self, args, timeout=10):
+        command = EngineTest().get_command(
+            args, env={"ENGINE_TEST": "value"}, cwd=self.temp_dir.name
+        )
+        return command.run(timeout)
+
+    def test_run_returncode(self):
+        self.assertEqual(Command.NO_ERROR, self._run(["0", "0"]))
+        self.assertEqual(101, self._run(["101", "0"]))
+
+    def test_run_cwd_and_env(self):
+        self._run(["0", "0"])
+        with open(os.path.join(self.temp_dir.name, "engine.txt"), "r") as fh:
+            self.assertEqual("value", fh.read())
+
+    def test_run_log_filename(self):
+        log_filename = os.path.join(self.temp_dir.name, "dubbing.log")
+        command = EngineTest().get_command(
+            ["0", "0"], cwd=self.temp_dir.name, log_filename=log_filename
+        )
+        self.assertEqual(Command.NO_ERROR, command.run(10))
+        with open(log_filename, "r") as fh:
+            self.assertEqual("engine output\n", fh.read())
+
+    def test_run_timeout(self):
+        start = time.time()
+        result = self._run(["0", "30"], timeout=0.5)
+        self.assertEqual(Command.TIMEOUT_ERROR, result)
+        self.assertLess(time.time() - start, 10)
+
+    def test_cached_logs_misses(self):
+        calls = []
+
+        def load(model):
+            calls.append(model)
+            return len(calls)
+
+        cached = _cached(load)
+        self.assertEqual(1, cached("medium"))
+        self.assertEqual(1, cached("medium"))
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(2, cached("large"))
+
+
+if __name__ == "__main__":
+    unittest.main()
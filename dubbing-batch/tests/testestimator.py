@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2023 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from batchfilesdb import BatchFilesDB
+from estimator import (
+    DurationModel,
+    estimate_queue,
+    get_active_workers,
+    get_estimate,
+    PRIOR,
+)
+import estimator
+from scheduler import Scheduler
+import os
+import tempfile
+import unittest
+import time
+import uuid
+from unittest.mock import patch
+
+
+class TestEstimator(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.model_file = os.path.join(self.temp_dir.name, "durations.json")
+        estimator._cache.clear()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _create_db_object(self):
+        db = BatchFilesDB()
+        db.ENTRIES = self.temp_dir.name
+        return db
+
+    def _create(self, db, duration, operation="create"):
+        # As dubbing-service, the uploaded file is named after the uuid
+        _uuid = str(uuid.uuid4())
+        return db.create(
+            os.path.join(self.temp_dir.name, _uuid),
+            "jmas@softcatala.org",
+            "central",
+            "video.mp4",
+            video_lang="eng",
+            operation=operation,
+            duration=duration * 1000,
+            record_uuid=_uuid,
+        )
+
+    def test_estimate_prior(self):
+        model = DurationModel(self.model_file)
+        intercept, slope = PRIOR["create"]
+
+        self.assertEquals(True, model.is_empty())
+        self.assertAlmostEqual(
+            intercept + slope * 100, model.estimate("create", "eng", "central", 100)
+        )
+
+    def test_estimate_learns(self):
+        model = DurationModel(self.model_file)
+        samples = [
+            ("create", "eng", "central", seconds, 30 + 2 * seconds)
+            for seconds in range(60, 6000, 60)
+        ]
+        model.add(samples)
+
+        model = DurationModel(self.model_file)
+        self.assertEquals(False, model.is_empty())
+        estimate = model.estimate("create", "eng", "central", 1000)
+        self.assertAlmostEqual(2030, estimate, delta=20)
+
+    def test_estimate_blends_with_operation(self):
+        model = DurationModel(self.model_file)
+        samples = [
+            ("create", "eng", "central", seconds, 3 * seconds)
+            for seconds in range(60, 6000, 60)
+        ]
+        samples.append(("create", "spa", "valencia", 100, 100))
+        model.add(samples)
+
+        # A single sample for spa is blended with the other create jobs
+        estimate = model.estimate("create", "spa", "valencia", 100)
+        self.assertLess(100, estimate)
+        self.assertGreater(300, estimate)
+        self.assertAlmostEqual(
+            300, model.estimate("create", "fra", "central", 100), delta=10
+        )
+
+    def test_estimate_queue(self):
+        db = self._create_db_object()
+        model = DurationModel(self.model_file)
+        model.add([("create", "eng", "central", 100, 1000)] * 100)
+        for _ in range(3):
+            self._create(db, 100)
+
+        running = db.select()[0]
+        db.claim(running, "worker1")
+
+        now = 10000
+        estimates = estimate_queue(db, model, 2, Scheduler(), now)
+
+        # The third job waits for one of the two workers
+        starts = sorted(start - now for start, end in estimates.values())
+        ends = sorted(end - now for start, end in estimates.values())
+        self.assertEquals(3, len(estimates))
+        for expected, start in zip([0, 0, 1000], starts):
+            self.assertAlmostEqual(expected, start, delta=5)
+        for expected, end in zip([1000, 1000, 2000], ends):
+            self.assertAlmostEqual(expected, end, delta=5)
+
+        start, end = estimates[os.path.basename(running.filename)]
+        self.assertEquals(now, start)
+
+    def test_get_estimate(self):
+        db = self._create_db_object()
+        model = DurationModel(self.model_file)
+        _uuid = self._create(db, 100)
+
+        estimate = get_estimate(db, _uuid, model)
+        self.assertEquals(
+            ["estimated_completion", "estimated_start"], sorted(estimate.keys())
+        )
+        self.assertEquals({}, get_estimate(db, "none", model))
+
+    def test_get_estimate_cached(self):
+        db = self._create_db_object()
+        model = DurationModel(self.model_file)
+        _uuid = self._create(db, 100)
+
+        with patch("estimator.estimate_queue", wraps=estimate_queue) as simulate:
+            estimate = get_estimate(db, _uuid, model)
+            self.assertEquals(estimate, get_estimate(db, _uuid, model))
+            self.assertEquals(1, simulate.call_count)
+
+            # Just queued, it is not in the cached simulation
+            new_uuid = self._create(db, 100)
+            self.assertNotEqual({}, get_estimate(db, new_uuid, model))
+            self.assertEquals(2, simulate.call_count)
+
+    def test_get_active_workers_lease(self):
+        db = self._create_db_object()
+        for worker, age in [("worker1", 0), ("worker2", 100)]:
+            os.makedirs(db.get_processing_dir(worker))
+            lock = db.get_processing_dir(worker) + ".lock"
+            with open(lock, "w"):
+                pass
+            os.utime(lock, (time.time() - age, time.time() - age))
+
+        with patch.dict(os.environ, {"LEASE_SECONDS": "60", "BATCH_WORKERS": "0"}):
+            self.assertEquals(1, get_active_workers(db))
+
+        with patch.dict(os.environ, {"LEASE_SECONDS": "300", "BATCH_WORKERS": "0"}):
+            self.assertEquals(2, get_active_workers(db))
+
+
+if __name__ == "__main__":
+    unittest.main()
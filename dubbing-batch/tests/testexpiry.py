@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2023 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from expiry import ExpiryIndex, BUCKET_SECONDS
+import fcntl
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+DAY = 24 * 60 * 60
+
+
+class TestExpiryIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.processed = os.path.join(self.temp_dir.name, "processed")
+        os.makedirs(self.processed)
+        self.patcher = patch("processedfiles.PROCESSED", self.processed)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.temp_dir.cleanup()
+
+    def _publish(self, index, name, published):
+        filename = os.path.join(self.processed, name)
+        if name.endswith("_output"):
+            os.makedirs(filename)
+            with open(os.path.join(filename, "dubbed.mp4"), "w") as fh:
+                fh.write("Hello")
+        else:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, "w") as fh:
+                fh.write("Hello")
+
+        os.utime(filename, (published, published))
+        index.add([name], published)
+
+    def test_purge_due(self):
+        index = ExpiryIndex(days=3)
+        now = time.time()
+        for day in range(0, 10):
+            self._publish(index, f"file-{day}.dub", now - DAY * day)
+
+        self._publish(index, "file_output", now - DAY * 5)
+        self._publish(index, "content/key", now - DAY * 5)
+
+        # Entries are due at the end of the hour in which they expire
+        later = now + BUCKET_SECONDS
+        self.assertEquals(9, index.purge(now=later))
+        self.assertEquals(False, index.has_due(later))
+        self.assertEquals(
+            sorted(["expiry", "content", "file-0.dub", "file-1.dub", "file-2.dub"]),
+            sorted(os.listdir(self.processed)),
+        )
+
+    def test_add_to_bucket_being_purged(self):
+        index = ExpiryIndex(days=3)
+        flock = fcntl.flock
+        calls = []
+
+        # The bucket is emptied and removed by a purge before it is locked
+        def flock_after_purge(fh, operation):
+            if not calls:
+                os.remove(fh.name)
+            calls.append(operation)
+            flock(fh, operation)
+
+        now = time.time()
+        with patch("expiry.fcntl.flock", flock_after_purge):
+            self._publish(index, "file.dub", now)
+
+        self.assertEquals(2, len(calls))
+        self.assertEquals(1, index.purge(now=now + DAY * 4))
+
+    def test_purge_in_increments(self):
+        index = ExpiryIndex(days=3)
+        now = time.time()
+        for idx in range(0, 5):
+            self._publish(index, f"file-{idx}.dub", now - DAY * 4)
+
+        self.assertEquals(2, index.purge(limit=2, now=now))
+        self.assertEquals(True, index.has_due(now))
+        self.assertEquals(3, index.purge(limit=10, now=now))
+        self.assertEquals(False, index.has_due(now))
+
+    def test_purge_published_again(self):
+        index = ExpiryIndex(days=3)
+        now = time.time()
+        self._publish(index, "file.dub", now - DAY * 4)
+        self._publish(index, "file.dub", now - DAY)
+
+        self.assertEquals(0, index.purge(now=now))
+        self.assertEquals(
+            True, os.path.exists(os.path.join(self.processed, "file.dub"))
+        )
+        self.assertEquals(1, index.purge(now=now + DAY * 2 + BUCKET_SECONDS))
+
+    def test_purge_missing(self):
+        index = ExpiryIndex(days=3)
+        now = time.time()
+        index.add(["deleted.dub"], now - DAY * 4)
+
+        self.assertEquals(0, index.purge(now=now))
+        self.assertEquals(False, index.has_due(now))
+
+    def test_purge_delete_fails(self):
+        index = ExpiryIndex(days=3)
+        now = time.time()
+        self._publish(index, "file.dub", now - DAY * 4)
+        self._publish(index, "other.dub", now - DAY * 4)
+        filename = os.path.join(self.processed, "file.dub")
+
+        delete = index._delete
+
+        def _delete(name, now):
+            if name == "file.dub":
+                raise PermissionError(f"Cannot delete {name}")
+            return delete(name, now)
+
+        with patch.object(index, "_delete", side_effect=_delete):
+            self.assertEquals(1, index.purge(now=now))
+
+        self.assertEquals(True, os.path.exists(filename))
+        self.assertEquals(False, index.has_due(now))
+        self.assertEquals(1, index.purge(now=now + BUCKET_SECONDS))
+        self.assertEquals(False, os.path.exists(filename))
+
+    def test_catalog(self):
+        index = ExpiryIndex(days=3)
+        index.catalog.rebuild(self.processed, [])
+        now = time.time()
+        _uuid = "b8d2f6a0-3c1e-4f7a-9d6b-2e5c8a1f4b3d"
+        self._publish(index, f"{_uuid}.dub", now - DAY * 4)
+        self._publish(index, f"{_uuid}.srt", now)
+        self.assertEquals(True, index.catalog.has(_uuid, ".dub"))
+
+        index.purge(now=now)
+        self.assertEquals(False, index.catalog.has(_uuid, ".dub"))
+        self.assertEquals(True, index.catalog.has(_uuid, ".srt"))
+
+    def test_catalog_without_stats(self):
+        stats = MagicMock()
+        stats.put.side_effect = sqlite3.OperationalError("database is locked")
+        index = ExpiryIndex(days=3, stats=stats)
+        index.catalog.rebuild(self.processed, [])
+        _uuid = "b8d2f6a0-3c1e-4f7a-9d6b-2e5c8a1f4b3d"
+        self._publish(index, f"{_uuid}.dub", time.time())
+
+        self.assertEquals(True, index.catalog.has(_uuid, ".dub"))
+
+    def test_rebuild(self):
+        now = time.time()
+        for day in range(0, 5):
+            filename = os.path.join(self.processed, f"file-{day}.dub")
+            with open(filename, "w") as fh:
+                fh.write("Hello")
+
+            os.utime(filename, (now - DAY * day, now - DAY * day))
+
+        index = ExpiryIndex(days=3)
+        self.assertEquals(False, index.is_created())
+        self.assertEquals(5, index.rebuild())
+        self.assertEquals(True, index.is_created())
+        self.assertEquals(2, index.purge(now=now + BUCKET_SECONDS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+import errno
+import fastcopy
+import unittest
+import os
+import tempfile
+from unittest.mock import patch
+
+
+class TestFastCopy(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.temp_dir.name, "source")
+        with open(self.source, "w") as file:
+            file.write("Hello")
+        fastcopy.reset_stats()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _read(self, filename):
+        with open(filename) as file:
+            return file.read()
+
+    def test_copy_file_link(self):
+        target = os.path.join(self.temp_dir.name, "target")
+        method = fastcopy.copy_file(self.source, target, allow_link=True)
+        self.assertEqual("link", method)
+        self.assertTrue(os.path.samefile(self.source, target))
+
+    def test_copy_file_no_link(self):
+        target = os.path.join(self.temp_dir.name, "target")
+        method = fastcopy.copy_file(self.source, target)
+        self.assertIn(method, ["reflink", "copy"])
+        self.assertFalse(os.path.samefile(self.source, target))
+        self.assertEqual("Hello", self._read(target))
+
+    def test_copy_file_replaces_target(self):
+        target = os.path.join(self.temp_dir.name, "target")
+        with open(target, "w") as file:
+            file.write("Old")
+
+        fastcopy.copy_file(self.source, target, allow_link=True)
+        self.assertEqual("Hello", self._read(target))
+
+    def test_move_file_other_filesystem(self):
+        target = os.path.join(self.temp_dir.name, "target")
+        exdev = OSError(errno.EXDEV, "Invalid cross-device link")
+        with patch("os.replace", side_effect=exdev):
+            fastcopy.move_file(self.source, target)
+
+        self.assertFalse(os.path.exists(self.source))
+        self.assertEqual("Hello", self._read(target))
+        self.assertEqual(0, fastcopy.stats["rename"])
+
+    def test_copy_tree_can_link(self):
+        source_dir = os.path.join(self.temp_dir.name, "dir")
+        os.makedirs(os.path.join(source_dir, "sub"))
+        for name in ["a", "sub/b"]:
+            with open(os.path.join(source_dir, name), "w") as file:
+                file.write(name)
+
+        target_dir = os.path.join(self.temp_dir.name, "copy")
+        fastcopy.copy_tree(source_dir, target_dir, can_link=lambda path: path == "a")
+
+        self.assertTrue(
+            os.path.samefile(
+                os.path.join(source_dir, "a"), os.path.join(target_dir, "a")
+            )
+        )
+        self.assertFalse(
+            os.path.samefile(
+                os.path.join(source_dir, "sub/b"), os.path.join(target_dir, "sub/b")
+            )
+        )
+        self.assertEqual("sub/b", self._read(os.path.join(target_dir, "sub/b")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,230 @@
+# -*- encoding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from incremental import get_changes, merge_windows, save_changes, load_changes
+from incremental import grow_window, remix_frames, IncrementalHooks, ENCODER_DELAY
+from execution import Execution, INCREMENTAL_SCRIPT
+from mp3frames import Mp3Frames
+from tests.testmp3frames import _frame, _mp3
+import copy
+import os
+import sys
+import unittest
+import tempfile
+from unittest.mock import patch
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.master = [
+            {
+                "id": 1,
+                "start": 0.0,
+                "end": 2.0,
+                "translated_text": "Hola",
+                "_hash": "a",
+            },
+            {
+                "id": 2,
+                "start": 3.0,
+                "end": 5.0,
+                "translated_text": "Adéu",
+                "_hash": "b",
+            },
+            {"id": 3, "start": 8.0, "end": 9.0, "translated_text": "Bé", "_hash": "c"},
+        ]
+
+    def test_get_changes_none(self):
+        ids, windows = get_changes(self.master, copy.deepcopy(self.master))
+        self.assertEqual([], ids)
+        self.assertEqual([], windows)
+
+    def test_get_changes_updated(self):
+        updated = copy.deepcopy(self.master)
+        updated[1]["translated_text"] = "Fins aviat"
+        updated[1]["end"] = 6.0
+
+        ids, windows = get_changes(self.master, updated)
+        self.assertEqual([2], ids)
+        self.assertEqual([[3.0, 6.0], [3.0, 5.0]], windows)
+
+    def test_get_changes_created_and_deleted(self):
+        updated = copy.deepcopy(self.master[:2])
+        updated.append({"id": 4, "start": 10.0, "end": 11.0, "translated_text": "Nou"})
+
+        ids, windows = get_changes(self.master, updated)
+        self.assertEqual([4, 3], ids)
+        self.assertEqual([[10.0, 11.0], [8.0, 9.0]], windows)
+
+    def test_merge_windows(self):
+        windows = [[8.0, 9.0], [3.0, 6.0], [3.0, 5.0], [5.5, 7.0]]
+        self.assertEqual([[3.0, 7.0], [8.0, 9.0]], merge_windows(windows))
+
+    def test_save_changes_accumulates(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIsNone(load_changes(directory))
+            save_changes(directory, [[3.0, 5.0]])
+            save_changes(directory, [[4.0, 6.0], [10.0, 11.0]])
+
+            self.assertEqual([[3.0, 6.0], [10.0, 11.0]], load_changes(directory))
+
+    def _load(self, item):
+        # Only the duration of the chunks is used to grow the window
+        return [0] * item["dubbed_ms"]
+
+    def test_grow_window(self):
+        items = [
+            {"start": 0.0, "end": 2.0, "dubbed_ms": 2000},
+            {"start": 3.0, "end": 5.0, "dubbed_ms": 3500},
+            {"start": 6.0, "end": 7.0, "dubbed_ms": 2500},
+            {"start": 10.0, "end": 11.0, "dubbed_ms": 1000},
+        ]
+
+        start_ms, end_ms, chunks = grow_window(items, 3000, 5000, self._load)
+        # The second chunk ends at 6.5s and reaches the third one, up to 8.5s
+        self.assertEqual((3000, 8500), (start_ms, end_ms))
+        self.assertEqual([3000, 6000], [position for position, _ in chunks])
+
+    def test_grow_window_no_chunks(self):
+        items = [{"start": 0.0, "end": 2.0, "dubbed_ms": 2000}]
+
+        start_ms, end_ms, chunks = grow_window(items, 3000, 5000, self._load)
+        self.assertEqual((3000, 5000), (start_ms, end_ms))
+        self.assertEqual([], chunks)
+
+    def test_hooks_positional_arguments(self):
+        def combine_audio_video(
+            video_file, dubbed_audio_file, output_directory, target_language
+        ):
+            return "combined"
+
+        def insert_audio_at_timestamps(
+            utterance_metadata, background_audio_file, output_directory
+        ):
+            return "inserted"
+
+        hooks = IncrementalHooks()
+        with tempfile.TemporaryDirectory() as directory:
+            insert = hooks._insert_audio(insert_audio_at_timestamps)
+            self.assertEqual("inserted", insert([], "background.mp3", directory))
+
+            # ffmpeg fails with a video that does not exist
+            combine = hooks._combine_audio_video(combine_audio_video)
+            self.assertEqual(
+                "combined",
+                combine("video.mp4", "audio.mp3", directory, target_language="cat"),
+            )
+
+    def test_hooks_other_signature(self):
+        def combine_audio_video(video, audio):
+            return "combined"
+
+        combine = IncrementalHooks()._combine_audio_video(combine_audio_video)
+        self.assertEqual("combined", combine("video.mp4", "audio.mp3"))
+
+    def _render_pcm(self, chunks, sample_rate, channels, start_sample, samples):
+        return bytes(samples * 2 * channels)
+
+    def _encode_mp3(self, pcm, sample_rate, channels, bitrate):
+        # As libmp3lame, the frames are marked from 100 to tell them apart
+        samples = len(pcm) // (2 * channels)
+        frames = -(-(samples + ENCODER_DELAY) // 1152) + 1
+        return _mp3([100 + i for i in range(frames)])
+
+    def _remix(self, windows, items, frames=100):
+        with tempfile.TemporaryDirectory() as directory:
+            vocals_file = os.path.join(directory, "dubbed_vocals.mp3")
+            with open(vocals_file, "wb") as fh:
+                fh.write(_mp3([i for i in range(frames)]))
+
+            with patch(
+                "incremental._render_pcm", side_effect=self._render_pcm
+            ) as render, patch(
+                "incremental._encode_mp3", side_effect=self._encode_mp3
+            ) as encode:
+                remix_frames(vocals_file, items, windows, self._load)
+
+            with open(vocals_file, "rb") as fh:
+                return fh.read(), render, encode
+
+    def _item(self, start, end, dubbed_ms):
+        return {
+            "start": start,
+            "end": end,
+            "for_dubbing": True,
+            "dubbed_path": "chunk.mp3",
+            "dubbed_ms": dubbed_ms,
+        }
+
+    def test_remix_frames(self):
+        items = [self._item(1.0, 1.5, 500), self._item(10.0, 11.0, 1000)]
+
+        data, render, encode = self._remix([[1.0, 1.5]], items)
+
+        # 1s is in the frame 39 (after the delay of 1105 samples) and 1.5s in
+        # the 58, with a silent frame before and after. The first encoded
+        # frame is skipped, it has the delay of the encoder.
+        markers = list(range(38)) + list(range(101, 123)) + list(range(60, 100))
+        self.assertEqual(_mp3(markers), data)
+        self.assertEqual(1, encode.call_count)
+        chunks, sample_rate, channels, start_sample, samples = render.call_args.args
+        self.assertEqual([1000], [position for position, _ in chunks])
+        self.assertEqual(38 * 1152 - ENCODER_DELAY - 47, start_sample)
+        self.assertEqual(47 + 23 * 1152, samples)
+
+    def test_remix_frames_grows(self):
+        # The second chunk is longer than its utterance and reaches the third
+        items = [
+            self._item(1.0, 1.5, 500),
+            self._item(3.0, 4.0, 2000),
+            self._item(5.0, 6.0, 1000),
+        ]
+
+        data, render, encode = self._remix([[1.0, 1.5], [3.0, 4.0]], items, 250)
+
+        self.assertEqual(2, encode.call_count)
+        chunks = render.call_args.args[0]
+        self.assertEqual([3000, 5000], [position for position, _ in chunks])
+        vocals = Mp3Frames(data)
+        self.assertEqual(250, len(vocals.frames))
+        self.assertEqual(_frame(0), vocals.get_frame_bytes(0, 1))
+        self.assertEqual(_frame(249), vocals.get_frame_bytes(249, 250))
+
+    def test_remix_frames_merged(self):
+        items = [self._item(1.0, 1.5, 500), self._item(1.55, 2.0, 450)]
+
+        data, render, encode = self._remix([[1.0, 1.5], [1.55, 2.0]], items)
+
+        # The windows are a few frames apart, they are encoded together
+        self.assertEqual(1, encode.call_count)
+        chunks = render.call_args.args[0]
+        self.assertEqual([1000, 1550], [position for position, _ in chunks])
+
+    def test_update_program(self):
+        execution = Execution(1)
+        self.assertEqual(
+            [sys.executable, INCREMENTAL_SCRIPT], execution._get_program(True)
+        )
+        self.assertEqual(["open-dubbing"], execution._get_program(False))
+        self.assertTrue(os.path.exists(INCREMENTAL_SCRIPT))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,7 +19,9 @@
 
 from lockfile import LockFile
 import unittest
+import os
 import tempfile
+import time
 
 
 class TestLockFile(unittest.TestCase):
@@ -47,6 +49,28 @@ class TestLockFile(unittest.TestCase):
         lockfile.delete()
         self.assertEquals(False, lockfile.has_lock())
 
+    def test_has_lock_expired(self):
+        filename = tempfile.NamedTemporaryFile().name
+        lockfile = LockFile(filename, max_age=60)
+        lockfile.create()
+        past_time = time.time() - 61
+        os.utime(lockfile.filename, (past_time, past_time))
+
+        self.assertEquals(False, lockfile.has_lock())
+        self.assertEquals(False, os.path.exists(lockfile.filename))
+
+    def test_renew(self):
+        filename = tempfile.NamedTemporaryFile().name
+        lockfile = LockFile(filename, max_age=60)
+        lockfile.renew()
+        self.assertEquals(True, lockfile.has_lock())
+
+        past_time = time.time() - 61
+        os.utime(lockfile.filename, (past_time, past_time))
+        lockfile.renew()
+        self.assertEquals(True, lockfile.has_lock())
+        lockfile.delete()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2023 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from mediaprobe import Mp4Probe, probe_file, has_audio, ProbeError
+import os
+import struct
+import tempfile
+import unittest
+
+
+def _box(box_type, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def _full_box(box_type, payload, version=0):
+    return _box(box_type, struct.pack(">B3x", version) + payload)
+
+
+def _mdhd(timescale, duration, language="cat"):
+    code = 0
+    for letter in language:
+        code = (code << 5) | (ord(letter) - 0x60)
+
+    return _full_box(b"mdhd", struct.pack(">IIIIH2x", 0, 0, timescale, duration, code))
+
+
+def _stsd(codec, entry):
+    sample_entry = _box(codec, b"\0" * 6 + struct.pack(">H", 1) + entry)
+    return _full_box(b"stsd", struct.pack(">I", 1) + sample_entry)
+
+
+def _trak(handler, timescale, duration, stsd):
+    hdlr = _full_box(b"hdlr", struct.pack(">I4s12x", 0, handler) + b"\0")
+    stbl = _box(b"stbl", stsd)
+    minf = _box(b"minf", stbl)
+    mdia = _box(b"mdia", _mdhd(timescale, duration) + hdlr + minf)
+    return _box(b"trak", mdia)
+
+
+def _video_trak(seconds):
+    entry = b"\0" * 16 + struct.pack(">HH", 1280, 720) + b"\0" * 50
+    return _trak(b"vide", 12800, seconds * 12800, _stsd(b"avc1", entry))
+
+
+def _audio_trak(seconds):
+    entry = b"\0" * 8 + struct.pack(">HHHHI", 2, 16, 0, 0, 44100 << 16)
+    return _trak(b"soun", 44100, seconds * 44100, _stsd(b"mp4a", entry))
+
+
+def _mp4(seconds, audio=True, fast_start=True, media_size=100000):
+    ftyp = _box(b"ftyp", b"isom\0\0\2\0isomiso2avc1mp41")
+    mvhd = _full_box(
+        b"mvhd", struct.pack(">IIII", 0, 0, 1000, seconds * 1000) + b"\0" * 80
+    )
+    traks = _video_trak(seconds) + (_audio_trak(seconds) if audio else b"")
+    moov = _box(b"moov", mvhd + traks)
+    mdat = _box(b"mdat", b"\0" * media_size)
+    if fast_start:
+        return ftyp + moov + mdat
+
+    return ftyp + mdat + moov
+
+
+def _feed(probe, data, chunk_size=1000):
+    for start in range(0, len(data), chunk_size):
+        end = start + chunk_size
+        probe.feed(data[start:end])
+        if probe.is_done():
+            return start + chunk_size
+
+    return len(data)
+
+
+class TestMediaProbe(unittest.TestCase):
+    def test_feed_fast_start(self):
+        data = _mp4(61)
+        probe = Mp4Probe()
+        read = _feed(probe, data)
+
+        # Known before receiving the media data
+        self.assertGreater(len(data) / 10, read)
+        self.assertEquals(61000, probe.result["duration_ms"])
+        self.assertEquals(True, has_audio(probe.result))
+        video, audio = probe.result["streams"]
+        self.assertEquals(
+            {
+                "type": "video",
+                "codec": "avc1",
+                "duration_ms": 61000,
+                "width": 1280,
+                "height": 720,
+            },
+            video,
+        )
+        self.assertEquals(
+            {
+                "type": "audio",
+                "codec": "mp4a",
+                "duration_ms": 61000,
+                "language": "cat",
+                "channels": 2,
+                "sample_rate": 44100,
+            },
+            audio,
+        )
+
+    def test_feed_moov_at_the_end(self):
+        probe = Mp4Probe()
+        _feed(probe, _mp4(30, fast_start=False))
+
+        self.assertEquals(30000, probe.result["duration_ms"])
+        self.assertEquals(2, len(probe.result["streams"]))
+
+    def test_feed_no_audio(self):
+        probe = Mp4Probe()
+        _feed(probe, _mp4(30, audio=False))
+
+        self.assertEquals(False, has_audio(probe.result))
+
+    def test_feed_not_mp4(self):
+        probe = Mp4Probe()
+        _feed(probe, b"RIFF" + b"\0" * 5000)
+
+        self.assertEquals(None, probe.result)
+        self.assertNotEquals(None, probe.error)
+
+    def test_feed_truncated(self):
+        probe = Mp4Probe()
+        data = _mp4(30, fast_start=False)
+        _feed(probe, data[: len(data) - 10])
+
+        self.assertEquals(False, probe.is_done())
+
+    def test_probe_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "video.mp4")
+            with open(filename, "wb") as fh:
+                fh.write(_mp4(45, fast_start=False))
+
+            result = probe_file(filename)
+            self.assertEquals(45000, result["duration_ms"])
+
+            # The moov box at the end has not been received yet
+            data = _mp4(45, fast_start=False)
+            moov = data.index(b"moov") - 4
+            self.assertEquals(
+                None, probe_file(filename, lambda start, end: end <= moov)
+            )
+            result = probe_file(
+                filename, lambda start, end: end <= 1000 or start >= moov
+            )
+            self.assertEquals(45000, result["duration_ms"])
+
+            with open(filename, "wb") as fh:
+                fh.write(_mp4(45)[:100])
+
+            with self.assertRaises(ProbeError):
+                probe_file(filename)
+
+
+if __name__ == "__main__":
+    unittest.main()
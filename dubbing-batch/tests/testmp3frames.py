@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from mp3frames import Mp3Frames, Mp3Error, DECODER_DELAY
+import struct
+import unittest
+
+# MPEG 1 layer III, 128 kbps, 44100 Hz, stereo, without CRC
+HEADER = b"\xff\xfb\x90\x00"
+FRAME_SIZE = 417
+SIDE_INFO = 32
+
+
+def _frame(marker):
+    """An audio frame that can be told apart by its marker"""
+    return HEADER + bytes(SIDE_INFO) + bytes([marker]) * (FRAME_SIZE - 4 - SIDE_INFO)
+
+
+def _info_frame(delay):
+    tag = b"Info" + struct.pack(">I", 0x0F) + bytes(4 + 4 + 100 + 4)
+    tag += b"LAME3.100" + bytes(12) + bytes([delay >> 4, (delay & 0xF) << 4, 0])
+    frame = HEADER + bytes(SIDE_INFO) + tag
+    return frame + bytes(FRAME_SIZE - len(frame))
+
+
+def _mp3(markers, delay=576, id3=b""):
+    return id3 + _info_frame(delay) + b"".join(_frame(m) for m in markers)
+
+
+class TestMp3Frames(unittest.TestCase):
+    def test_frames(self):
+        id3 = b"ID3\x04\x00\x00\x00\x00\x00\x05" + b"title"
+        vocals = Mp3Frames(_mp3([1, 2, 3], id3=id3) + b"TAG" + bytes(125))
+
+        self.assertEqual(3, len(vocals.frames))
+        self.assertEqual(576 + DECODER_DELAY, vocals.delay)
+        self.assertEqual(44100, vocals.sample_rate)
+        self.assertEqual((2, 1152), (vocals.channels, vocals.samples_per_frame))
+        self.assertEqual(128, vocals.get_bitrate())
+        self.assertEqual(_frame(2), vocals.get_frame_bytes(1, 2))
+
+    def test_get_span(self):
+        vocals = Mp3Frames(_mp3(range(10), delay=0))
+
+        # Without the decoder delay the span would start in the frame 0
+        self.assertEqual((0, 2), vocals.get_span(0, 1152))
+        self.assertEqual((1, 3), vocals.get_span(1152, 1152 * 2))
+        self.assertEqual(1152 - DECODER_DELAY, vocals.get_start_sample(1))
+        self.assertEqual((8, 10), vocals.get_span(1152 * 8, 1152 * 20))
+
+    def test_replace(self):
+        data = _mp3([1, 2, 3, 4, 5])
+        vocals = Mp3Frames(data)
+
+        replaced = vocals.replace([(1, 2, _frame(7)), (3, 5, _frame(8) + _frame(9))])
+        self.assertEqual(_mp3([1, 7, 3, 8, 9]), replaced)
+        self.assertEqual(data, vocals.replace([]))
+
+    def test_no_frames(self):
+        with self.assertRaises(Mp3Error):
+            Mp3Frames(b"RIFF" + bytes(1000))
+
+
+if __name__ == "__main__":
+    unittest.main()
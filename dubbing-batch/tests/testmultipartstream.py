@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from multipartstream import Part, get_length, stream_parts
+import email
+import os
+import tempfile
+import unittest
+
+
+class TestMultipartStream(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, name, content):
+        filename = os.path.join(self.temp_dir.name, name)
+        with open(filename, "wb") as fh:
+            fh.write(content)
+
+        return filename
+
+    def _get_parts(self):
+        return [
+            Part(self._write("1.mp3", b"first"), {"X-Utterance-Id": 1}),
+            Part(self._write("2.mp3", b"second" * 100), {"X-Utterance-Id": 2}),
+        ]
+
+    def test_stream_parts(self):
+        parts = self._get_parts()
+        content = b"".join(stream_parts("boundary", parts, chunk_size=7))
+
+        self.assertEquals(get_length("boundary", parts), len(content))
+        message = email.message_from_bytes(
+            b"Content-Type: multipart/mixed; boundary=boundary\r\n\r\n" + content
+        )
+        payloads = message.get_payload()
+        self.assertEquals(2, len(payloads))
+        self.assertEquals("2", payloads[1]["X-Utterance-Id"])
+        self.assertEquals("600", payloads[1]["Content-Length"])
+        self.assertEquals(b"second" * 100, payloads[1].get_payload(decode=True))
+
+    def test_stream_parts_empty(self):
+        content = b"".join(stream_parts("boundary", []))
+
+        self.assertEquals(b"--boundary--\r\n", content)
+        self.assertEquals(len(content), get_length("boundary", []))
+
+    def test_stream_parts_truncated(self):
+        parts = self._get_parts()
+        self._write("2.mp3", b"short")
+
+        with self.assertRaises(OSError):
+            b"".join(stream_parts("boundary", parts))
+
+
+if __name__ == "__main__":
+    unittest.main()
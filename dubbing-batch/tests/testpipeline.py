@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+from pipeline import Pipeline, Stage
+import unittest
+import threading
+
+
+class TestPipeline(unittest.TestCase):
+    def _wait_done(self, pipeline, keys):
+        done = threading.Event()
+        finished = set()
+
+        def on_done(key):
+            if pipeline.is_running(key):
+                return
+
+            finished.add(key)
+            if finished >= set(keys):
+                done.set()
+
+        pipeline.set_on_done(on_done)
+        return done
+
+    def test_runs_all_stages_in_order(self):
+        steps = []
+        lock = threading.Lock()
+
+        def step(name):
+            def fn(job):
+                with lock:
+                    steps.append((job, name))
+                return True
+
+            return fn
+
+        pipeline = Pipeline(
+            [Stage("a", step("a")), Stage("b", step("b"), 2), Stage("c", step("c"))],
+            capacity=2,
+        )
+        done = self._wait_done(pipeline, ["1", "2"])
+        pipeline.submit("1", "1")
+        pipeline.submit("2", "2")
+        self.assertEqual(True, done.wait(5))
+
+        for job in ["1", "2"]:
+            names = [name for _job, name in steps if _job == job]
+            self.assertEqual(["a", "b", "c"], names)
+
+    def test_failed_job_stops(self):
+        steps = []
+
+        def fail(job):
+            return False
+
+        def record(job):
+            steps.append(job)
+            return True
+
+        pipeline = Pipeline([Stage("a", fail), Stage("b", record)], capacity=1)
+        done = self._wait_done(pipeline, ["1"])
+        pipeline.submit("1", "1")
+        self.assertEqual(True, done.wait(5))
+        self.assertEqual([], steps)
+        self.assertEqual(False, pipeline.is_running("1"))
+
+    def test_raising_job_stops(self):
+        errors = []
+
+        def fail(job):
+            raise OSError("No space left on device")
+
+        def record(job):
+            errors.append(("record", job))
+            return True
+
+        pipeline = Pipeline([Stage("a", fail), Stage("b", record)], capacity=1)
+        pipeline.set_on_error(lambda stage, key, job: errors.append((stage, job)))
+        done = self._wait_done(pipeline, ["1"])
+        pipeline.submit("1", "1")
+        self.assertEqual(True, done.wait(5))
+        self.assertEqual([("a", "1")], errors)
+        self.assertEqual(False, pipeline.is_running("1"))
+        self.assertEqual(True, pipeline.has_capacity())
+
+    def test_capacity_released_at_last_stage(self):
+        publishing = threading.Event()
+        release = threading.Event()
+
+        def dub(job):
+            return True
+
+        def publish(job):
+            publishing.set()
+            release.wait(5)
+            return False
+
+        pipeline = Pipeline([Stage("dub", dub), Stage("publish", publish)], capacity=1)
+        pipeline.submit("1", "1")
+        self.assertEqual(False, pipeline.has_capacity())
+
+        self.assertEqual(True, publishing.wait(5))
+        self.assertEqual(True, pipeline.has_capacity())
+        self.assertEqual(True, pipeline.is_running("1"))
+        release.set()
+
+    def test_stats(self):
+        def fn(job):
+            return True
+
+        pipeline = Pipeline([Stage("a", fn)], capacity=1)
+        done = self._wait_done(pipeline, ["1"])
+        pipeline.submit("1", "1")
+        done.wait(5)
+
+        stats = pipeline.get_stats()["a"]
+        self.assertEqual(1, stats["processed"])
+        self.assertEqual(0, stats["queue"])
+        self.assertEqual(1, stats["workers"])
+
+
+if __name__ == "__main__":
+    unittest.main()
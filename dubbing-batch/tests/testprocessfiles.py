@@ -21,7 +21,7 @@ from processedfiles import ProcessedFiles
 import unittest
 import os
 import tempfile
-import time
+from unittest.mock import patch
 
 
 class TestProcessedFiles(unittest.TestCase):
@@ -32,21 +32,6 @@ class TestProcessedFiles(unittest.TestCase):
     def tearDown(self):
         self.temp_dir.cleanup()
 
-    def test_purge_files(self):
-        HOURS_DAY = 24
-        MINUTES_HOUR = 60
-        MINUTES_SEC = 60
-        for day in range(0, 10):
-            filename = os.path.join(self.temp_dir.name, f"file-{day}")
-            with open(filename, "w") as file:
-                file.write("Hello")
-
-            old_time = time.time() - (HOURS_DAY * MINUTES_HOUR * MINUTES_SEC * day)
-            os.utime(filename, (old_time, old_time))
-
-        deleted = ProcessedFiles.purge_files(3, self.temp_dir.name)
-        self.assertEquals(7, deleted)
-
     def test_get_num_of_files_stored(self):
         TOTAL_FILES = 10
         for day in range(0, TOTAL_FILES):
@@ -66,6 +51,45 @@ class TestProcessedFiles(unittest.TestCase):
         size = ProcessedFiles.get_num_of_files_stored_size(self.temp_dir.name)
         self.assertEquals("10 bytes", size)
 
+    def test_copy_output_dir_to_links_read_only_outputs(self):
+        _uuid = "0ea8f8f8-3f3a-4b7a-9f40-6cb2f3c9c3a1"
+        source = os.path.join(self.temp_dir.name, f"{_uuid}_output")
+        os.makedirs(os.path.join(source, "htdemucs", "original_audio"))
+        for name in ["original.mp4", "htdemucs/original_audio/vocals.mp3", "cat.srt"]:
+            with open(os.path.join(source, name), "w") as file:
+                file.write("Hello")
+
+        target = os.path.join(self.temp_dir.name, "upload", f"{_uuid}_output")
+        with patch("processedfiles.PROCESSED", self.temp_dir.name):
+            ProcessedFiles(_uuid).copy_output_dir_to(target)
+
+        for name, linked in [
+            ("original.mp4", True),
+            ("htdemucs/original_audio/vocals.mp3", True),
+            ("cat.srt", False),
+        ]:
+            same = os.path.samefile(
+                os.path.join(source, name), os.path.join(target, name)
+            )
+            self.assertEqual(linked, same)
+
+    def test_publish_regenerated_video(self):
+        _uuid = "0ea8f8f8-3f3a-4b7a-9f40-6cb2f3c9c3a1"
+        published = os.path.join(self.temp_dir.name, f"{_uuid}.mp4")
+        with open(published, "w") as file:
+            file.write("Hello")
+
+        # Copied to the uploads for the update, then published again
+        upload = os.path.join(self.temp_dir.name, "upload")
+        with patch("processedfiles.PROCESSED", self.temp_dir.name):
+            processed = ProcessedFiles(_uuid)
+            processed.copy_file_to(f"{_uuid}.mp4", upload)
+            processed.move_file_bin(upload, ".mp4")
+
+        self.assertFalse(os.path.exists(upload))
+        with open(published, "r") as file:
+            self.assertEqual("Hello", file.read())
+
 
 if __name__ == "__main__":
     unittest.main()
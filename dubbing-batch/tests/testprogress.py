@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2023 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+from progress import ProgressTracker, read_progress, FINISHED
+from execution import Command
+import unittest
+import os
+import tempfile
+
+
+class TestProgress(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.LOG = os.path.join(self.temp_dir.name, "dubbing.log")
+        self.PROGRESS = os.path.join(self.temp_dir.name, "progress.json")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _log(self, text):
+        with open(self.LOG, "a") as fh:
+            fh.write(text)
+
+    def test_stages(self):
+        tracker = ProgressTracker(self.LOG, self.PROGRESS)
+        self.assertEquals("preprocessing", read_progress(self.PROGRESS)["stage"])
+
+        self._log("2025-01-01 - INFO - Dubbing process starting...\n")
+        self._log(
+            "2025-01-01 - INFO - Completed task 'Preprocessing completed': current_rss 100 MB, time 10s\n"
+        )
+        tracker.update()
+        progress = read_progress(self.PROGRESS)
+        self.assertEquals("speech_to_text", progress["stage"])
+        self.assertEquals(25, progress["percentage"])
+        self.assertGreaterEqual(progress["elapsed"], 0)
+
+    def test_partial_line(self):
+        tracker = ProgressTracker(self.LOG, self.PROGRESS)
+        self._log("INFO - Completed task 'Preprocessing")
+        tracker.update()
+        self.assertEquals("preprocessing", tracker.get_stage())
+
+        self._log(" completed': current_rss 100 MB, time 10s\n")
+        tracker.update()
+        self.assertEquals("speech_to_text", tracker.get_stage())
+
+    def test_update_ignores_previous_log(self):
+        self._log("INFO - Completed task 'Text to speech completed'\n")
+        tracker = ProgressTracker(self.LOG, self.PROGRESS, "update")
+        tracker.update()
+        self.assertEquals("text_to_speech", tracker.get_stage())
+
+        self._log("INFO - Completed task 'Text to speech completed'\n")
+        self._log("INFO - Completed task 'Post processing completed'\n")
+        tracker.update()
+        self.assertEquals(FINISHED, tracker.get_stage())
+        self.assertEquals(100, read_progress(self.PROGRESS)["percentage"])
+
+    def test_read_progress_no_file(self):
+        self.assertEquals(None, read_progress(self.PROGRESS))
+
+    def test_command_log_and_progress(self):
+        tracker = ProgressTracker(self.LOG, self.PROGRESS)
+        command = Command(
+            "echo \"INFO - Completed task 'Preprocessing completed'\"; echo error >&2",
+            log_filename=self.LOG,
+            progress=tracker,
+        )
+        self.assertEquals(Command.NO_ERROR, command.run(timeout=10))
+
+        with open(self.LOG, "r") as fh:
+            self.assertEquals(2, len(fh.readlines()))
+        self.assertEquals("speech_to_text", read_progress(self.PROGRESS)["stage"])
+
+
+if __name__ == "__main__":
+    unittest.main()
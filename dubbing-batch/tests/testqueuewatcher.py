@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+from queuewatcher import QueueWatcher
+from batchfilesdb import BatchFilesDB
+import unittest
+import socket
+import tempfile
+
+
+class TestQueueWatcher(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.watcher = QueueWatcher(self.temp_dir.name)
+
+    def tearDown(self):
+        self.watcher.close()
+        self.temp_dir.cleanup()
+
+    def test_wait_timeout(self):
+        self.assertEqual(False, self.watcher.wait(0.01))
+
+    def test_notify(self):
+        self.watcher.notify()
+        self.assertEqual(True, self.watcher.wait(1))
+        self.assertEqual(False, self.watcher.wait(0.01))
+
+    def test_new_record(self):
+        if not self.watcher.has_events():
+            self.skipTest("inotify not available")
+
+        db = BatchFilesDB(self.temp_dir.name)
+        db.create("fitxer.txt", "jmas@softcatala.org", "cat", "original.mp4")
+        self.assertEqual(True, self.watcher.wait(1))
+
+    def test_notify_hosts(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+        watcher = QueueWatcher(self.temp_dir.name, port)
+        try:
+            QueueWatcher.notify_hosts(f"127.0.0.1:{port}")
+            self.assertEqual(True, watcher.wait(1))
+        finally:
+            watcher.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2023 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import resources
+from resources import ResourceGovernor, get_available_cpus
+from execution import Command
+import unittest
+import os
+import tempfile
+from unittest.mock import patch
+
+
+class TestResources(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.CGROUP = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, name, content):
+        filename = os.path.join(self.CGROUP, name)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as fh:
+            fh.write(content)
+
+    def test_read_cgroup_quota_v2(self):
+        self._write("cpu.max", "250000 100000\n")
+        self.assertEquals(2.5, resources._read_cgroup_quota(self.CGROUP))
+
+    def test_read_cgroup_quota_v2_unlimited(self):
+        self._write("cpu.max", "max 100000\n")
+        self.assertEquals(None, resources._read_cgroup_quota(self.CGROUP))
+
+    def test_read_cgroup_quota_v1(self):
+        self._write("cpu/cpu.cfs_quota_us", "200000\n")
+        self._write("cpu/cpu.cfs_period_us", "100000\n")
+        self.assertEquals(2, resources._read_cgroup_quota(self.CGROUP))
+
+    def test_read_cgroup_quota_v1_unlimited(self):
+        self._write("cpu/cpu.cfs_quota_us", "-1\n")
+        self._write("cpu/cpu.cfs_period_us", "100000\n")
+        self.assertEquals(None, resources._read_cgroup_quota(self.CGROUP))
+
+    @patch("resources.get_affinity", return_value=list(range(16)))
+    def test_get_available_cpus_quota(self, get_affinity):
+        self._write("cpu.max", "250000 100000\n")
+        self.assertEquals(3, get_available_cpus(self.CGROUP))
+
+    @patch("resources.get_affinity", return_value=list(range(4)))
+    def test_get_available_cpus_affinity(self, get_affinity):
+        self._write("cpu.max", "800000 100000\n")
+        self.assertEquals(4, get_available_cpus(self.CGROUP))
+
+    def test_governor_threads(self):
+        self.assertEquals(4, ResourceGovernor(2, cpus=8).threads)
+        self.assertEquals(1, ResourceGovernor(4, cpus=2).threads)
+        self.assertEquals(6, ResourceGovernor(2, threads=6, cpus=8).threads)
+
+    @patch("resources.get_affinity", return_value=list(range(8)))
+    def test_governor_pin(self, get_affinity):
+        governor = ResourceGovernor(2, pin=True, cpus=8)
+        first = governor.acquire()
+        second = governor.acquire()
+
+        self.assertEquals({0, 1, 2, 3}, first)
+        self.assertEquals({4, 5, 6, 7}, second)
+        self.assertEquals(None, governor.acquire())
+
+        governor.release(first)
+        self.assertEquals(first, governor.acquire())
+
+    @patch("resources.get_affinity", return_value=list(range(2)))
+    def test_governor_pin_not_enough_cores(self, get_affinity):
+        governor = ResourceGovernor(2, threads=2, pin=True, cpus=2)
+        self.assertEquals(False, governor.pin)
+        self.assertEquals(None, governor.acquire())
+
+    def test_command_cpus(self):
+        cpu = sorted(os.sched_getaffinity(0))[0]
+        filename = os.path.join(self.temp_dir.name, "affinity")
+        command = Command(
+            f"grep Cpus_allowed_list /proc/self/status > {filename}", cpus={cpu}
+        )
+
+        self.assertEquals(Command.NO_ERROR, command.run(timeout=10))
+        with open(filename, "r") as fh:
+            self.assertEquals(str(cpu), fh.read().split()[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
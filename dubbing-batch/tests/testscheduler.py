@@ -0,0 +1,188 @@
+# -*- encoding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from batchfilesdb import BatchFile
+from scheduler import Scheduler
+import random
+import statistics
+import unittest
+
+MINUTE = 60
+
+
+def _batchfile(email, duration, operation="create"):
+    return BatchFile(
+        filename_dbrecord="",
+        filename="",
+        email=email,
+        variant="central",
+        original_filename="video.mp4",
+        video_lang="eng",
+        operation=operation,
+        revision=1,
+        original_subtitles=False,
+        dubbed_subtitles=False,
+        duration=duration * 1000,
+    )
+
+
+def _get_workload():
+    # One user uploads three long videos, other users short clips and updates
+    rand = random.Random(1)
+    jobs = [(0, _batchfile("heavy@softcatala.org", 70 * MINUTE)) for _ in range(3)]
+    for idx in range(30):
+        arrival = rand.uniform(0, 180 * MINUTE)
+        duration = rand.uniform(2 * MINUTE, 10 * MINUTE)
+        jobs.append((arrival, _batchfile(f"user{idx % 10}@softcatala.org", duration)))
+
+    for idx in range(10):
+        arrival = rand.uniform(0, 180 * MINUTE)
+        update = _batchfile(f"user{idx}@softcatala.org", 5 * MINUTE, "update")
+        jobs.append((arrival, update))
+
+    return jobs
+
+
+def _get_processing_time(batchfile):
+    if batchfile.operation == "update":
+        return 2 * MINUTE
+
+    return batchfile.duration / 1000
+
+
+def simulate(jobs, policy, fast_lane=False, aging=1.0, workers=1):
+    """Returns the queue wait in seconds of every job"""
+    enqueued = {id(batchfile): arrival for arrival, batchfile in jobs}
+    scheduler = Scheduler(
+        policy, fast_lane, aging, get_enqueued=lambda b: enqueued[id(b)]
+    )
+    pending = sorted(jobs, key=lambda job: job[0])
+    queue = []
+    running = []  # (end time, batchfile)
+    waits = {}
+    now = 0
+
+    while pending or queue or running:
+        while pending and pending[0][0] <= now:
+            queue.append(pending.pop(0)[1])
+
+        running = [(end, b) for end, b in running if end > now]
+        while queue and len(running) < workers:
+            batchfile = scheduler.order(queue, now)[0]
+            scheduler.started(batchfile, now)
+            queue.remove(batchfile)
+            waits[id(batchfile)] = now - enqueued[id(batchfile)]
+            running.append((now + _get_processing_time(batchfile), batchfile))
+
+        events = [end for end, _ in running]
+        if pending:
+            events.append(pending[0][0])
+        now = min(events) if events else now
+
+    return waits
+
+
+def _stats(waits):
+    waits = sorted(waits)
+    return statistics.mean(waits), waits[int(len(waits) * 0.95) - 1]
+
+
+class TestScheduler(unittest.TestCase):
+    def test_order_fifo(self):
+        a = _batchfile("a@softcatala.org", 60)
+        b = _batchfile("b@softcatala.org", 30)
+        enqueued = {id(a): 0, id(b): 10}
+        scheduler = Scheduler("fifo", get_enqueued=lambda x: enqueued[id(x)])
+        self.assertEqual([a, b], scheduler.order([b, a], now=20))
+
+    def test_order_sjf(self):
+        a = _batchfile("a@softcatala.org", 60 * MINUTE)
+        b = _batchfile("b@softcatala.org", 2 * MINUTE)
+        enqueued = {id(a): 0, id(b): 10}
+        scheduler = Scheduler("sjf", get_enqueued=lambda x: enqueued[id(x)])
+        self.assertEqual([b, a], scheduler.order([a, b], now=20))
+
+    def test_order_sjf_aging(self):
+        a = _batchfile("a@softcatala.org", 60 * MINUTE)
+        b = _batchfile("b@softcatala.org", 2 * MINUTE)
+        enqueued = {id(a): 0, id(b): 59 * MINUTE}
+        scheduler = Scheduler("sjf", get_enqueued=lambda x: enqueued[id(x)])
+        self.assertEqual([a, b], scheduler.order([a, b], now=60 * MINUTE))
+
+    def test_order_fair(self):
+        a1 = _batchfile("a@softcatala.org", 60)
+        a2 = _batchfile("A@softcatala.org", 60)
+        b = _batchfile("b@softcatala.org", 60)
+        enqueued = {id(a1): 0, id(a2): 1, id(b): 2}
+        scheduler = Scheduler("fair", get_enqueued=lambda x: enqueued[id(x)])
+        self.assertEqual([a1, b, a2], scheduler.order([a1, a2, b], now=10))
+
+        scheduler.started(a1, now=10)
+        self.assertEqual([b, a2], scheduler.order([a2, b], now=20))
+
+    def test_order_fast_lane(self):
+        a = _batchfile("a@softcatala.org", 60)
+        b = _batchfile("b@softcatala.org", 60, "update")
+        enqueued = {id(a): 0, id(b): 10}
+        scheduler = Scheduler("fifo", True, get_enqueued=lambda x: enqueued[id(x)])
+        self.assertEqual([b, a], scheduler.order([a, b], now=20))
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            Scheduler("lifo")
+
+    def test_simulation_wait(self):
+        jobs = _get_workload()
+        fifo_mean, fifo_p95 = _stats(simulate(jobs, "fifo").values())
+
+        for policy in ["sjf", "fair"]:
+            mean, p95 = _stats(simulate(jobs, policy).values())
+            self.assertLess(mean, fifo_mean, policy)
+            self.assertLess(p95, fifo_p95, policy)
+
+    def test_simulation_fast_lane(self):
+        jobs = _get_workload()
+        updates = [id(b) for _, b in jobs if b.operation == "update"]
+        for policy in ["fifo", "sjf", "fair"]:
+            waits = simulate(jobs, policy)
+            fast_waits = simulate(jobs, policy, fast_lane=True)
+            self.assertLess(
+                statistics.mean(fast_waits[_id] for _id in updates),
+                statistics.mean(waits[_id] for _id in updates),
+                policy,
+            )
+
+    def test_simulation_aging_no_starvation(self):
+        # A long job and a continuous stream of short ones
+        long_job = _batchfile("heavy@softcatala.org", 60 * MINUTE)
+        jobs = [(0, long_job)]
+        for idx in range(200):
+            jobs.append(
+                (idx * 2 * MINUTE, _batchfile("user@softcatala.org", 2 * MINUTE))
+            )
+
+        starved = simulate(jobs, "sjf", aging=0)[id(long_job)]
+        aged = simulate(jobs, "sjf", aging=1.0)[id(long_job)]
+        self.assertLessEqual(aged, 60 * MINUTE + 2 * MINUTE)
+        self.assertGreater(starved, aged)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,219 @@
+# -*- encoding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from stagecache import StageCache, OpenDubbingHooks, parse_demucs_command
+import unittest
+import os
+import tempfile
+
+
+class TestStageCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = StageCache(os.path.join(self.temp_dir.name, "cache"), 1000)
+        self.audio_file = self._write("original_audio.mp3", "audio")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, name, content):
+        filename = os.path.join(self.temp_dir.name, name)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as fh:
+            fh.write(content)
+
+        return filename
+
+    def test_get_put(self):
+        key = self.cache.get_key("diarization", "abcd", {"model": "pyannote"})
+        self.assertIsNone(self.cache.get(key))
+
+        self.cache.put(key, {}, [{"start": 0, "end": 1}], 10)
+        _, metadata = self.cache.get(key)
+
+        self.assertEqual([{"start": 0, "end": 1}], metadata["data"])
+        stats = self.cache.get_stats()
+        self.assertEqual(1, stats["hits"]["diarization"])
+        self.assertEqual(1, stats["misses"]["diarization"])
+        self.assertEqual(10, stats["saved_seconds"])
+
+    def test_key_params(self):
+        key = self.cache.get_key("transcription", "abcd", {"model": "medium"})
+        other = self.cache.get_key("transcription", "abcd", {"model": "large"})
+        self.assertNotEqual(key, other)
+
+    def test_evict_least_recently_used(self):
+        stem = self._write("stem.mp3", "x" * 400)
+        keys = [self.cache.get_key("demucs", str(idx), {}) for idx in range(3)]
+        for idx, key in enumerate(keys[:2]):
+            self.cache.put(key, {"vocals.mp3": stem}, None, 1)
+            metadata_file = os.path.join(self.cache.directory, key, "entry.json")
+            os.utime(metadata_file, (idx, idx))
+
+        self.cache.get(keys[0])  # Now the most recently used
+        self.cache.put(keys[2], {"vocals.mp3": stem}, None, 1)
+
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[2]))
+
+    def test_put_keeps_size(self):
+        stem = self._write("stem.mp3", "x" * 400)
+        for idx in range(3):
+            key = self.cache.get_key("demucs", str(idx), {})
+            self.cache.put(key, {"vocals.mp3": stem}, None, 1)
+
+        with open(os.path.join(self.cache.directory, "size"), "r") as fh:
+            self.assertEqual("800", fh.read())
+
+    def test_hooks_diarization(self):
+        calls = []
+
+        def create(*, audio_file, pipeline, device="cpu"):
+            calls.append(audio_file)
+            return [{"start": 0.5, "end": 2.0, "speaker_id": "SPEAKER_00"}]
+
+        hooks = OpenDubbingHooks(self.cache, "medium", "pyannote")
+        cached = hooks._diarization(create)
+        first = cached(audio_file=self.audio_file, pipeline=None)
+        second = cached(audio_file=self.audio_file, pipeline=None)
+
+        self.assertEqual(first, second)
+        self.assertEqual(1, len(calls))
+
+    def test_hooks_transcription(self):
+        calls = []
+
+        def transcribe(stt, *, utterance_metadata, source_language, no_dubbing_phrases):
+            calls.append((source_language, no_dubbing_phrases))
+            return [
+                dict(
+                    item, text="Música", for_dubbing="Música" not in no_dubbing_phrases
+                )
+                for item in utterance_metadata
+            ]
+
+        hooks = OpenDubbingHooks(self.cache, "medium", "pyannote")
+        hooks._get_fingerprint(self.audio_file)
+        cached = hooks._transcription(transcribe)
+        utterances = [{"start": 0.5, "end": 2.0, "path": "chunk.mp3"}]
+
+        def _cached(source_language, no_dubbing_phrases):
+            return cached(
+                None,
+                utterance_metadata=utterances,
+                source_language=source_language,
+                no_dubbing_phrases=no_dubbing_phrases,
+            )
+
+        first = _cached("eng", ["Música"])
+        second = _cached("eng", ["Música"])
+        _cached("spa", ["Música"])
+        _cached("eng", [])
+
+        self.assertEqual(first, second)
+        self.assertFalse(second[0]["for_dubbing"])
+        self.assertEqual([("eng", ["Música"]), ("spa", ["Música"]), ("eng", [])], calls)
+
+    def test_hooks_demucs(self):
+        calls = []
+        output_dir = os.path.join(self.temp_dir.name, "output")
+
+        class Demucs:
+            def assemble_split_audio_file_paths(self, command):
+                stems_dir = os.path.join(output_dir, "htdemucs", "original_audio")
+                return (
+                    os.path.join(stems_dir, "vocals.mp3"),
+                    os.path.join(stems_dir, "no_vocals.mp3"),
+                )
+
+        def execute(demucs, command):
+            calls.append(command)
+            for stem in demucs.assemble_split_audio_file_paths(command):
+                os.makedirs(os.path.dirname(stem), exist_ok=True)
+                with open(stem, "w") as fh:
+                    fh.write("stem")
+
+        hooks = OpenDubbingHooks(self.cache, "medium", "pyannote")
+        cached = hooks._demucs(execute)
+        command = f'python -m demucs.separate -o "{output_dir}" --device cpu --mp3 "{self.audio_file}"'
+        cached(Demucs(), command)
+        os.remove(Demucs().assemble_split_audio_file_paths(command)[0])
+        cached(Demucs(), command)
+
+        self.assertEqual(1, len(calls))
+        self.assertTrue(
+            os.path.exists(Demucs().assemble_split_audio_file_paths(command)[0])
+        )
+
+    def test_hooks_positional_arguments(self):
+        calls = []
+
+        def create(audio_file, pipeline, device="cpu"):
+            calls.append(audio_file)
+            return [{"start": 0.5, "end": 2.0, "speaker_id": "SPEAKER_00"}]
+
+        def transcribe(stt, utterance_metadata, source_language, no_dubbing_phrases):
+            calls.append(source_language)
+            return [dict(item, text="Hola") for item in utterance_metadata]
+
+        hooks = OpenDubbingHooks(self.cache, "medium", "pyannote")
+        diarization = hooks._diarization(create)
+        segments = diarization(self.audio_file, None)
+        self.assertEqual(
+            segments, diarization(audio_file=self.audio_file, pipeline=None)
+        )
+
+        transcription = hooks._transcription(transcribe)
+        first = transcription(None, segments, "eng", [])
+        second = transcription(
+            None,
+            utterance_metadata=segments,
+            source_language="eng",
+            no_dubbing_phrases=[],
+        )
+        self.assertEqual(first, second)
+        self.assertEqual([self.audio_file, "eng"], calls)
+
+    def test_hooks_other_signature(self):
+        def create(audio):
+            return "created"
+
+        hooks = OpenDubbingHooks(self.cache, "medium", "pyannote")
+        self.assertEqual("created", hooks._diarization(create)(self.audio_file))
+
+    def test_parse_demucs_command(self):
+        command = "/usr/bin/python3 -m demucs.separate -o out --device cpu --shifts 10 --two-stems vocals --mp3 --mp3-bitrate 320 'original audio.mp3'"
+        options, audio_file = parse_demucs_command(command)
+
+        self.assertEqual("original audio.mp3", audio_file)
+        self.assertEqual("10", options["--shifts"])
+        self.assertEqual("vocals", options["--two-stems"])
+        self.assertIsNone(options["--mp3"])
+        self.assertNotIn("-o", options)
+
+        # The options are the same in another order and output directory
+        other = "python -m demucs.separate --mp3 --mp3-bitrate 320 --two-stems=vocals --shifts 10 --device cpu -o other audio.mp3"
+        self.assertEqual(options, parse_demucs_command(other)[0])
+        self.assertIsNone(parse_demucs_command("python -m demucs.separate --mp3"))
+
+
+if __name__ == "__main__":
+    unittest.main()
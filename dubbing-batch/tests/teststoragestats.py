@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2023 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from batchfilesdb import BatchFilesDB
+from storagestats import StorageStats, measure
+import os
+import tempfile
+import unittest
+
+
+class TestStorageStats(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.processed = self.temp_dir.name
+        self.stats = StorageStats(os.path.join(self.processed, "stats.sqlite"))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, name, content="Hello"):
+        filename = os.path.join(self.processed, name)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as fh:
+            fh.write(content)
+
+    def _publish(self, _uuid, email):
+        db = BatchFilesDB(self.processed, backend="files")
+        db.create(_uuid, email, "central", "video.mp4", record_uuid=_uuid)
+        self._write(f"{_uuid}.dub")
+        self._write(f"{_uuid}_output/dubbed.mp4")
+        self._write(f"{_uuid}_output/htdemucs/vocals.mp3")
+        return [f"{_uuid}.dbrecord", f"{_uuid}.dub", f"{_uuid}_output"]
+
+    def test_measure(self):
+        names = self._publish("uuid1", "JMAS@softcatala.org")
+
+        self.assertEquals(None, measure(self.processed, "none.dub"))
+        self.assertEquals((1, 5, ""), measure(self.processed, names[1]))
+        self.assertEquals((2, 10, ""), measure(self.processed, names[2]))
+        files, size, email = measure(self.processed, names[0])
+        self.assertEquals("jmas@softcatala.org", email)
+
+    def test_not_created(self):
+        names = self._publish("uuid1", "jmas@softcatala.org")
+        self.stats.put(self.processed, names)
+
+        self.assertEquals(False, self.stats.is_created())
+        self.assertEquals((0, 0, {}), self.stats.get())
+
+    def test_rebuild(self):
+        names = self._publish("uuid1", "jmas@softcatala.org")
+        names += self._publish("uuid2", "jmas@softcatala.org")
+        self.stats.rebuild(self.processed, names + ["none.dub"])
+
+        files, size, who = self.stats.get()
+        self.assertEquals(8, files)
+        self.assertEquals({"jmas@softcatala.org": 2}, who)
+
+    def test_put_while_rebuilding(self):
+        names = self._publish("uuid1", "jmas@softcatala.org")
+
+        def _scan():
+            yield from names
+            # Published after the scan has gone past it
+            self.stats.put(
+                self.processed, self._publish("uuid2", "jordi@softcatala.org")
+            )
+
+        self.stats.rebuild(self.processed, _scan())
+        files, size, who = self.stats.get()
+        self.assertEquals(8, files)
+        self.assertEquals(2, len(who))
+
+    def test_put_delete(self):
+        self.stats.rebuild(self.processed, [])
+        names = self._publish("uuid1", "jmas@softcatala.org")
+        self.stats.put(self.processed, names)
+        other = self._publish("uuid2", "jordi@softcatala.org")
+        self.stats.put(self.processed, other)
+        files, size, who = self.stats.get()
+        self.assertEquals(8, files)
+        self.assertEquals(2, len(who))
+
+        # Published again, it is not counted twice
+        self._write("uuid1.dub", "Hello again")
+        self.stats.put(self.processed, names)
+        files, size_again, who = self.stats.get()
+        self.assertEquals(8, files)
+        self.assertEquals(size + 6, size_again)
+
+        self.stats.delete(names)
+        files, size, who = self.stats.get()
+        self.assertEquals(4, files)
+        self.assertEquals({"jordi@softcatala.org": 1}, who)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from uploadsession import UploadSession, UploadSessionNotFound
+from contentindex import HASH_PART_SIZE, hash_stream
+from tests.testmediaprobe import _mp4
+import io
+import os
+import tempfile
+import time
+import unittest
+
+UPLOAD_ID = "b8d2f6a0-3c1e-4f7a-9d6b-2e5c8a1f4b3d"
+
+
+class TestUploadSession(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.sessions = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _create(self, content):
+        fields = {"email": "jmas@softcatala.org", "size": len(content)}
+        return UploadSession.create(UPLOAD_ID, fields, self.sessions)
+
+    def _write(self, session, content, index):
+        start = index * HASH_PART_SIZE
+        end = start + HASH_PART_SIZE
+        part = content[start:end]
+        return session.write_part(index, io.BytesIO(part))
+
+    def test_get_part_index(self):
+        size = HASH_PART_SIZE * 2 + 1000
+        session = self._create(b"\0" * size)
+        last = HASH_PART_SIZE * 2
+
+        self.assertEqual(3, session.get_parts())
+        self.assertEqual(0, session.get_part_index(0, HASH_PART_SIZE - 1, size))
+        self.assertEqual(2, session.get_part_index(last, size - 1, size))
+        # Not aligned to a part, not a whole part, other file and past the end
+        self.assertIsNone(session.get_part_index(1, HASH_PART_SIZE, size))
+        self.assertIsNone(session.get_part_index(0, HASH_PART_SIZE - 2, size))
+        self.assertIsNone(session.get_part_index(0, HASH_PART_SIZE - 1, size + 1))
+        self.assertIsNone(session.get_part_index(last + HASH_PART_SIZE, size, size))
+
+    def test_content_hash_as_hash_stream(self):
+        content = os.urandom(HASH_PART_SIZE * 2 + 1000)
+        session = self._create(content)
+        for index in [2, 0, 1]:
+            self.assertTrue(self._write(session, content, index))
+
+        target = os.path.join(self.temp_dir.name, "upload")
+        self.assertEqual([0, 1, 2], session.get_received())
+        self.assertEqual(
+            hash_stream(io.BytesIO(content), target), session.get_content_hash()
+        )
+        with open(session.data, "rb") as fh:
+            self.assertEqual(content, fh.read())
+
+    def test_write_part_incomplete(self):
+        content = os.urandom(HASH_PART_SIZE + 1000)
+        session = self._create(content)
+
+        self.assertFalse(session.write_part(0, io.BytesIO(content[:1000])))
+        self.assertFalse(session.write_part(1, io.BytesIO(content[:2000])))
+        self.assertEqual([], session.get_received())
+
+    def test_media_fast_start(self):
+        content = _mp4(61, media_size=HASH_PART_SIZE * 2)
+        session = self._create(content)
+
+        # Known from the first part, before the rest of the file is sent
+        self._write(session, content, 0)
+        self.assertEqual(61000, session.get_media()["duration_ms"])
+
+    def test_media_at_the_end(self):
+        content = _mp4(61, fast_start=False, media_size=HASH_PART_SIZE * 2)
+        session = self._create(content)
+
+        self._write(session, content, 0)
+        self.assertIsNone(session.get_media())
+
+        self._write(session, content, session.get_parts() - 1)
+        self.assertEqual(61000, session.get_media()["duration_ms"])
+
+    def test_media_not_mp4(self):
+        content = b"RIFF" + b"\0" * 5000
+        session = self._create(content)
+
+        self._write(session, content, 0)
+        self.assertIsNone(session.get_media())
+        self.assertIsNone(session.get_media())
+
+    def test_deleted_session(self):
+        content = _mp4(61)
+        session = self._create(content)
+        UploadSession(UPLOAD_ID, self.sessions).delete()
+
+        with self.assertRaises(UploadSessionNotFound):
+            self._write(session, content, 0)
+
+        with self.assertRaises(UploadSessionNotFound):
+            session.get_received()
+
+        with self.assertRaises(UploadSessionNotFound):
+            session.get_media()
+
+        self.assertFalse(UploadSession(UPLOAD_ID, self.sessions).load())
+
+    def test_count_by_email(self):
+        count = UploadSession.count_by_email("jmas@softcatala.org", self.sessions)
+        self.assertEqual(0, count)
+        self._create(b"video")
+        fields = {"email": "other@softcatala.org", "size": 5}
+        UploadSession.create(UPLOAD_ID[::-1], fields, self.sessions)
+
+        count = UploadSession.count_by_email("JMAS@softcatala.org", self.sessions)
+        self.assertEqual(1, count)
+
+    def test_purge(self):
+        session = self._create(b"video")
+
+        UploadSession.purge(time.time(), self.sessions)
+        self.assertTrue(session.load())
+
+        UploadSession.purge(time.time() + 2 * 24 * 60 * 60, self.sessions)
+        self.assertFalse(session.load())
+
+
+if __name__ == "__main__":
+    unittest.main()
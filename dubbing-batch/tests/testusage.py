@@ -20,14 +20,15 @@
 import unittest
 import os
 import datetime
+import tempfile
 from usage import Usage
 
 
 class UsageTest(Usage):
     datetime = None
 
-    def __init__(self):
-        self._set_filename("usage.txt")
+    def __init__(self, directory):
+        self._set_directory(directory)
 
     def _get_time_now(self):
         return self.datetime
@@ -38,26 +39,29 @@ class UsageTest(Usage):
 
 class TestUsage(unittest.TestCase):
     def setUp(self):
-        filename = UsageTest().FILE
-        if os.path.exists(filename):
-            os.remove(filename)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.temp_dir.name, "usage")
+        Usage._last_rotated = None
 
-    def readLog(self):
-        with open(UsageTest().FILE, "r") as temp:
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def readLog(self, day):
+        with open(os.path.join(self.directory, f"{day}.txt"), "r") as temp:
             return temp.readlines()
 
-    def _test_log_one(self):
-        usage = UsageTest()
+    def test_log_one(self):
+        usage = UsageTest(self.directory)
         usage.rotate = False
         usage._set_time_now(datetime.datetime(2016, 10, 5))
         usage.log("conversion_error")
-        lines = self.readLog()
+        lines = self.readLog("2016-10-05")
 
         self.assertEqual(len(lines), 1)
         self.assertEqual("2016-10-05 00:00:00	conversion_error\n", lines[0])
 
     def test_log_rotate(self):
-        usage = UsageTest()
+        usage = UsageTest(self.directory)
         usage._set_time_now(datetime.datetime(2017, 10, 8, 13, 00, 00))
         usage.log("conversion_error")
 
@@ -69,26 +73,46 @@ class TestUsage(unittest.TestCase):
         )
         usage.log("conversion_error")
 
-        lines = self.readLog()
+        self.assertEqual(["2017-10-15.txt"], os.listdir(self.directory))
+        lines = self.readLog("2017-10-15")
         self.assertEqual(len(lines), 1)
 
-    def _test_is_old_line_true(self):
-        usage = UsageTest()
-        usage._set_time_now(datetime.datetime(2016, 11, 5))
-        is_old = usage._is_old_line("2016-10-05 00:00:00	conversion_error\n")
-        self.assertEqual(True, is_old)
-
-    def _test_is_old_line_false(self):
-        usage = UsageTest()
-        usage._set_time_now(datetime.datetime(2016, 11, 5))
-        is_old = usage._is_old_line("2016-11-05 00:00:00	conversion_error\n")
-        self.assertEqual(False, is_old)
-
-    def _test_is_old_line_exception(self):
-        usage = UsageTest()
-        usage._set_time_now(datetime.datetime(2016, 11, 5))
-        is_old = usage._is_old_line("INVALID DATE conversion_error\n")
-        self.assertEqual(True, is_old)
+    def test_migrate(self):
+        with open(self.directory + ".txt", "w") as file_out:
+            file_out.write("2017-10-05 13:00:00\tdubbing_file\n")
+            file_out.write("2017-10-06 13:00:00\tdubbing_file\n")
+
+        usage = UsageTest(self.directory)
+        usage.rotate = False
+        usage._set_time_now(datetime.datetime(2017, 10, 6, 14, 00, 00))
+        usage.log("max_time")
+
+        self.assertEqual(False, os.path.exists(self.directory + ".txt"))
+        self.assertEqual(1, len(self.readLog("2017-10-05")))
+        self.assertEqual(2, len(self.readLog("2017-10-06")))
+
+    def test_get_stats(self):
+        usage = UsageTest(self.directory)
+        usage.rotate = False
+        for day, action in [(5, "dubbing_file"), (5, "max_time"), (6, "dubbing_file")]:
+            usage._set_time_now(datetime.datetime(2017, 10, day, 13, 00, 00))
+            usage.log(action)
+
+        stats = usage.get_stats(datetime.datetime(2017, 10, 5))
+        self.assertEqual({"dubbing_file": 1, "max_time": 1}, stats)
+        self.assertEqual(
+            True, os.path.exists(os.path.join(self.directory, "2017-10-05.counts"))
+        )
+
+        # Only the lines appended since are read
+        usage.log("dubbing_file")
+        stats = usage.get_stats(
+            datetime.datetime(2017, 10, 5), datetime.datetime(2017, 10, 6)
+        )
+        self.assertEqual({"dubbing_file": 3, "max_time": 1}, stats)
+        usage.log("dubbing_file")
+        stats = usage.get_stats(datetime.datetime(2017, 10, 6))
+        self.assertEqual({"dubbing_file": 3}, stats)
 
 
 if __name__ == "__main__":
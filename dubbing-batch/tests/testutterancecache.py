@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from utterancecache import UtteranceCache, UTTERANCES_FILE
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+UUID = "b8d2f6a0-3c1e-4f7a-9d6b-2e5c8a1f4b3d"
+
+
+class TestUtteranceCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.processed = self.temp_dir.name
+        UtteranceCache.clear()
+
+    def tearDown(self):
+        UtteranceCache.clear()
+        self.temp_dir.cleanup()
+
+    def _write(self, texts, _uuid=UUID):
+        directory = os.path.join(self.processed, f"{_uuid}_output")
+        os.makedirs(directory, exist_ok=True)
+        data = {
+            "utterances": [
+                {
+                    "id": idx + 1,
+                    "start": idx * 5,
+                    "end": idx * 5 + 4,
+                    "translated_text": text,
+                }
+                for idx, text in enumerate(texts)
+            ],
+            "PreprocessingArtifacts": {"video_file": "video.mp4"},
+            "metadata": {"source_language": "eng"},
+        }
+        filename = os.path.join(directory, UTTERANCES_FILE)
+        with open(filename, "w") as fh:
+            json.dump(data, fh)
+
+        return filename
+
+    def test_get(self):
+        self._write(["Hola", "Adéu"])
+        parsed = UtteranceCache(self.processed).get(UUID)
+
+        self.assertEquals(2, len(parsed.utterances))
+        self.assertEquals("Adéu", parsed.get(2)["translated_text"])
+        self.assertEquals(None, parsed.get(3))
+        self.assertEquals({"source_language": "eng"}, parsed.metadata)
+
+    def test_select(self):
+        self._write(["Hola", "Adéu", "Bon dia", "Bona nit"])
+        parsed = UtteranceCache(self.processed).get(UUID)
+
+        def _ids(utterances):
+            return [utterance["id"] for utterance in utterances]
+
+        self.assertEquals([1, 2, 3, 4], _ids(parsed.select()))
+        self.assertEquals([3, 1], _ids(parsed.select(ids=[3, 7, 1])))
+        self.assertEquals([2, 3], _ids(parsed.select(start=6, end=11)))
+        self.assertEquals([3], _ids(parsed.select(ids=[1, 3], start=6)))
+        self.assertEquals([7, 9], parsed.get_unknown([7, 3, 9]))
+        self.assertEquals([], parsed.get_unknown(None))
+
+    def test_get_cached(self):
+        self._write(["Hola"])
+        cache = UtteranceCache(self.processed)
+
+        self.assertIs(cache.get(UUID, 1), cache.get(UUID, 1))
+
+    def test_get_modified(self):
+        filename = self._write(["Hola"])
+        cache = UtteranceCache(self.processed)
+        parsed = cache.get(UUID, 1)
+
+        self.assertIsNot(parsed, cache.get(UUID, 2))
+
+        self._write(["Bon dia"])
+        os.utime(filename, ns=(0, 0))
+        self.assertEquals("Bon dia", cache.get(UUID, 2).get(1)["translated_text"])
+
+    def test_etag(self):
+        filename = self._write(["Hola"])
+        cache = UtteranceCache(self.processed)
+        parsed = cache.get(UUID, 1)
+        etag = parsed.get_etag()
+
+        self.assertEquals(True, parsed.is_current(etag))
+        self.assertEquals(True, parsed.is_current(f'"other", W/{etag}'))
+        self.assertEquals(True, parsed.is_current(parsed.get_etag("gzip")))
+        self.assertEquals(False, parsed.is_current('"other"'))
+        self.assertEquals(False, parsed.is_current(""))
+
+        self.assertNotEquals(etag, cache.get(UUID, 2).get_etag())
+        os.utime(filename, ns=(0, 0))
+        self.assertEquals(False, cache.get(UUID, 2).is_current(etag))
+
+    def test_get_json(self):
+        self._write(["Hola", "Adéu"])
+        parsed = UtteranceCache(self.processed).get(UUID)
+
+        utterances = json.loads(parsed.get_json("utterances"))
+        self.assertEquals(parsed.utterances, utterances)
+        self.assertEquals(
+            {"metadata": {"source_language": "eng"}},
+            json.loads(parsed.get_json("metadata")),
+        )
+        self.assertIs(parsed.get_json("utterances"), parsed.get_json("utterances"))
+        self.assertEquals(
+            parsed.get_json("utterances"),
+            gzip.decompress(parsed.get_compressed("utterances")),
+        )
+
+    def test_get_page(self):
+        self._write(["Hola", "Adéu", "Bon dia", "Bona nit"])
+        parsed = UtteranceCache(self.processed).get(UUID)
+
+        def _ids(page):
+            body, total = page
+            return [utterance["id"] for utterance in json.loads(body)], total
+
+        self.assertEquals(([1, 2, 3, 4], 4), _ids(parsed.get_page()))
+        self.assertEquals(([2, 3], 4), _ids(parsed.get_page(offset=1, limit=2)))
+        self.assertEquals(([], 4), _ids(parsed.get_page(offset=10)))
+        self.assertEquals(([3], 2), _ids(parsed.get_page(1, 5, start=6, end=11)))
+
+    def test_get_not_found(self):
+        with self.assertRaises(FileNotFoundError):
+            UtteranceCache(self.processed).get(UUID)
+
+    def test_max_entries(self):
+        cache = UtteranceCache(self.processed)
+        cache.MAX_ENTRIES = 2
+        uuids = [f"{UUID[:-1]}{idx}" for idx in range(3)]
+        for _uuid in uuids:
+            self._write(["Hola"], _uuid)
+            cache.get(_uuid)
+
+        self.assertEquals(uuids[1:], list(UtteranceCache._entries.keys()))
+
+
+if __name__ == "__main__":
+    unittest.main()
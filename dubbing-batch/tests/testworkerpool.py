@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+from workerpool import WorkerPool
+import unittest
+import threading
+
+
+class TestWorkerPool(unittest.TestCase):
+    def test_has_capacity(self):
+        pool = WorkerPool(2)
+        event = threading.Event()
+
+        pool.submit("a", event.wait)
+        self.assertEqual(True, pool.has_capacity())
+        pool.submit("b", event.wait)
+        self.assertEqual(False, pool.has_capacity())
+
+        event.set()
+        pool.shutdown()
+        self.assertEqual(True, pool.has_capacity())
+
+    def test_is_running(self):
+        pool = WorkerPool(1)
+        event = threading.Event()
+
+        pool.submit("a", event.wait)
+        self.assertEqual(True, pool.is_running("a"))
+        self.assertEqual(False, pool.is_running("b"))
+
+        event.set()
+        pool.shutdown()
+        self.assertEqual(False, pool.is_running("a"))
+
+    def test_submit_same_key(self):
+        pool = WorkerPool(2)
+        event = threading.Event()
+
+        pool.submit("a", event.wait)
+        with self.assertRaises(RuntimeError):
+            pool.submit("a", event.wait)
+
+        event.set()
+        pool.shutdown()
+
+    def test_failed_job_releases_slot(self):
+        def fail():
+            raise ValueError("error")
+
+        pool = WorkerPool(1)
+        pool.submit("a", fail)
+        pool.shutdown()
+        self.assertEqual(0, pool.running())
+
+
+if __name__ == "__main__":
+    unittest.main()
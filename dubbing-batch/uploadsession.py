@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import time
+from contentindex import CHUNK_SIZE, HASH_PART_SIZE, combine_hashes
+from mediaprobe import ProbeError, probe_file
+
+"""
+    Session of a resumable upload (see uploads.py in dubbing-service).
+
+    The session is a directory with the data file, written in place, and a
+    marker for each part received holding its sha256. The parts are
+    HASH_PART_SIZE bytes, so the content hash is combined from them as in
+    hash_stream. The container metadata is probed as soon as the parts that
+    hold it arrive.
+
+    The session can be deleted at any time (finalized, purged or rejected by
+    another request), then its methods raise UploadSessionNotFound.
+"""
+
+SESSIONS = "/srv/data/uploads"
+SESSION_MAX_AGE = 24 * 60 * 60
+
+
+class UploadSessionNotFound(Exception):
+    pass
+
+
+class UploadSession:
+    def __init__(self, upload_id, sessions=SESSIONS):
+        self.upload_id = upload_id
+        self.directory = os.path.join(sessions, upload_id)
+        self.data = os.path.join(self.directory, "data")
+        self.fields = {}
+
+    def _get_filename(self, name):
+        return os.path.join(self.directory, name)
+
+    def _get_part_filename(self, index):
+        return os.path.join(self.directory, "parts", str(index))
+
+    @staticmethod
+    def create(upload_id, fields, sessions=SESSIONS):
+        session = UploadSession(upload_id, sessions)
+        os.makedirs(os.path.join(session.directory, "parts"))
+        with open(session.data, "wb") as fh:
+            fh.truncate(fields["size"])
+
+        session.fields = fields
+        session._write_json("session.json", fields)
+        return session
+
+    def _write_json(self, name, content):
+        filename = self._get_filename(name)
+        try:
+            with open(filename + ".tmp", "w") as fh:
+                json.dump(content, fh)
+
+            os.replace(filename + ".tmp", filename)
+        except FileNotFoundError:
+            raise UploadSessionNotFound(self.upload_id)
+
+    def load(self):
+        """Returns False if the session does not exist"""
+        try:
+            with open(self._get_filename("session.json"), "r") as fh:
+                self.fields = json.load(fh)
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def get_parts(self):
+        return max(math.ceil(self.fields["size"] / HASH_PART_SIZE), 1)
+
+    def get_part_size(self, index):
+        return min(HASH_PART_SIZE, self.fields["size"] - index * HASH_PART_SIZE)
+
+    def get_part_index(self, start, end, size):
+        """Returns the part of a Content-Range (bytes start-end/size) or None
+        if the range is not exactly one part of the file"""
+        index = start // HASH_PART_SIZE
+        valid = (
+            size == self.fields["size"]
+            and start % HASH_PART_SIZE == 0
+            and index < self.get_parts()
+            and end - start + 1 == self.get_part_size(index)
+        )
+        return index if valid else None
+
+    def get_received(self):
+        try:
+            names = os.listdir(os.path.join(self.directory, "parts"))
+        except FileNotFoundError:
+            raise UploadSessionNotFound(self.upload_id)
+
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def write_part(self, index, stream):
+        """Writes the part at its offset, returns False if it is not complete"""
+        sha256 = hashlib.sha256()
+        offset = index * HASH_PART_SIZE
+        expected = self.get_part_size(index)
+        written = 0
+        try:
+            fd = os.open(self.data, os.O_WRONLY)
+        except FileNotFoundError:
+            raise UploadSessionNotFound(self.upload_id)
+
+        try:
+            while written < expected:
+                chunk = stream.read(min(CHUNK_SIZE, expected - written))
+                if not chunk:
+                    break
+
+                os.pwrite(fd, chunk, offset + written)
+                sha256.update(chunk)
+                written += len(chunk)
+        finally:
+            os.close(fd)
+
+        if written != expected or stream.read(1):
+            return False
+
+        # Marks the part as received, with its hash
+        filename = self._get_part_filename(index)
+        try:
+            with open(filename + ".tmp", "w") as fh:
+                fh.write(sha256.hexdigest())
+
+            os.replace(filename + ".tmp", filename)
+        except FileNotFoundError:
+            raise UploadSessionNotFound(self.upload_id)
+
+        return True
+
+    def is_available(self, start, end):
+        first = start // HASH_PART_SIZE
+        last = (max(end, start + 1) - 1) // HASH_PART_SIZE
+        for index in range(first, last + 1):
+            if not os.path.exists(self._get_part_filename(index)):
+                return False
+
+        return True
+
+    def get_media(self):
+        """Returns the media once the parts with the metadata are received"""
+        filename = self._get_filename("media.json")
+        try:
+            with open(filename, "r") as fh:
+                return json.load(fh) or None
+        except FileNotFoundError:
+            pass
+
+        try:
+            media = probe_file(self.data, self.is_available)
+        except FileNotFoundError:
+            raise UploadSessionNotFound(self.upload_id)
+        except ProbeError as e:
+            # Decoded when the upload is finalized
+            logging.info(f"UploadSession.get_media. Cannot probe {self.data}: {e}")
+            self._write_json("media.json", {})
+            return None
+
+        if media:
+            self._write_json("media.json", media)
+
+        return media
+
+    def get_content_hash(self):
+        digests = []
+        try:
+            for index in range(self.get_parts()):
+                with open(self._get_part_filename(index), "r") as fh:
+                    digests.append(fh.read())
+        except FileNotFoundError:
+            raise UploadSessionNotFound(self.upload_id)
+
+        return combine_hashes(digests)
+
+    def delete(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @staticmethod
+    def count_by_email(email, sessions=SESSIONS):
+        """Sessions of the email not finalized yet"""
+        try:
+            upload_ids = os.listdir(sessions)
+        except FileNotFoundError:
+            return 0
+
+        count = 0
+        for upload_id in upload_ids:
+            session = UploadSession(upload_id, sessions)
+            if session.load() and session.fields["email"].lower() == email.lower():
+                count += 1
+
+        return count
+
+    @staticmethod
+    def purge(now=None, sessions=SESSIONS):
+        """Deletes the sessions not finalized"""
+        if now is None:
+            now = time.time()
+
+        try:
+            upload_ids = os.listdir(sessions)
+        except FileNotFoundError:
+            return
+
+        for upload_id in upload_ids:
+            session = UploadSession(upload_id, sessions)
+            try:
+                modified = os.path.getmtime(session.directory)
+            except FileNotFoundError:
+                continue
+
+            if modified < now - SESSION_MAX_AGE:
+                logging.debug(f"UploadSession.purge. Deleting {session.directory}")
+                session.delete()
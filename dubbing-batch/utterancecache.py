@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import collections
+import gzip
+import hashlib
+import json
+import os
+import threading
+from processedfiles import ProcessedFiles
+
+"""
+    Parsed utterances of the dubbed videos for the editor, which requests
+    them (the list, the metadata and the audio of each utterance) many times
+    while it is being used.
+
+    The utterances file of a uuid is parsed once per process and indexed by
+    id. It is parsed again if the revision of the record or the file (its
+    mtime, size or inode) changes, e.g. after it is regenerated.
+
+    The answers are also kept serialized (and compressed), with an ETag that
+    changes with the version of the file, so the requests of an editor that
+    already has them are answered with a 304.
+"""
+
+# Written by open_dubbing (see Utterance._get_file_name)
+UTTERANCES_FILE = "utterance_metadata_cat.json"
+# Smaller answers are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+
+def to_json(value):
+    # As flask.jsonify
+    return json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def compress(body):
+    # Without a timestamp, the same body is always compressed the same way
+    return gzip.compress(body, mtime=0)
+
+
+class ParsedUtterances:
+    def __init__(self, data, version=""):
+        self.utterances = data["utterances"]
+        self.metadata = data["metadata"]
+        self.version = version
+        self._by_id = {utterance["id"]: utterance for utterance in self.utterances}
+        self._serialized = {}
+
+    def get_etag(self, encoding=None):
+        suffix = f"-{encoding}" if encoding else ""
+        return f'"{self.version}{suffix}"'
+
+    def is_current(self, if_none_match):
+        """True if the If-None-Match header has the ETag, in any encoding"""
+        for etag in if_none_match.split(","):
+            etag = etag.strip()
+            if etag.startswith("W/"):
+                etag = etag[2:]
+
+            if etag == "*" or etag.strip('"').split("-")[0] == self.version:
+                return True
+
+        return False
+
+    def _get_serialized(self, key, serialize):
+        # Computed once, two requests at the same time may both compute it
+        value = self._serialized.get(key)
+        if value is None:
+            value = self._serialized[key] = serialize()
+
+        return value
+
+    def get_json(self, name):
+        """The answer of 'utterances' or 'metadata' serialized"""
+        if name == "utterances":
+            return self._get_serialized(name, lambda: to_json(self.utterances))
+
+        return self._get_serialized(name, lambda: to_json({"metadata": self.metadata}))
+
+    def get_compressed(self, name):
+        return self._get_serialized(
+            (name, "gzip"), lambda: compress(self.get_json(name))
+        )
+
+    def _get_fragments(self):
+        return self._get_serialized(
+            "fragments", lambda: [to_json(utterance) for utterance in self.utterances]
+        )
+
+    def get_page(self, offset=0, limit=None, start=None, end=None):
+        """Returns (the utterances of the page serialized, utterances in the time range)"""
+        indexes = range(len(self.utterances))
+        if start is not None:
+            indexes = [i for i in indexes if self.utterances[i]["end"] > start]
+
+        if end is not None:
+            indexes = [i for i in indexes if self.utterances[i]["start"] < end]
+
+        total = len(indexes)
+        stop = None if limit is None else offset + limit
+        fragments = self._get_fragments()
+        page = [fragments[i] for i in indexes[offset:stop]]
+        return b"[" + b",".join(page) + b"]", total
+
+    def get(self, _id):
+        """Returns the utterance with the id or None"""
+        return self._by_id.get(_id)
+
+    def get_unknown(self, ids):
+        """The ids (in their order) that are not utterances of this video"""
+        return [_id for _id in ids or [] if _id not in self._by_id]
+
+    def select(self, ids=None, start=None, end=None):
+        """The utterances with the ids (in their order) or in the time range,
+        unknown ids are skipped (see get_unknown)"""
+        if ids is not None:
+            utterances = [self._by_id[_id] for _id in ids if _id in self._by_id]
+        else:
+            utterances = sorted(self.utterances, key=lambda u: u["start"])
+
+        if start is not None:
+            utterances = [u for u in utterances if u["end"] > start]
+
+        if end is not None:
+            utterances = [u for u in utterances if u["start"] < end]
+
+        return utterances
+
+
+class UtteranceCache:
+    MAX_ENTRIES = 32
+    _lock = threading.Lock()
+    _entries = collections.OrderedDict()  # uuid: (key, ParsedUtterances)
+
+    def __init__(self, processed=None):
+        self.processed = processed or ProcessedFiles.get_processed_directory()
+
+    def _get_filename(self, _uuid):
+        return os.path.join(self.processed, f"{_uuid}_output", UTTERANCES_FILE)
+
+    def get(self, _uuid, revision=None):
+        """Returns the ParsedUtterances, raises FileNotFoundError if there are none"""
+        filename = self._get_filename(_uuid)
+        stat = os.stat(filename)
+        key = (filename, revision, stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        version = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            entry = self._entries.get(_uuid)
+            if entry and entry[0] == key:
+                self._entries.move_to_end(_uuid)
+                return entry[1]
+
+        # Parsed out of the lock, the requests of other uuids do not wait
+        with open(filename, "r", encoding="utf-8") as fh:
+            parsed = ParsedUtterances(json.load(fh), version)
+
+        with self._lock:
+            self._entries[_uuid] = (key, parsed)
+            self._entries.move_to_end(_uuid)
+            if len(self._entries) > self.MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+        return parsed
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
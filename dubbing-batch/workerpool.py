@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+    Runs up to a fixed number of jobs at the same time. Jobs are identified
+    by a key (the record uuid) so the caller can know which ones are in flight.
+    The heavy work is done by child processes, threads are only used to wait
+    for them and to run the finalization of each job.
+"""
+
+
+class WorkerPool:
+    def __init__(self, workers):
+        self.workers = max(1, int(workers))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="job"
+        )
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def _done(self, key, future):
+        with self._lock:
+            self._running.pop(key, None)
+
+        exception = future.exception()
+        if exception:
+            logging.error(f"WorkerPool. Job {key} failed with error: {exception}")
+
+    def submit(self, key, fn, *args, **kwargs):
+        with self._lock:
+            if key in self._running:
+                raise RuntimeError(f"Job {key} is already running")
+
+            future = self._executor.submit(fn, *args, **kwargs)
+            self._running[key] = future
+
+        future.add_done_callback(lambda f: self._done(key, f))
+        return future
+
+    def is_running(self, key):
+        with self._lock:
+            return key in self._running
+
+    def running(self):
+        with self._lock:
+            return len(self._running)
+
+    def has_capacity(self):
+        return self.running() < self.workers
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
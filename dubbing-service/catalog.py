@@ -0,0 +1 @@
+../dubbing-batch/catalog.py
\ No newline at end of file
@@ -0,0 +1 @@
+../dubbing-batch/contentindex.py
\ No newline at end of file
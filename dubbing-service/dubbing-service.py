@@ -22,7 +22,7 @@ from __future__ import print_function
 from flask import Flask, request, Response, send_file, make_response, jsonify
 from flask_cors import CORS
 import json
-from batchfilesdb import BatchFilesDB
+from batchfilesdb import BatchFilesDB, BatchFile
 from processedfiles import ProcessedFiles
 import os
 import logging
@@ -32,20 +32,26 @@ import datetime
 from urllib.parse import quote
 import unicodedata
 from sendmail import Sendmail
-from pydub import AudioSegment
 import requests
 from urllib.parse import urljoin
 from utterances import bp
+from progress import FINISHED, get_progress_filename, read_progress
+from estimator import get_estimate
+from storagestats import StorageStats
+from catalog import Catalog
+import uploads
+from uploads import UPLOAD_FOLDER, MAX_SIZE
+from uploads import get_media_error, get_queue_error, reject, store_upload
+from uploads import enqueue, serve_from_content_index
 
 app = Flask(__name__)
 
 # Access-Control-Allow-Origin header is defined here for all endpoints
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-UPLOAD_FOLDER = "/srv/data/files/"
-
 
 app.register_blueprint(bp)
+app.register_blueprint(uploads.bp)
 
 
 @app.route("/hello", methods=["GET"])
@@ -53,48 +59,47 @@ def hello_word():
     return "Hello dubbing-service!"
 
 
-def _hide_emails(records):
-    who = {
-        record.email: sum(1 for r in records if r.email == record.email)
-        for record in records
-    }
-
-    print_who = {
+def _hide_emails(counts):
+    return {
         "".join(list(map(lambda c: "-" if c in ["a"] else c, key))): value
-        for key, value in who.items()
+        for key, value in counts.items()
     }
-    return print_who
 
 
+# Answered from state kept up to date by the workers and the service (see
+# storagestats.py and usage.py), nothing is walked or scanned
 @app.route("/stats/", methods=["GET"])
 def stats():
-    requested = request.args.get("date", datetime.datetime.today().strftime("%Y-%m-%d"))
+    today = datetime.datetime.today().strftime("%Y-%m-%d")
+    requested = request.args.get("date", today)
+    requested_to = request.args.get("date_to", requested)
     try:
         date_requested = datetime.datetime.strptime(requested, "%Y-%m-%d")
+        date_to = datetime.datetime.strptime(requested_to, "%Y-%m-%d")
     except Exception:
         return json_answer({}, 400)
 
+    if date_to < date_requested:
+        return json_answer({}, 400)
+
     usage = Usage()
-    result = usage.get_stats(date_requested)
+    result = usage.get_stats(date_requested, date_to)
 
-    records = BatchFilesDB().select()
+    db = BatchFilesDB()
     queue = {}
+    who = db.count_by_email()
+    queue["items"] = sum(who.values())
+    queue["who"] = _hide_emails(who)
+    result["queue"] = queue
 
-    print_who = _hide_emails(records)
-    result["files_stored"] = ProcessedFiles.get_num_of_files_stored()
-    result["files_stored_size"] = ProcessedFiles.get_num_of_files_stored_size()
+    files, size, who = StorageStats().get()
+    result["files_stored"] = files
+    result["files_stored_size"] = ProcessedFiles._get_human_readable_size(size)
     result["free_storage_space"] = ProcessedFiles.get_free_space_in_directory()
-    queue["items"] = len(records)
-    queue["who"] = print_who
-    result["queue"] = queue
 
     stored = {}
-    db = BatchFilesDB()
-    db.ENTRIES = ProcessedFiles.get_processed_directory()
-    records = db.select()
-    print_who = _hide_emails(records)
-    stored["items"] = len(records)
-    stored["who"] = print_who
+    stored["items"] = sum(who.values())
+    stored["who"] = _hide_emails(who)
     result["stored"] = stored
 
     return json_answer(result)
@@ -134,11 +139,43 @@ def uuid_exists():
         result["error"] = "uuid no vàlid"
         return json_answer(result, 400)
 
-    exists, result_msg = ProcessedFiles.do_files_exists(uuid)
+    exists, result_msg = Catalog().do_files_exists(uuid)
     result_code = 200 if exists else 404
     return json_answer(result_msg, result_code)
 
 
+@app.route("/get_progress/", methods=["GET"])
+def get_progress():
+    uuid = request.args.get("uuid", "")
+
+    if uuid == "":
+        result = {}
+        result["error"] = "No s'ha especificat el uuid"
+        return json_answer(result, 404)
+
+    if not ProcessedFiles.is_valid_uuid(uuid):
+        result = {}
+        result["error"] = "uuid no vàlid"
+        return json_answer(result, 400)
+
+    db = BatchFilesDB()
+    if db.is_queued(uuid):
+        output_directory = os.path.join(UPLOAD_FOLDER, f"{uuid}_output")
+        progress = read_progress(get_progress_filename(output_directory))
+        if not progress:
+            progress = {"stage": "queued", "percentage": 0}
+
+        progress.update(get_estimate(db, uuid))
+        return json_answer(progress)
+
+    exists, _ = Catalog().do_files_exists(uuid)
+    if not exists:
+        result = {"error": "uuid no existeix"}
+        return json_answer(result, 404)
+
+    return json_answer({"stage": FINISHED, "percentage": 100})
+
+
 ALLOWED_MIMEYPES = {"mp4": "video/mp4"}
 
 
@@ -164,9 +201,11 @@ def _get_mimetype(extension):
 
 
 def _get_record(_uuid):
-    processed_dir = ProcessedFiles.get_processed_directory()
-    db = BatchFilesDB(processed_dir)
-    return db._read_record_from_uuid(_uuid)
+    return Catalog().get_record(_uuid)
+
+
+def _get_deleted_error():
+    return {"error": "No existeix aquest fitxer. Potser ja s'esborrat."}
 
 
 # Reference: https://github.com/pallets/werkzeug/blob/main/src/werkzeug/utils.py#L454
@@ -203,13 +242,15 @@ def get_file():
         logging.debug(f"/get_file/ {result['error']} - uuid: '{uuid}'")
         return json_answer(result, 400)
 
-    exists, _ = ProcessedFiles.do_files_exists(uuid)
-    if not exists:
+    # The files and the record come from the catalog, the file is only
+    # accessed to send it
+    published = Catalog().get(uuid)
+    if not published or published.get_missing():
         result = {"error": "uuid no existeix"}
         logging.debug(f"/get_file/ {result['error']} - uuid: '{uuid}'")
         return json_answer(result, 404)
 
-    record = _get_record(uuid)
+    record = published.get_record()
     original_name, original_ext = os.path.splitext(record.original_filename)
 
     if ext == "bin":
@@ -218,17 +259,22 @@ def get_file():
     fullname = os.path.join(ProcessedFiles.get_processed_directory(), uuid)
     fullname = f"{fullname}.{ext}"
 
-    if not os.path.exists(fullname):
-        result = {}
-        result["error"] = "No existeix aquest fitxer. Potser ja s'esborrat."
-        return json_answer(result, 404)
+    if not published.has(f".{ext}"):
+        return json_answer(_get_deleted_error(), 404)
 
     if ext == "dub":
         ext = original_ext[1:]
 
     filenames = _get_download_names(original_name, ext)
     mime_type = _get_mimetype(ext)
-    resp = make_response(send_file(fullname, as_attachment=True, mimetype=mime_type))
+    try:
+        resp = make_response(
+            send_file(fullname, as_attachment=True, mimetype=mime_type)
+        )
+    except FileNotFoundError:
+        # Purged after the catalog was read
+        return json_answer(_get_deleted_error(), 404)
+
     resp.headers["Content-Disposition"] = f"attachment; {filenames}"
     resp.headers["Accept-Ranges"] = "bytes"
     resp.headers["Access-Control-Expose-Headers"] = "Content-Disposition"
@@ -238,11 +284,6 @@ def get_file():
     return resp
 
 
-QUEUE_CAPACITY = int(os.environ.get("QUEUE_CAPACITY", "150"))
-MAX_SIZE = int(os.environ.get("MAX_SIZE", 1024 * 1024 * 1024))  # 1GB by default
-MAX_PER_EMAIL = int(os.environ.get("MAX_PER_EMAIL", "3"))
-
-
 @app.route("/feedback_form/", methods=["POST"])
 def feedback_form():
     if len(request.values) == 0:
@@ -273,18 +314,6 @@ def feedback_form():
     return json_answer([])
 
 
-def get_video_duration_ms(video_file):
-    try:
-        audio = AudioSegment.from_file(video_file)
-        duration = len(audio)
-        return duration
-
-    except Exception as e:
-        logging.error(f"Could not get video duration for '{video_file}'")
-        logging.error(e)
-        return 0
-
-
 @app.route("/dubbing_file/", methods=["POST"])
 def upload_file():
     file = request.files["file"] if "file" in request.files else ""
@@ -311,57 +340,39 @@ def upload_file():
         logging.info(f"/dubbing_file/ {result['error']} - {email}")
         return json_answer(result, 413)
 
+    # Before anything is stored, the limits apply also to the uploads that
+    # could be served from the content index
     db = BatchFilesDB()
-    if db.count() >= QUEUE_CAPACITY:
-        result = {
-            "error": "Hi ha massa fitxers a la cua de processament. Proveu-ho en una estona"
-        }
-        logging.info(f"/dubbing_file/ {result['error']} - {email}")
-        Usage().log("queue_full_response")
-        return json_answer(result, 429)
-
-    if len(db.select(email=email)) >= MAX_PER_EMAIL:
-        result = {
-            "error": f"Ja teniu {MAX_PER_EMAIL} fitxers a la cua. Espereu-vos que es processin per enviar-ne de nous."
-        }
-        logging.info(f"/dubbing_file/ {result['error']} - {email}")
-        Usage().log("queue_max_per_mail")
-        return json_answer(result, 429)
+    error = get_queue_error(db, email)
+    if error:
+        return json_answer(*reject(error, "/dubbing_file/", email))
 
-    waiting_queue = len(db.select())
     _uuid = db.get_new_uuid()
     fullname = os.path.join(UPLOAD_FOLDER, _uuid)
-    file.save(fullname)
-
-    MAX_TIME_MIN = 70
-    video_len_ms = get_video_duration_ms(fullname)
-    if video_len_ms >= MAX_TIME_MIN * 60 * 1000:
-        result = {
-            "error": f"No s'ha acceptat el vídeo, ja que dura més de {MAX_TIME_MIN} minuts que és el màxim permès"
-        }
-        logging.info(f"/dubbing_file/ {result['error']} - {email}")
-        Usage().log("max_time")
+    content_hash, media = store_upload(file.stream, fullname)
+    error = get_media_error(media)
+    if error:
         os.remove(fullname)
-        return json_answer(result, 429)
+        return json_answer(*reject(error, "/dubbing_file/", email))
 
-    db.create(
-        fullname,
+    batchfile = BatchFile(
+        filename_dbrecord=db.get_record_file_from_uuid(_uuid),
+        filename=fullname,
         email=email,
         variant=variant,
         original_filename=file.filename,
         video_lang=video_lang,
-        record_uuid=_uuid,
+        operation="create",
+        revision=1,
         original_subtitles=original_subtitles,
         dubbed_subtitles=dubbed_subtitles,
+        content_hash=content_hash,
     )
+    if serve_from_content_index(batchfile, _uuid):
+        result = {"waiting_queue": "0", "filename": file.filename, "uuid": _uuid}
+        return json_answer(result)
 
-    size_mb = os.path.getsize(fullname) / 1024 / 1024
-    logging.info(
-        f"Saved file {file.filename} to {fullname} (size: {size_mb:.2f}MB) for user {email}, waiting_queue: {waiting_queue}"
-    )
-    Usage().log("dubbing_file")
-    result = {"waiting_queue": str(waiting_queue), "filename": file.filename, "uuid": _uuid}
-    return json_answer(result)
+    return json_answer(enqueue(db, batchfile, media))
 
 
 TTS_URL = "http://matcha-service:8100/"
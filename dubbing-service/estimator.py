@@ -0,0 +1 @@
+../dubbing-batch/estimator.py
\ No newline at end of file
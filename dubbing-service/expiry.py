@@ -0,0 +1 @@
+../dubbing-batch/expiry.py
\ No newline at end of file
@@ -0,0 +1 @@
+../dubbing-batch/fastcopy.py
\ No newline at end of file
@@ -0,0 +1 @@
+../dubbing-batch/incremental.py
\ No newline at end of file
@@ -0,0 +1 @@
+../dubbing-batch/mediaprobe.py
\ No newline at end of file
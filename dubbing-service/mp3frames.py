@@ -0,0 +1 @@
+../dubbing-batch/mp3frames.py
\ No newline at end of file
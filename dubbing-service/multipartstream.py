@@ -0,0 +1 @@
+../dubbing-batch/multipartstream.py
\ No newline at end of file
@@ -0,0 +1 @@
+../dubbing-batch/progress.py
\ No newline at end of file
@@ -0,0 +1 @@
+../dubbing-batch/queuewatcher.py
\ No newline at end of file
@@ -0,0 +1 @@
+../dubbing-batch/scheduler.py
\ No newline at end of file
@@ -0,0 +1 @@
+../dubbing-batch/storagestats.py
\ No newline at end of file
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8 -*-
+#
+# Copyright (c) 2026 Jordi Mas i Hernandez <jmas@softcatala.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import logging
+import os
+import re
+from flask import request, Blueprint, jsonify
+from pydub import AudioSegment
+from batchfilesdb import BatchFilesDB, BatchFile, get_full_variant
+from processedfiles import ProcessedFiles
+from contentindex import ContentIndex, HASH_PART_SIZE, hash_stream
+from mediaprobe import Mp4Probe, ProbeError, has_audio, probe_file
+from uploadsession import UploadSession, UploadSessionNotFound
+from expiry import ExpiryIndex
+from estimator import get_estimate
+from queuewatcher import QueueWatcher
+from sendmail import send_mail_create
+from usage import Usage
+
+"""
+    Accepting an upload: the checks of the queue and of the video, and
+    queueing it, for /dubbing_file/ and for the resumable uploads.
+
+    A resumable upload is a session (POST /uploads/) in which the parts of
+    the file are sent with PUT /uploads/<id> and a Content-Range, in any
+    order, in parallel and again if they failed, and that is queued with
+    POST /uploads/<id>/finalize. The queue is checked when the session is
+    created and the video as soon as the parts with its metadata arrive
+    (the first and, if it is not fast start, the last), before most of the
+    bytes are sent. Each part is hashed when received and the content hash
+    is combined from them (see uploadsession.py).
+"""
+
+UPLOAD_FOLDER = "/srv/data/files/"
+QUEUE_CAPACITY = int(os.environ.get("QUEUE_CAPACITY", "150"))
+MAX_SIZE = int(os.environ.get("MAX_SIZE", 1024 * 1024 * 1024))  # 1GB by default
+MAX_PER_EMAIL = int(os.environ.get("MAX_PER_EMAIL", "3"))
+MAX_TIME_MIN = 70
+
+bp = Blueprint("uploads_routes", __name__)
+
+
+def get_video_duration_ms(video_file):
+    try:
+        audio = AudioSegment.from_file(video_file)
+        duration = len(audio)
+        return duration
+
+    except Exception as e:
+        logging.error(f"Could not get video duration for '{video_file}'")
+        logging.error(e)
+        return 0
+
+
+# The errors are (usage action, message, http status). uploads are the
+# resumable uploads of the email not finalized yet.
+def get_queue_error(db, email, uploads=0):
+    if db.count() >= QUEUE_CAPACITY:
+        error = "Hi ha massa fitxers a la cua de processament. Proveu-ho en una estona"
+        return "queue_full_response", error, 429
+
+    if len(db.select(email=email)) + uploads >= MAX_PER_EMAIL:
+        error = f"Ja teniu {MAX_PER_EMAIL} fitxers a la cua. Espereu-vos que es processin per enviar-ne de nous."
+        return "queue_max_per_mail", error, 429
+
+    return None
+
+
+def get_media_error(media):
+    if media["duration_ms"] >= MAX_TIME_MIN * 60 * 1000:
+        error = f"No s'ha acceptat el vídeo, ja que dura més de {MAX_TIME_MIN} minuts que és el màxim permès"
+        return "max_time", error, 429
+
+    # Unknown if it was not probed
+    if "streams" in media and not has_audio(media):
+        return "no_audio", "No s'ha acceptat el vídeo, ja que no té àudio", 429
+
+    return None
+
+
+def reject(error, endpoint, email):
+    """Returns the answer (result, status) of an error"""
+    action, message, status = error
+    result = {"error": message}
+    logging.info(f"{endpoint} {result['error']} - {email}")
+    Usage().log(action)
+    return result, status
+
+
+def _probe_stored(fullname):
+    """Only the videos that cannot be probed are decoded"""
+    try:
+        return probe_file(fullname)
+    except (ProbeError, OSError) as e:
+        logging.info(f"Cannot probe '{fullname}' ({e}), decoding it")
+        return {"duration_ms": get_video_duration_ms(fullname)}
+
+
+# The container metadata is read while the upload is stored, if the video is
+# rejected it stops there. For /dubbing_file/ Werkzeug has already spooled the
+# request body to a temporary file, the hash and the probe are computed while
+# copying it to the queue; the resumable uploads hash each part as it arrives
+def store_upload(stream, fullname):
+    """Returns (content hash, media)"""
+    probe = Mp4Probe()
+
+    def _check(chunk):
+        media = probe.feed(chunk)
+        return media is None or get_media_error(media) is None
+
+    content_hash = hash_stream(stream, fullname, _check)
+    media = probe.result
+    if media is None:
+        media = _probe_stored(fullname)
+
+    return content_hash, media
+
+
+# If the same video has already been dubbed with the same options, the result
+# is copied to the new uuid instead of queuing it again
+def serve_from_content_index(batchfile, _uuid):
+    try:
+        cached_uuid = ContentIndex().find_result(batchfile)
+        if not cached_uuid:
+            return False
+
+        db = BatchFilesDB(ProcessedFiles.get_processed_directory(), backend="files")
+        # The original video was published with the extension of its own upload
+        cached = db._read_record_from_uuid(cached_uuid)
+        video_extension = os.path.splitext(cached.original_filename)[1] or ".bin"
+        names = ProcessedFiles(cached_uuid).copy_to_uuid(_uuid, video_extension)
+        # The record is created last, it marks the result as complete
+        db.create(
+            batchfile.filename,
+            email=batchfile.email,
+            variant=batchfile.variant,
+            original_filename=batchfile.original_filename,
+            video_lang=batchfile.video_lang,
+            record_uuid=_uuid,
+            original_subtitles=batchfile.original_subtitles,
+            dubbed_subtitles=batchfile.dubbed_subtitles,
+            content_hash=batchfile.content_hash,
+        )
+        ExpiryIndex().add(names + [f"{_uuid}.dbrecord"])
+    except Exception as e:
+        logging.error(f"serve_from_content_index. Error: {e}")
+        return False
+
+    os.remove(batchfile.filename)
+
+    send_mail_create(batchfile, None, get_full_variant(batchfile.variant), _uuid)
+
+    logging.info(
+        f"/dubbing_file/ served {_uuid} from {cached_uuid} for user {batchfile.email}"
+    )
+    Usage().log("dubbing_file_deduplicated")
+    return True
+
+
+def enqueue(db, batchfile, media):
+    """Queues the upload and returns the answer"""
+    _uuid = os.path.basename(batchfile.filename)
+    waiting_queue = len(db.select())
+
+    db.create(
+        batchfile.filename,
+        email=batchfile.email,
+        variant=batchfile.variant,
+        original_filename=batchfile.original_filename,
+        video_lang=batchfile.video_lang,
+        record_uuid=_uuid,
+        original_subtitles=batchfile.original_subtitles,
+        dubbed_subtitles=batchfile.dubbed_subtitles,
+        content_hash=batchfile.content_hash,
+        duration=media["duration_ms"],
+        media=media if "streams" in media else None,
+    )
+    QueueWatcher.notify_hosts()
+
+    size_mb = os.path.getsize(batchfile.filename) / 1024 / 1024
+    logging.info(
+        f"Saved file {batchfile.original_filename} to {batchfile.filename} (size: {size_mb:.2f}MB) for user {batchfile.email}, waiting_queue: {waiting_queue}"
+    )
+    Usage().log("dubbing_file")
+    result = {
+        "waiting_queue": str(waiting_queue),
+        "filename": batchfile.original_filename,
+        "uuid": _uuid,
+    }
+    result.update(get_estimate(db, _uuid))
+    return result
+
+
+def _session_not_found():
+    return jsonify({"error": "La pujada no existeix"}), 404
+
+
+def _get_session(upload_id):
+    if not ProcessedFiles.is_valid_uuid(upload_id):
+        return None
+
+    session = UploadSession(upload_id)
+    if not session.load():
+        return None
+
+    return session
+
+
+@bp.route("/uploads/", methods=["POST"])
+def create_upload():
+    email = request.values.get("email", "")
+    filename = request.values.get("filename", "")
+    try:
+        size = int(request.values.get("size", "0"))
+    except ValueError:
+        size = 0
+
+    if filename == "" or size <= 0:
+        return jsonify({"error": "No s'ha especificat el fitxer"}), 404
+
+    if email == "":
+        return jsonify({"error": "No s'ha especificat el correu"}), 404
+
+    if not filename.lower().endswith(".mp4"):
+        return jsonify({"error": "Tipus de fitxer no vàlid"}), 415
+
+    if size > MAX_SIZE:
+        result = {"error": "El fitxer és massa gran"}
+        logging.info(f"/uploads/ {result['error']} - {email}")
+        return jsonify(result), 413
+
+    UploadSession.purge()
+    db = BatchFilesDB()
+    error = get_queue_error(db, email, UploadSession.count_by_email(email))
+    if error:
+        result, status = reject(error, "/uploads/", email)
+        return jsonify(result), status
+
+    fields = {
+        "email": email,
+        "variant": request.values.get("variant", ""),
+        "video_lang": request.values.get("video_lang", ""),
+        "original_subtitles": request.values.get("original_subtitles") == "on",
+        "dubbed_subtitles": request.values.get("dubbed_subtitles") == "on",
+        "filename": filename,
+        "size": size,
+    }
+    session = UploadSession.create(db.get_new_uuid(), fields)
+    logging.debug(f"/uploads/ created {session.upload_id} for {email} ({size} bytes)")
+    result = {
+        "upload_id": session.upload_id,
+        "part_size": HASH_PART_SIZE,
+        "parts": session.get_parts(),
+    }
+    return jsonify(result), 200
+
+
+@bp.route("/uploads/<upload_id>", methods=["GET"])
+def get_upload(upload_id):
+    session = _get_session(upload_id)
+    if not session:
+        return _session_not_found()
+
+    try:
+        received = session.get_received()
+    except UploadSessionNotFound:
+        return _session_not_found()
+
+    result = {
+        "part_size": HASH_PART_SIZE,
+        "parts": session.get_parts(),
+        "received": received,
+    }
+    return jsonify(result), 200
+
+
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+@bp.route("/uploads/<upload_id>", methods=["PUT"])
+def put_upload(upload_id):
+    session = _get_session(upload_id)
+    if not session:
+        return _session_not_found()
+
+    # Each range is one part, see HASH_PART_SIZE
+    match = CONTENT_RANGE.fullmatch(request.headers.get("Content-Range", ""))
+    if not match:
+        return jsonify({"error": "Falta el Content-Range"}), 400
+
+    start, end, size = [int(value) for value in match.groups()]
+    index = session.get_part_index(start, end, size)
+    if index is None:
+        return jsonify({"error": "Rang no vàlid"}), 416
+
+    # Finalized or rejected by another request while this part was sent
+    try:
+        if not session.write_part(index, request.stream):
+            return jsonify({"error": "La part no és completa"}), 400
+
+        media = session.get_media()
+        if media:
+            error = get_media_error(media)
+            if error:
+                session.delete()
+                result, status = reject(error, "/uploads/", session.fields["email"])
+                return jsonify(result), status
+
+        received = session.get_received()
+    except UploadSessionNotFound:
+        return _session_not_found()
+
+    result = {"received": len(received), "parts": session.get_parts()}
+    return jsonify(result), 200
+
+
+@bp.route("/uploads/<upload_id>/finalize", methods=["POST"])
+def finalize_upload(upload_id):
+    session = _get_session(upload_id)
+    if not session:
+        return _session_not_found()
+
+    fields = session.fields
+    email = fields["email"]
+    # As /dubbing_file/, before the upload is served from the content index or
+    # queued. The session is kept, it can be finalized again later
+    db = BatchFilesDB()
+    error = get_queue_error(db, email)
+    if error:
+        result, status = reject(error, "/uploads/", email)
+        return jsonify(result), status
+
+    fullname = os.path.join(UPLOAD_FOLDER, upload_id)
+    try:
+        received = session.get_received()
+        missing = [i for i in range(session.get_parts()) if i not in received]
+        if missing:
+            result = {"error": "Falten parts del fitxer", "missing": missing}
+            return jsonify(result), 409
+
+        content_hash = session.get_content_hash()
+        media = session.get_media()
+        os.replace(session.data, fullname)
+    except (UploadSessionNotFound, FileNotFoundError):
+        return _session_not_found()
+
+    session.delete()
+    if not media:
+        media = _probe_stored(fullname)
+
+    error = get_media_error(media)
+    if error:
+        os.remove(fullname)
+        result, status = reject(error, "/uploads/", email)
+        return jsonify(result), status
+
+    batchfile = BatchFile(
+        filename_dbrecord=db.get_record_file_from_uuid(upload_id),
+        filename=fullname,
+        email=email,
+        variant=fields["variant"],
+        original_filename=fields["filename"],
+        video_lang=fields["video_lang"],
+        operation="create",
+        revision=1,
+        original_subtitles=fields["original_subtitles"],
+        dubbed_subtitles=fields["dubbed_subtitles"],
+        content_hash=content_hash,
+    )
+    if serve_from_content_index(batchfile, upload_id):
+        result = {
+            "waiting_queue": "0",
+            "filename": fields["filename"],
+            "uuid": upload_id,
+        }
+        return jsonify(result), 200
+
+    return jsonify(enqueue(db, batchfile, media)), 200
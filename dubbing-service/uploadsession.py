@@ -0,0 +1 @@
+../dubbing-batch/uploadsession.py
\ No newline at end of file
@@ -20,113 +20,182 @@
 
 import os
 import datetime
-from shutil import copyfile
+import json
 import logging
-import multiprocessing
+import threading
 
-lock = multiprocessing.Lock()
+lock = threading.Lock()
 
 """
     This class keeps a log of the usage of a service
-        - For usage write a line on the file with the date
-        - At the number of days specified cleans old entries
+        - Each action is a line appended to the file of its day (UTC), with
+          a single write in append mode, so the dubbing-service processes and
+          the workers can log at the same time without locks
+        - The files older than the number of days specified are deleted
+        - Once a day is over its counts per action are saved next to it, the
+          counts of the current day are kept in memory and each call to
+          get_stats only reads the lines appended since the previous one
 """
 
 
 class Usage(object):
+    DIRECTORY = "/srv/data/usage"
+    # Before the files per day, converted the first time it is used
     FILE = "/srv/data/usage.txt"
     DAYS_TO_KEEP = 7
     rotate = True
+    # filename: (offset read, {action: count}), for the files of each process
+    _counts = {}
+    _last_rotated = None
 
-    def _set_filename(self, filename):
-        self.FILE = filename
+    def _set_directory(self, directory):
+        self.DIRECTORY = directory
+        self.FILE = os.path.normpath(directory) + ".txt"
 
     def _get_time_now(self):
         return datetime.datetime.utcnow()
 
-    def get_date_from_line(self, line):
-        return line.split("\t", 1)[0]
+    def _get_day_filename(self, day):
+        return os.path.join(self.DIRECTORY, f"{day}.txt")
 
-    def log(self, action):
-        current_time = self._get_time_now().strftime("%Y-%m-%d %H:%M:%S")
+    def _get_counts_filename(self, day):
+        return os.path.join(self.DIRECTORY, f"{day}.counts")
+
+    def _get_days(self):
         try:
-            with lock:
-                with open(self.FILE, "a+") as file_out:
-                    file_out.write(f"{current_time}\t{action}\n")
+            names = os.listdir(self.DIRECTORY)
+        except FileNotFoundError:
+            return []
+
+        return sorted(name[:-4] for name in names if name.endswith(".txt"))
 
-                if self.rotate and self._is_old_line(self._read_first_line()):
-                    self._rotate_file()
+    def _append(self, day, lines):
+        # A single write with O_APPEND is not interleaved with other writers
+        fd = os.open(
+            self._get_day_filename(day), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+        )
+        try:
+            os.write(fd, lines.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def log(self, action):
+        now = self._get_time_now()
+        current_time = now.strftime("%Y-%m-%d %H:%M:%S")
+        day = current_time[:10]
+        try:
+            try:
+                self._append(day, f"{current_time}\t{action}\n")
+            except FileNotFoundError:
+                os.makedirs(self.DIRECTORY, exist_ok=True)
+                self._migrate()
+                self._append(day, f"{current_time}\t{action}\n")
+
+            # Once a day per process
+            if self.rotate and Usage._last_rotated != day:
+                Usage._last_rotated = day
+                self._rotate(now)
         except Exception as exception:
             logging.error("Usage.log. Error:" + str(exception))
             pass
 
+    def _migrate(self):
+        """Splits the log used before the files per day"""
+        migrating = self.FILE + ".migrating"
+        try:
+            os.rename(self.FILE, migrating)
+        except FileNotFoundError:
+            return  # Nothing to migrate or done by another process
+
+        lines = {}
+        with open(migrating, "r") as file_in:
+            for line in file_in:
+                lines.setdefault(line[:10], []).append(line)
+
+        for day, day_lines in lines.items():
+            self._append(day, "".join(day_lines))
+
+        os.remove(migrating)
+
+    def _rotate(self, now):
+        oldest = (now - datetime.timedelta(days=self.DAYS_TO_KEEP)).strftime("%Y-%m-%d")
+        for day in self._get_days():
+            if day > oldest:
+                break
+
+            for filename in [
+                self._get_day_filename(day),
+                self._get_counts_filename(day),
+            ]:
+                try:
+                    os.remove(filename)
+                except FileNotFoundError:
+                    pass  # Rotated by another process
+
     def _get_line_components(self, line):
         components = line.strip().split("\t")
         return components[0], components[1]
 
-    def get_stats(self, date_requested):
+    def _count_lines(self, filename):
+        """Counts the actions of the lines appended since the previous call"""
+        offset, counts = self._counts.get(filename, (0, {}))
+        try:
+            with open(filename, "rb") as file_in:
+                file_in.seek(offset)
+                data = file_in.read()
+        except FileNotFoundError:
+            return {}
+
+        # A line that is being written is read the next time
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].decode("utf-8").splitlines():
+            try:
+                _, action = self._get_line_components(line)
+            except IndexError:
+                continue
+
+            counts[action] = counts.get(action, 0) + 1
+
+        self._counts[filename] = (offset + end, counts)
+        return counts
+
+    def _get_day_counts(self, day, today):
+        if day == today:
+            return self._count_lines(self._get_day_filename(day))
+
+        # The day is over, its counts are saved once for all the processes
+        counts_filename = self._get_counts_filename(day)
+        try:
+            with open(counts_filename, "r") as file_in:
+                return json.load(file_in)
+        except (FileNotFoundError, ValueError):
+            pass
+
+        counts = self._count_lines(self._get_day_filename(day))
+        self._counts.pop(self._get_day_filename(day), None)
+        with open(counts_filename + ".tmp", "w") as file_out:
+            json.dump(counts, file_out)
+
+        os.replace(counts_filename + ".tmp", counts_filename)
+        return counts
+
+    def get_stats(self, date_requested, date_to=None):
+        """Counts per action from date_requested to date_to (both included)"""
         results = {}
+        first_day = date_requested.strftime("%Y-%m-%d")
+        last_day = (date_to or date_requested).strftime("%Y-%m-%d")
+        today = self._get_time_now().strftime("%Y-%m-%d")
         try:
-            with open(self.FILE, "r") as file_in:
-                for line in file_in:
-                    date_component, action = self._get_line_components(line)
-
-                    datetime_no_newline = date_component
-                    line_datetime = datetime.datetime.strptime(
-                        datetime_no_newline, "%Y-%m-%d %H:%M:%S"
-                    )
-                    if line_datetime.date() != date_requested.date():
+            with lock:
+                for day in self._get_days():
+                    if day < first_day or day > last_day:
                         continue
 
-                    cnt = results.get(action)
-                    if cnt:
-                        cnt += 1
-                    else:
-                        cnt = 1
-
-                    results[action] = cnt
+                    for action, count in self._get_day_counts(day, today).items():
+                        results[action] = results.get(action, 0) + count
 
         except Exception as exception:
             logging.error("Usage.get_stats. Error:" + str(exception))
             pass
 
         return results
-
-    def _read_first_line(self):
-        try:
-            with open(self.FILE, "r") as f:
-                first = f.readline()
-                return first
-        except IOError:
-            return None
-
-    def _is_old_line(self, line):
-        if line is None:
-            return False
-
-        invalid = False
-
-        try:
-            line = self.get_date_from_line(line)
-            line_datetime = datetime.datetime.strptime(line, "%Y-%m-%d %H:%M:%S")
-
-        except Exception as exception:
-            logging.error("Usage._is_old_line. Error:" + str(exception))
-            invalid = True
-
-        now = self._get_time_now() - datetime.timedelta(days=self.DAYS_TO_KEEP)
-        return invalid or line_datetime.date() <= now.date()
-
-    def _rotate_file(self):
-        NEW = "usage.new"
-        directory = os.path.dirname(os.path.abspath(self.FILE))
-        new_file = os.path.join(directory, NEW)
-
-        with open(self.FILE, "r") as temp:
-            with open(new_file, "w") as new:
-                for line in temp:
-                    if self._is_old_line(line) is False:
-                        new.write(line)
-
-        copyfile(new_file, self.FILE)
-        os.remove(new_file)
@@ -0,0 +1 @@
+../dubbing-batch/utterancecache.py
\ No newline at end of file
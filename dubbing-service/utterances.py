@@ -18,15 +18,23 @@
 # Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 # Boston, MA 02111-1307, USA.
 
+import copy
 import logging
 import os
 from open_dubbing.utterance import Utterance
-from pydantic import BaseModel, field_validator
-from flask import request, make_response, Blueprint, send_file, jsonify
+from pydantic import BaseModel, Field, field_validator
+from flask import request, make_response, Blueprint, send_file, jsonify, Response
 from processedfiles import ProcessedFiles
 from batchfilesdb import BatchFilesDB
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from usage import Usage
+from queuewatcher import QueueWatcher
+import incremental
+from estimator import get_estimate
+from catalog import Catalog
+import utterancecache
+from utterancecache import UtteranceCache
+import multipartstream
 
 UPLOAD_FOLDER = "/srv/data/files/"
 
@@ -34,9 +42,7 @@ bp = Blueprint("utterances_routes", __name__)
 
 
 def _get_record(_uuid):
-    processed_dir = ProcessedFiles.get_processed_directory()
-    db = BatchFilesDB(processed_dir)
-    return db._read_record_from_uuid(_uuid)
+    return Catalog().get_record(_uuid)
 
 
 def _update_json(uuid, utterance_update):
@@ -46,7 +52,13 @@ def _update_json(uuid, utterance_update):
     utterance_update = utterance_update
     logging.debug(f"Update json: {utterance_update}")
 
-    updated = utterance.update_utterances(utterance_master, utterance_update)
+    # update_utterances modifies the utterances of the master in place
+    updated = utterance.update_utterances(
+        copy.deepcopy(utterance_master), utterance_update
+    )
+    ids, windows = incremental.get_changes(utterance_master, updated)
+    if len(ids) == 0:
+        return ids
 
     utterance.save_utterances(
         utterance_metadata=updated,
@@ -55,6 +67,8 @@ def _update_json(uuid, utterance_update):
         do_hash=False,
         unique_id=False,
     )
+    incremental.save_changes(directory, windows)
+    return ids
 
 
 def _copy_files_to_upload_directory(uuid, video_file):
@@ -68,19 +82,61 @@ def _copy_files_to_upload_directory(uuid, video_file):
     processedfiles.copy_output_dir_to(target)
 
 
+# The editor requests them many times, they are parsed once (see utterancecache.py)
 def _load_utterances(uuid):
     record = _get_record(uuid)
     if not record:
         raise ValueError(f"Cannot not find {uuid}")
 
-    directory = os.path.join(ProcessedFiles.get_processed_directory(), uuid + "_output")
-    utterance = Utterance(target_language="cat", output_directory=directory)
-    utterance_data, _, metadata = utterance.load_utterances()
-    return utterance_data, metadata
+    return UtteranceCache().get(uuid, record.revision)
+
+
+# The answers are serialized once (see utterancecache.py). The editor sends
+# the ETag it has and gets a 304 if the utterances have not changed.
+def _send_json(parsed, name, body=None, headers=None):
+    """body is given for a page, otherwise the whole answer is sent"""
+    encoding = None
+    if request.accept_encodings["gzip"] > 0:
+        encoding = "gzip"
+
+    if parsed.is_current(request.headers.get("If-None-Match", "")):
+        resp = Response(status=304)
+    else:
+        if body is None:
+            body = parsed.get_json(name)
+            if encoding:
+                body = parsed.get_compressed(name)
+        elif encoding and len(body) >= utterancecache.MIN_COMPRESS_SIZE:
+            body = utterancecache.compress(body)
+        else:
+            encoding = None
+
+        resp = Response(body, mimetype="application/json")
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+
+    resp.headers["ETag"] = parsed.get_etag(encoding)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Access-Control-Expose-Headers"] = "ETag, X-Total-Count"
+    for header, value in (headers or {}).items():
+        resp.headers[header] = value
+
+    return resp
 
 
 class Utterances(BaseModel):
     uuid: str
+    # Optional pagination (offset, limit) and time range (start, end) in seconds
+    offset: int = Field(default=0, ge=0)
+    limit: Optional[int] = Field(default=None, gt=0)
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+    def is_paginated(self):
+        return self.offset or any(
+            value is not None for value in [self.limit, self.start, self.end]
+        )
 
     @field_validator("uuid")
     def uuid_exists(cls, value: str):
@@ -94,16 +150,30 @@ def get_utterances():
     try:
         query_params = request.args.to_dict()
         utterances = Utterances(**query_params)
-        utterance_data, _ = _load_utterances(utterances.uuid)
+        parsed = _load_utterances(utterances.uuid)
 
         Usage().log("get_utterances")
-        return jsonify(utterance_data), 200
+        if not utterances.is_paginated():
+            return _send_json(parsed, "utterances")
+
+        body, total = parsed.get_page(
+            utterances.offset, utterances.limit, utterances.start, utterances.end
+        )
+        return _send_json(parsed, "utterances", body, {"X-Total-Count": total})
 
     except ValueError as e:
         logging.error(e)
         return jsonify({"error": f"{e}"}), 400
 
 
+def _get_dubbed_filename(utterance):
+    target_path = ProcessedFiles.get_processed_directory()
+    if not target_path.endswith("/"):
+        target_path += "/"
+
+    return utterance["dubbed_path"].replace(UPLOAD_FOLDER, target_path)
+
+
 class UtteranceModel(BaseModel):
     uuid: str
     id: int
@@ -121,23 +191,11 @@ def get_dubbed_utterance():
         logging.debug(f"/get_dubbed_utterance/ - {request.args.to_dict()}")
         query = UtteranceModel.model_validate(request.args.to_dict())
 
-        utterance_data, _ = _load_utterances(query.uuid)
-
-        utterance = None
-        for u in utterance_data:
-            if u["id"] == query.id:
-                utterance = u
-                break
-
+        utterance = _load_utterances(query.uuid).get(query.id)
         if not utterance:
             raise ValueError("id not found")
 
-        fullname = utterance["dubbed_path"]
-        target_path = ProcessedFiles.get_processed_directory()
-        if not target_path.endswith("/"):
-            target_path += "/"
-
-        fullname = fullname.replace(UPLOAD_FOLDER, target_path)
+        fullname = _get_dubbed_filename(utterance)
         if not os.path.exists(fullname):
             result = {}
             result["error"] = "No existeix aquest fitxer. Potser ja s'esborrat."
@@ -155,6 +213,65 @@ def get_dubbed_utterance():
         return jsonify({"error": f"{e}"}), 404
 
 
+class UtterancesBulkModel(BaseModel):
+    uuid: str
+    ids: Optional[List[int]] = None
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+    @field_validator("uuid")
+    def uuid_exists(cls, value: str):
+        if not ProcessedFiles.is_valid_uuid(value):
+            raise ValueError("uuid no vàlid")
+        return value
+
+    @field_validator("ids", mode="before")
+    def ids_from_list(cls, value):
+        if isinstance(value, str):
+            return [_id for _id in value.split(",") if _id.strip()]
+        return value
+
+
+# All the clips (the ids given or in the time range) in one multipart/mixed
+# response, each part with the X-Utterance-Id header. It is streamed from the
+# files, the ids that are unknown or without audio are listed in
+# X-Missing-Utterances.
+@bp.route("/get_dubbed_utterances/", methods=["GET"])
+def get_dubbed_utterances():
+    try:
+        logging.debug(f"/get_dubbed_utterances/ - {request.args.to_dict()}")
+        query = UtterancesBulkModel.model_validate(request.args.to_dict())
+        parsed = _load_utterances(query.uuid)
+
+        parts = []
+        missing = [str(_id) for _id in parsed.get_unknown(query.ids)]
+        for utterance in parsed.select(query.ids, query.start, query.end):
+            headers = {
+                "Content-Type": "audio/mpeg",
+                "X-Utterance-Id": utterance["id"],
+            }
+            try:
+                fullname = _get_dubbed_filename(utterance)
+                parts.append(multipartstream.Part(fullname, headers))
+            except (KeyError, OSError):
+                missing.append(str(utterance["id"]))
+
+        boundary = multipartstream.get_boundary()
+        resp = Response(
+            multipartstream.stream_parts(boundary, parts),
+            mimetype=multipartstream.get_content_type(boundary),
+        )
+        resp.headers["Content-Length"] = multipartstream.get_length(boundary, parts)
+        resp.headers["X-Missing-Utterances"] = ",".join(missing)
+        resp.headers["Access-Control-Expose-Headers"] = "X-Missing-Utterances"
+        resp.headers["Cross-Origin-Resource-Policy"] = "cross-origin"
+
+        Usage().log("get_dubbed_utterances")
+        return resp
+    except ValueError as e:
+        return jsonify({"error": f"{e}"}), 404
+
+
 class Regenerate(BaseModel):
     uuid: str
     utterance_update: List[Dict[str, Any]]
@@ -179,15 +296,16 @@ def regenerate_video():
             raise ValueError(f"Cannot not find {uuid}")
 
         db = BatchFilesDB()
-        queued_record = db.get_record_file_from_uuid(uuid)
-        logging.debug(f"queued_record: {queued_record}")
-        if os.path.exists(queued_record):
+        if db.is_queued(uuid):
             raise ValueError(
                 "Heu d'esperar que la generació que heu demanat finalitzi abans de poder demanar-ne un altre."
             )
 
         waiting_queue = len(db.select())
-        _update_json(uuid, regenerate.utterance_update)
+        modified = _update_json(uuid, regenerate.utterance_update)
+        if len(modified) == 0:
+            logging.debug(f"/regenerate_video: no changes for {uuid}")
+            return jsonify({"waiting_queue": waiting_queue, "modified": 0}), 200
 
         fullname = os.path.join(UPLOAD_FOLDER, uuid)
         _copy_files_to_upload_directory(uuid, fullname)
@@ -203,10 +321,14 @@ def regenerate_video():
             revision=record.revision + 1,
             original_subtitles=record.original_subtitles,
             dubbed_subtitles=record.dubbed_subtitles,
+            duration=record.duration,
+            media=record.media,
         )
+        QueueWatcher.notify_hosts()
 
         Usage().log("regenerate_video")
-        result = {"waiting_queue": waiting_queue}
+        result = {"waiting_queue": waiting_queue, "modified": len(modified)}
+        result.update(get_estimate(db, uuid))
         return jsonify(result), 200
 
     except ValueError as e:
@@ -230,7 +352,7 @@ class GetRegenerateFileQuery(BaseModel):
     def uuid_exists(cls, value: str):
         if not ProcessedFiles.is_valid_uuid(value):
             raise ValueError("uuid no vàlid")
-        if not ProcessedFiles.output_dir_exists(value):
+        if not Catalog().has(value, "_output"):
             raise ValueError("uuid no existeix")
         return value
 
@@ -289,11 +411,10 @@ def get_metadata():
     try:
         query_params = request.args.to_dict()
         utterances = Metadata(**query_params)
-        _, metadata = _load_utterances(utterances.uuid)
+        parsed = _load_utterances(utterances.uuid)
 
         Usage().log("get_metadata")
-        metadata = {"metadata": metadata}
-        return jsonify(metadata), 200
+        return _send_json(parsed, "metadata")
 
     except ValueError as e:
         logging.error(e)
@@ -16,9 +16,20 @@ var HttpClient = function() {
 }
 
 
-function sendFile()
+function showResult(jsonResponse)
+{
+    var uuid = jsonResponse['uuid'];
+    element = document.getElementById('download-dub');
+    element.innerText = uuid;
+    element.href = URL + `/get_file?uuid=` + uuid + `&ext=dub`;
+}
+
+// Resolves with the JSON answer, rejects with it if the status is not 200
+function request(method, url, body, headers)
 {
-    var xmlHttp = new XMLHttpRequest();
+    return new Promise(function(resolve, reject)
+    {
+        var xmlHttp = new XMLHttpRequest();
         xmlHttp.onreadystatechange = function()
         {
             if(xmlHttp.readyState != 4)
@@ -26,23 +37,208 @@ function sendFile()
                 return;
             }
 
-            if (xmlHttp.status == 200)
+            var json = {};
+            try
             {
-                var jsonResponse = JSON.parse(xmlHttp.responseText);
-                var uuid = jsonResponse['uuid'];
-                element = document.getElementById('download-dub');
-                element.innerText = uuid;
-                element.href = URL + `/get_file?uuid=` + uuid + `&ext=dub`;
+                json = JSON.parse(xmlHttp.responseText);
             }
+            catch (e) {}
+
+            json['status'] = xmlHttp.status;
+            if (xmlHttp.status == 200)
+                resolve(json);
             else
+                reject(json);
+        }
+
+        xmlHttp.open(method, url);
+        for (var name in headers || {})
+            xmlHttp.setRequestHeader(name, headers[name]);
+
+        xmlHttp.send(body);
+    });
+}
+
+var PARALLEL_PARTS = 4;
+var RETRIES = 3;
+var RESUMES = 5;
+
+function wait(attempt)
+{
+    return new Promise(function(resolve)
+    {
+        setTimeout(resolve, 1000 * Math.pow(2, attempt));
+    });
+}
+
+// Network errors (status 0) and errors of the server, the rejections (4xx,
+// e.g. a video too long) are final
+function isInterrupted(json)
+{
+    return json['status'] == 0 || json['status'] >= 500;
+}
+
+// The network errors and the errors of the server are retried, the rejections
+// are not
+function sendPart(url, file, index, partSize, attempt)
+{
+    var start = index * partSize;
+    var end = Math.min(start + partSize, file.size);
+    var headers = {'Content-Range': `bytes ${start}-${end - 1}/${file.size}`};
+    return request("put", url, file.slice(start, end), headers).catch(function(json)
+    {
+        if (!isInterrupted(json) || attempt >= RETRIES)
+            throw json;
+
+        return wait(attempt).then(function()
+        {
+            return sendPart(url, file, index, partSize, attempt + 1);
+        });
+    });
+}
+
+// The first and the last parts go first, the video metadata is in one of them
+// and the server rejects the video (e.g. too long) before the rest is sent
+function sendParts(url, file, partSize, parts, received)
+{
+    var pending = [];
+    for (var index = 0; index < parts; index++)
+    {
+        if (received.indexOf(index) == -1)
+            pending.push(index);
+    }
+
+    var first = pending.filter(function(index) { return index == 0 || index == parts - 1; });
+    var rest = pending.filter(function(index) { return first.indexOf(index) == -1; });
+
+    var worker = function()
+    {
+        if (rest.length == 0)
+            return Promise.resolve();
+
+        return sendPart(url, file, rest.shift(), partSize, 0).then(worker);
+    }
+
+    var sendFirst = first.reduce(function(previous, index)
+    {
+        return previous.then(function() { return sendPart(url, file, index, partSize, 0); });
+    }, Promise.resolve());
+
+    return sendFirst.then(function()
+    {
+        var workers = [];
+        for (var i = 0; i < PARALLEL_PARTS; i++)
+            workers.push(worker());
+
+        return Promise.all(workers);
+    });
+}
+
+// The session of a file is kept in the browser, if the upload is interrupted
+// (or the page reloaded) sending the same file again resumes it
+function getUploadKey(file)
+{
+    return `upload:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+function getSession(file, formData)
+{
+    var key = getUploadKey(file);
+    var create = function()
+    {
+        return request("post", URL + `/uploads/`, formData).then(function(session)
+        {
+            localStorage.setItem(key, session['upload_id']);
+            session['received'] = [];
+            return session;
+        });
+    }
+
+    var uploadId = localStorage.getItem(key);
+    if (!uploadId)
+        return create();
+
+    return request("get", URL + `/uploads/` + uploadId).then(function(session)
+    {
+        session['upload_id'] = uploadId;
+        return session;
+    }).catch(function(json)
+    {
+        // Finalized, rejected or expired
+        if (json['status'] != 404)
+            throw json;
+
+        localStorage.removeItem(key);
+        return create();
+    });
+}
+
+// The file is sent in parts that can be retried, see /uploads/ in the service
+function sendFile()
+{
+    var form = document.getElementById('form-id');
+    var file = form.elements['file'].files[0];
+    if (!file)
+    {
+        alert("No s'ha especificat el fitxer");
+        return;
+    }
+
+    var formData = new FormData(form);
+    formData.delete('file');
+    formData.append('filename', file.name);
+    formData.append('size', file.size);
+
+    var key = getUploadKey(file);
+    getSession(file, formData).then(function(session)
+    {
+        var url = URL + `/uploads/` + session['upload_id'];
+        var upload = function(received, resumes)
+        {
+            return sendParts(url, file, session['part_size'], session['parts'], received).then(function()
             {
-                json = JSON.parse(xmlHttp.responseText);
-                alert(json['error']);
-            }
+                return request("post", url + `/finalize`);
+            }).catch(function(json)
+            {
+                // Interrupted or some parts did not arrive (409), the
+                // service tells which parts it has
+                var resume = isInterrupted(json) || json['status'] == 409;
+                if (!resume || resumes >= RESUMES)
+                    throw json;
+
+                return wait(resumes).then(function()
+                {
+                    return request("get", url).then(function(state)
+                    {
+                        return state['received'];
+                    }, function(json)
+                    {
+                        if (!isInterrupted(json))
+                            throw json;
+
+                        return received;
+                    });
+                }).then(function(received)
+                {
+                    return upload(received, resumes + 1);
+                });
+            });
+        }
+
+        return upload(session['received'], 0);
+    }).then(function(result)
+    {
+        localStorage.removeItem(key);
+        showResult(result);
+    }).catch(function(json)
+    {
+        if (isInterrupted(json))
+        {
+            alert("S'ha interromput la pujada. Torneu a enviar el mateix fitxer per continuar-la.");
+            return;
         }
 
-        var formData = new FormData(document.getElementById('form-id'));
-        url = URL + `/dubbing_file/`;
-        xmlHttp.open("post", url);
-        xmlHttp.send(formData); 
+        localStorage.removeItem(key);
+        alert(json['error'] || "No s'ha pogut enviar el fitxer");
+    });
 }